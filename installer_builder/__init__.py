@@ -14,12 +14,26 @@ import fnmatch
 import getpass
 import glob
 import importlib
+import json
 import os
 import platform
 import shutil
-import subprocess
 import sys
 import time
+import warnings
+
+from . import (
+    distindex,
+    dmg,
+    filetable,
+    history,
+    macho,
+    runner,
+    sizereport,
+    toolchain,
+    tracing,
+    variants,
+)
 
 is_windows = platform.system() == "Windows"
 is_mac = platform.system() == "Darwin"
@@ -77,6 +91,33 @@ class InstallerBuilder(object):
         certificate_password=None,
         extra_files_to_sign=None,
         app_type="windows",
+        update_patch_base=None,
+        update_patch_threshold=None,
+        artifact_store=None,
+        create_manifest=False,
+        installer_variants=None,
+        languages=None,
+        tool_overrides=None,
+        fake_tools=None,
+        mac_arch=None,
+        dmg_format=dmg.DEFAULT_FORMAT,
+        dmg_compression_level=None,
+        postbuild_workers=None,
+        postbuild_pool_limits=None,
+        max_jobs=None,
+        trace_dir=None,
+        record_history=False,
+        history_file=None,
+        history_window=history.DEFAULT_WINDOW,
+        regression_threshold=history.DEFAULT_THRESHOLD,
+        size_budgets=None,
+        import_trace=None,
+        library_order=None,
+        library_store=False,
+        module_graph=False,
+        precompile=False,
+        package_policies=None,
+        babel_locales=None,
     ):
         super(InstallerBuilder, self).__init__()
         self.main_module = main_module
@@ -116,6 +157,8 @@ class InstallerBuilder(object):
             postbuild_commands = {}
         self.postbuild_commands = collections.defaultdict(list)
         self.postbuild_commands.update(postbuild_commands)
+        self.postbuild_workers = postbuild_workers
+        self.postbuild_pool_limits = postbuild_pool_limits
         if osx_frameworks is None:
             osx_frameworks = []
         self.osx_frameworks = osx_frameworks
@@ -126,6 +169,8 @@ class InstallerBuilder(object):
             localized_packages = []
         self.localized_packages = localized_packages
         self.has_translations = has_translations
+        self.compiled_catalogs = {}
+        self.babel_locales = babel_locales
         self.certificate_file = certificate_file
         self.certificate_password = certificate_password
         if extra_files_to_sign is None:
@@ -134,6 +179,46 @@ class InstallerBuilder(object):
         if app_type not in ("windows", "console"):
             raise ValueError("Invalid app type")
         self.app_type = app_type
+        self.update_patch_base = update_patch_base
+        self.update_patch_threshold = update_patch_threshold
+        self.artifact_store = artifact_store
+        self.create_manifest = create_manifest
+        self.manifest_summary = None
+        if installer_variants is None:
+            installer_variants = []
+        self.installer_variants = [
+            variants.InstallerVariant.from_value(v) for v in installer_variants
+        ]
+        self.languages = languages
+        self.toolchain = toolchain.Toolchain(tool_overrides, fake=fake_tools)
+        if mac_arch is None:
+            mac_arch = macho.host_arch()
+        self.mac_arch = mac_arch
+        if dmg_format not in dmg.DMG_FORMATS:
+            raise ValueError("Invalid disk image format")
+        self.dmg_format = dmg_format
+        self.dmg_compression_level = dmg_compression_level
+        self.max_jobs = max_jobs
+        self.trace_dir = trace_dir
+        self.record_history = record_history
+        self.history_file = history_file
+        self.history_window = history_window
+        self.regression_threshold = regression_threshold
+        self.size_budgets = size_budgets
+        self.build_record = None
+        self.import_trace = import_trace
+        self.library_order = library_order
+        self.library_store = library_store
+        self.module_graph = module_graph
+        self.precompile = precompile
+        self.precompiled = None
+        self.precompiled_path = None
+        if package_policies:
+            from . import pkgpolicy
+
+            package_policies = pkgpolicy.parse_policies(package_policies)
+        self.package_policies = package_policies
+        self.update_archive = None
 
     def get_version_specific_excludes(self):
         result = []
@@ -144,20 +229,38 @@ class InstallerBuilder(object):
 
     def build(self, skip_finalize=False):
         self.build_start_time = time.time()
+        runner.reset_metrics()
+        # The toolchain and job limit only apply while this builder builds
+        with toolchain.using(self.toolchain), runner.job_limit_scope(self.max_jobs):
+            tracer = tracing.start_trace()
+            try:
+                with tracing.span("build"):
+                    finalized = self._build(skip_finalize)
+            finally:
+                self.report_build_trace()
+            if finalized:
+                self.check_build_history(tracer)
+
+    def _build(self, skip_finalize):
         self.prebuild_message()
         self.remove_previous_build()
         self.build_installer()
 
         # Check if installer was actually created after running build_installer
-        if not skip_finalize and self._installer_was_created():
-            self.finalize_build()
+        if (
+            not skip_finalize
+            and self._installer_was_created()
+            and self.finalize_build()
+        ):
+            self.check_size_budgets()
             self.perform_postbuild_commands()
             self.report_build_statistics()
-        else:
-            print(
-                "Skipping finalization - no installer was created (py2exe/py2app only)"
-            )
-            self.report_build_time()
+            return True
+        print(
+            "Skipping finalization - no installer was created (py2exe/py2app only)"
+        )
+        self.report_build_time()
+        return False
 
     def _installer_was_created(self):
         """Check if an installer file was actually created by the build process"""
@@ -175,6 +278,7 @@ class InstallerBuilder(object):
             % (platform.system(), self.name, self.version)
         )
 
+    @tracing.traced
     def remove_previous_build(self):
         print("Removing previous output directories")
         directories = self.build_dirs + [self.output_directory]
@@ -183,10 +287,22 @@ class InstallerBuilder(object):
                 continue
             print("Deleting %s" % directory)
             shutil.rmtree(directory, ignore_errors=False)
+            distindex.discard_index(directory)
             print("Deleted ", directory)
 
+    def get_dist_index(self):
+        return distindex.get_index(self.dist_dir)
+
+    def update_dist_index(self, path):
+        """Tell the shared dist index that `path` was changed by a build step"""
+        relpath = os.path.relpath(os.path.abspath(path), os.path.abspath(self.dist_dir))
+        if not relpath.startswith(os.pardir):
+            self.get_dist_index().refresh(path)
+
+    @tracing.traced
     def find_datafiles(self):
         datafiles = []
+        self.build_catalogs()
         for package in self.datafile_packages:
             pkg_datafile_function = DATAFILE_REGISTRY.get(package)
             if pkg_datafile_function is None:
@@ -194,29 +310,89 @@ class InstallerBuilder(object):
                 pkg_datafile_function = pkg.find_datafiles
             pkg_datafiles = pkg_datafile_function()
             datafiles.extend(pkg_datafiles)
-            print("Added %d datafiles from package %s" % (len(pkg_datafiles), package))
+            print(
+                "Added %d datafiles from package %s"
+                % (count_datafiles(pkg_datafiles), package)
+            )
 
         if self.has_translations:
             app_lang_data = list(self.find_application_language_data())
             datafiles.extend(app_lang_data)
-            print("Added %d application language datafiles" % len(app_lang_data))
+            print(
+                "Added %d application language datafiles"
+                % count_datafiles(app_lang_data)
+            )
 
             babel_data = list(self.find_babel_datafiles())
             datafiles.extend(babel_data)
-            print("Added %d babel datafiles" % len(babel_data))
+            print("Added %d babel datafiles" % count_datafiles(babel_data))
 
         for package in self.localized_packages:
-            pkg = importlib.import_module(package)
-            path = pkg.__path__[0]
-            locale_path = os.path.join(path, self.locale_dir)
+            locale_path = self.get_package_locale_path(package)
             files = list(self.find_locale_data(locale_path))
             datafiles.extend(files)
-            print("Added %d locale datafiles for %s" % (len(files), package))
+            print(
+                "Added %d locale datafiles for %s" % (count_datafiles(files), package)
+            )
 
-        total_datafiles = len(self.datafiles) + len(datafiles)
+        total_datafiles = count_datafiles(self.datafiles) + count_datafiles(datafiles)
         print("Total datafiles to be included: %d" % total_datafiles)
         return self.datafiles + datafiles
 
+    def get_package_locale_path(self, package):
+        pkg = importlib.import_module(package)
+        return os.path.join(pkg.__path__[0], self.locale_dir)
+
+    def get_locale_paths(self):
+        """Return ``(name, locale directory)`` for every catalog source."""
+        paths = []
+        if self.has_translations:
+            paths.append(("application", self.locale_dir))
+        for package in self.localized_packages:
+            paths.append((package, self.get_package_locale_path(package)))
+        return paths
+
+    @tracing.traced
+    def build_catalogs(self):
+        """Compile every ``.po`` catalog to a ``.mo`` below ``build/catalogs``.
+
+        Catalogs are cached by their hash, and a ``.po`` wins over the
+        ``.mo`` next to it; stale ones are reported so they can be
+        regenerated or removed. A ``.po`` that does not parse is reported
+        and its existing ``.mo``, if any, is bundled instead.
+        """
+        from . import catalogs
+
+        sources = []
+        for name, locale_path in self.get_locale_paths():
+            for po in catalogs.find_catalogs(locale_path):
+                relpath = os.path.relpath(catalogs.mo_path(po), locale_path)
+                sources.append((po, os.path.join("build", "catalogs", name, relpath)))
+        if not sources:
+            return
+        result = catalogs.compile_catalogs([po for po, output in sources])
+        for po, error in sorted(result.errors.items()):
+            if os.path.exists(catalogs.mo_path(po)):
+                print(
+                    "Warning: could not compile %s, keeping %s"
+                    % (error, catalogs.mo_path(po))
+                )
+            else:
+                print("Warning: could not compile %s, leaving it out" % error)
+        sources = [(po, output) for po, output in sources if po in result.catalogs]
+        for po in catalogs.stale_catalogs([po for po, output in sources]):
+            print(
+                "Warning: %s is older than %s; using the compiled catalog"
+                % (catalogs.mo_path(po), po)
+            )
+        for po, output in sources:
+            directory = os.path.dirname(output)
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            shutil.copyfile(result.catalogs[po], output)
+            self.compiled_catalogs[po] = output
+        print("Compiled %d catalogs, %d from cache" % (result.compiled, result.reused))
+
     def find_application_language_data(self):
         for directory, filenames in self.find_locale_data(self.locale_dir):
             yield directory, filenames
@@ -224,19 +400,47 @@ class InstallerBuilder(object):
     def find_babel_datafiles(self):
         import babel
 
-        return (
-            (
-                "locale-data",
-                glob.glob(os.path.join(babel.__path__[0], "locale-data", "*.*")),
-            ),
-        )
+        files = glob.glob(os.path.join(babel.__path__[0], "locale-data", "*.*"))
+        locales = self.get_babel_locales()
+        if locales is not None:
+            from . import localedata
+
+            kept = localedata.prune(files, locales)
+            print(
+                "Bundling babel data for %s: %d of %d files, %s of %s"
+                % (
+                    ", ".join(sorted(locales)),
+                    len(kept),
+                    len(files),
+                    format_filesize(sum(os.path.getsize(f) for f in kept)),
+                    format_filesize(sum(os.path.getsize(f) for f in files)),
+                )
+            )
+            files = kept
+        return (("locale-data", files),)
+
+    def get_babel_locales(self):
+        """The locales to bundle babel data for, or None for all of them.
+
+        `babel_locales` if set, otherwise the languages of the application's
+        catalogs.
+        """
+        if self.babel_locales is not None:
+            return self.babel_locales
+        from . import localedata
+
+        return sorted(localedata.catalog_locales(self.locale_dir)) or None
 
     def find_locale_data(self, locale_path):
         for dirpath, dirnames, filenames in os.walk(locale_path):
             files = []
             for filename in filenames:
                 path = os.path.join(dirpath, filename)
-                if filename.lower().endswith(".mo"):
+                stem, ext = os.path.splitext(path)
+                ext = ext.lower()
+                if ext == ".po" and path in self.compiled_catalogs:
+                    files.append(self.compiled_catalogs[path])
+                elif ext == ".mo" and stem + ".po" not in self.compiled_catalogs:
                     files.append(path)
             if files:
                 directory = os.path.join(
@@ -244,12 +448,20 @@ class InstallerBuilder(object):
                 )
                 yield directory, files
 
+    @tracing.traced
     def finalize_build(self):
+        """Post-process the dist and move the installer to the output directory.
+
+        Returns False if there was no installer to move.
+        """
         print("Finalizing build...")
+        if self.import_trace is not None:
+            self.validate_import_trace()
         if platform.system() == "Darwin":
             self.remove_embedded_interpreter()
             self.shrink_mac_binaries()
-            self.lipo_file(os.path.join(self.get_app_path(), self.name))
+            self.process_frozen_dist(self.dist_dir)
+            self.reorder_library()
             self.create_dmg()
 
         # Only move output if installer was created
@@ -257,17 +469,82 @@ class InstallerBuilder(object):
             self.move_output()
         except RuntimeError as e:
             print("Warning: Could not move installer output: %s" % e)
-            return
+            return False
+
+        if self.create_manifest:
+            self.write_dist_manifest()
 
         if self.create_update:
             self.create_update_archive()
+        return True
+
+    @tracing.traced
+    def validate_import_trace(self):
+        """Fail the build if a module the traced run imported was excluded."""
+        from . import importtrace
+
+        trace = importtrace.ImportTrace.load(self.import_trace)
+        files = self.get_dist_index().iter_tree(
+            prefix=os.path.relpath(self.get_update_root_dir(), self.dist_dir)
+        )
+        missing = importtrace.missing_modules(importtrace.bundled_modules(files), trace)
+        if missing:
+            raise RuntimeError(
+                "Modules imported in %s are missing from the build: %s"
+                % (self.import_trace, ", ".join(missing))
+            )
+        print("All %d traced imports are in the build" % len(trace.imported))
+
+    @tracing.traced
+    def apply_package_policies(self, dist_dir):
+        """Apply the per-package optimization and stripping policies.
+
+        With `precompile`, every package gets its modules from the
+        precompiled bytecode unless a policy of its own says otherwise.
+        """
+        from . import pkgpolicy
+
+        policies = dict(self.package_policies or {})
+        path = None
+        if self.precompiled is not None:
+            # Look sources up where the module graph found them
+            path = self.precompiled_path
+            policies.setdefault(
+                pkgpolicy.DEFAULT,
+                pkgpolicy.PackagePolicy(optimize=self.optimization_level),
+            )
+        if not policies:
+            return
+        pkgpolicy.apply_to_dist(dist_dir, policies, path=path)
+
+    def process_frozen_dist(self, dist_dir):
+        """Run the steps for a freshly frozen dist, the same on every platform.
+
+        The Windows innosetup command calls this between py2exe and signing,
+        through its `frozen_dist_hook` option; on macOS `finalize_build`
+        calls it after py2app.
+        """
+        self.apply_package_policies(dist_dir)
+
+    @tracing.traced
+    def reorder_library(self):
+        """Lay out py2app's module archive in startup import order."""
+        if self.library_order is None:
+            return
+        from . import libzip
+
+        libzip.optimize_dist(
+            self.dist_dir, self.library_order, store=self.library_store
+        )
 
+    @tracing.traced
     def remove_embedded_interpreter(self):
         print("Replacing the embedded interpreter with a dumby file")
         interpreter_path = os.path.join(self.get_app_path(), "python")
         os.remove(interpreter_path)
-        self.execute_command("touch %s" % interpreter_path)
-        self.execute_command("chmod +x %s" % interpreter_path)
+        open(interpreter_path, "wb").close()
+        os.chmod(interpreter_path, 0o755)
+        self.update_dist_index(interpreter_path)
 
     def get_app_path(self):
         if platform.system() == "Darwin":
@@ -276,33 +553,150 @@ class InstallerBuilder(object):
             )
         return self.dist_dir
 
+    @tracing.traced
     def create_dmg(self):
-        print("Creating .dmg disk image")
-        self.execute_command(
-            "hdiutil create -srcfolder dist/%s.app -size 150m dist/%s"
-            % (self.name, self.installer_filename())
+        app = os.path.join(self.dist_dir, "%s.app" % self.name)
+        index = self.get_dist_index()
+        size = dmg.image_size(
+            entry.size
+            for entry in index.iter_files(prefix=os.path.relpath(app, self.dist_dir))
+        )
+        print(
+            "Creating %s .dmg disk image of %s"
+            % (self.dmg_format, format_filesize(size))
         )
+        runner.run(
+            self.toolchain.command("hdiutil")
+            + dmg.create_command(
+                app,
+                os.path.join(self.dist_dir, self.installer_filename()),
+                size,
+                image_format=self.dmg_format,
+                volname=self.name,
+                compression_level=self.dmg_compression_level,
+            )
+        )
+        self.update_dist_index(os.path.join(self.dist_dir, self.installer_filename()))
 
+    @tracing.traced
     def move_output(self):
         if not os.path.exists(self.output_directory):
             os.mkdir(self.output_directory)
         destination = os.path.join(self.output_directory, self.installer_filename())
-        os.rename(self.find_created_installer(), destination)
+        installer = self.find_created_installer()
+        os.rename(installer, destination)
+        self.update_dist_index(installer)
         print("Moved generated installer to %s" % destination)
+        self.store_artifact(destination)
+        for filename in self.variant_installer_filenames():
+            installer = os.path.join(self.dist_dir, filename)
+            if not os.path.exists(installer):
+                print("Warning: installer variant %s was not created" % filename)
+                continue
+            destination = os.path.join(self.output_directory, filename)
+            os.rename(installer, destination)
+            self.update_dist_index(installer)
+            print("Moved installer variant to %s" % destination)
+            self.store_artifact(destination)
+
+    def variant_installer_filenames(self):
+        if platform.system() != "Windows":
+            return []
+        return [
+            variant.installer_filename(self.name, self.version)
+            for variant in self.installer_variants
+        ]
 
+    @tracing.traced
     def create_update_archive(self):
         print("Generating update archive")
         name = "%s-%s-%s" % (self.name, self.version, platform.system())
-        root_dir = self.dist_dir
+        root_dir = self.get_update_root_dir()
+        if self.update_archive_format == "zip":
+            # Reuse the dist index rather than walking the tree again
+            destination = os.path.join(self.output_directory, name + ".zip")
+            self.get_dist_index().write_zip(
+                destination, prefix=os.path.relpath(root_dir, self.dist_dir)
+            )
+        else:
+            filename = shutil.make_archive(
+                name, self.update_archive_format, root_dir=root_dir
+            )
+            filename = os.path.split(filename)[-1]
+            destination = os.path.join(self.output_directory, filename)
+            os.rename(filename, destination)
+        print("Generated update archive filename: %s" % destination)
+        self.update_archive = destination
+        self.store_artifact(destination)
+        if self.update_patch_base is not None:
+            self.create_patch_archive(root_dir, name)
+
+    def get_update_root_dir(self):
         if platform.system() == "Darwin":
-            root_dir = os.path.join(root_dir, "%s.app" % self.name)
-        filename = shutil.make_archive(
-            name, self.update_archive_format, root_dir=root_dir
+            return os.path.join(self.dist_dir, "%s.app" % self.name)
+        return self.dist_dir
+
+    @tracing.traced
+    def write_dist_manifest(self):
+        from . import manifest
+
+        print("Writing dist manifest")
+        if not os.path.exists(self.output_directory):
+            os.mkdir(self.output_directory)
+        destination = os.path.join(
+            self.output_directory,
+            "%s-%s-%s-manifest.jsonl" % (self.name, self.version, platform.system()),
+        )
+        root_dir = self.get_update_root_dir()
+        files = self.get_dist_index().iter_tree(
+            prefix=os.path.relpath(root_dir, self.dist_dir)
+        )
+        self.manifest_summary = manifest.write_manifest(
+            root_dir, destination, files=files
+        )
+        self.manifest_summary["filename"] = destination
+        print("Generated dist manifest filename: %s" % destination)
+
+    @tracing.traced
+    def create_patch_archive(self, root_dir, name):
+        from . import bindiff
+
+        print("Generating patch archive against %s" % self.update_patch_base)
+        threshold = self.update_patch_threshold
+        if threshold is None:
+            threshold = bindiff.DEFAULT_PATCH_THRESHOLD
+        destination = os.path.join(self.output_directory, "%s-patch.zip" % name)
+        manifest = bindiff.create_patch_archive(
+            self.update_patch_base, root_dir, destination, threshold=threshold
+        )
+        actions = collections.Counter(manifest["files"].values())
+        print(
+            "Patch archive: %d added, %d patched, %d deleted"
+            % (actions["add"], actions["patch"], actions["delete"])
+        )
+        print(
+            "Generated patch archive filename: %s (%s)"
+            % (destination, format_filesize(os.stat(destination).st_size))
+        )
+        self.store_artifact(destination)
+
+    @tracing.traced
+    def store_artifact(self, filename):
+        if self.artifact_store is None:
+            return
+        from . import chunkstore
+
+        store = chunkstore.ChunkStore(self.artifact_store)
+        record = store.add(filename)
+        print(
+            "Stored %s in artifact store %s: %d chunks, %s new"
+            % (
+                record["name"],
+                self.artifact_store,
+                len(record["chunks"]),
+                format_filesize(record["new_bytes"]),
+            )
         )
-        filename = os.path.split(filename)[-1]
-        destination = os.path.join(self.output_directory, filename)
-        os.rename(filename, destination)
-        print("Generated update archive filename: %s" % destination)
 
     def find_created_installer(self):
         res = os.path.join("dist", self.installer_filename())
@@ -331,15 +725,39 @@ class InstallerBuilder(object):
 
             return py2app.build_app.py2app
 
+    @tracing.traced
     def perform_postbuild_commands(self):
-        if not self.postbuild_commands[platform.system().lower()]:
+        from . import postbuild
+
+        commands = self.postbuild_commands[platform.system().lower()]
+        if not commands:
             return
         print("Performing postbuild commands for platform %s" % platform.system())
-        for command in self.postbuild_commands[platform.system().lower()]:
-            self.execute_command(command)
+        steps = postbuild.make_steps(commands)
+        try:
+            results = postbuild.run_graph(
+                steps,
+                max_workers=self.postbuild_workers,
+                pool_limits=self.postbuild_pool_limits,
+            )
+        except postbuild.PostbuildError as e:
+            print(postbuild.format_results(e.results))
+            raise
+        print(postbuild.format_results(results))
 
     def execute_command(self, command):
-        subprocess.check_call([command], shell=True)
+        """Run a shell command through the runner.
+
+        Deprecated: postbuild commands run through `installer_builder.postbuild`,
+        and other callers should use `installer_builder.runner.run`.
+        """
+        warnings.warn(
+            "InstallerBuilder.execute_command is deprecated, "
+            "use installer_builder.runner.run",
+            DeprecationWarning,
+            stacklevel=2,
+        )
+        runner.run(command, shell=True)
 
     def report_build_statistics(self):
         try:
@@ -351,18 +769,39 @@ class InstallerBuilder(object):
             )
         except RuntimeError:
             print("Build completed - no installer created (py2exe/py2app only)")
+        if self.manifest_summary is not None:
+            print(
+                "Distributed files: %d (%s)"
+                % (
+                    self.manifest_summary["files"],
+                    format_filesize(self.manifest_summary["size"]),
+                )
+            )
         self.report_build_time()
 
+    @tracing.traced
     def shrink_mac_binaries(self):
-        shrink_extensions = (".dylib", ".so")
-        for basepath, dirs, files in os.walk(self.dist_dir):
-            for file in files:
-                if os.path.splitext(file)[-1] in shrink_extensions:
-                    path = os.path.join(basepath, file)
-                    self.lipo_file(path)
+        index = self.get_dist_index()
+        filenames = [
+            index.path(entry)
+            for entry in index.iter_files(kinds=(distindex.KIND_SHARED_LIB,))
+        ]
+        filenames.append(os.path.join(self.get_app_path(), self.name))
+        thinned = macho.thin_files(
+            filenames, self.mac_arch, lambda: self.toolchain.command("lipo")
+        )
+        for filename in thinned:
+            self.update_dist_index(filename)
+        print(
+            "Thinned %d of %d binaries to %s"
+            % (len(thinned), len(filenames), self.mac_arch)
+        )
 
     def lipo_file(self, filename):
-        self.execute_command("lipo -thin i386 %s -output %s" % (filename, filename))
+        if not macho.needs_thinning(filename, self.mac_arch):
+            return
+        macho.thin_file(filename, self.mac_arch, self.toolchain.command("lipo"))
+        self.update_dist_index(filename)
         print("Lipoed file %s" % filename)
 
     def report_build_time(self):
@@ -370,6 +809,136 @@ class InstallerBuilder(object):
         td = datetime.timedelta(seconds=build_time)
         print("Build completed in ", format(td))
 
+    @tracing.traced
+    def check_size_budgets(self):
+        """Report package sizes and fail the build if it is over a size budget.
+
+        This runs before the postbuild commands, so a build over budget is
+        neither published nor recorded.
+        """
+        files = list(
+            self.get_dist_index().iter_tree(
+                prefix=os.path.relpath(self.get_update_root_dir(), self.dist_dir)
+            )
+        )
+        sizes = sizereport.SizeReport(files)
+        record = history.BuildRecord(
+            self.name,
+            self.version,
+            platform.system(),
+            started=self.build_start_time,
+            installer_size=os.path.getsize(self.find_created_installer()),
+            update_size=(
+                os.path.getsize(self.update_archive) if self.update_archive else None
+            ),
+            files=len(files),
+            dist_size=sum(size for _, _, size in files),
+            packages=sizes.sizes(),
+        )
+        previous = None
+        if self.record_history:
+            with history.BuildHistory(self.history_file) as builds:
+                latest = builds.recent(self.name, platform.system(), 1)
+                if latest:
+                    previous = latest[0].packages
+        print(sizes.format(previous, excludes=self.excludes))
+        self.write_size_report(sizes)
+        self.build_record = record
+        history.check_budgets(record, self.size_budgets)
+        return record
+
+    def check_build_history(self, tracer):
+        """Record the build with its timings and compare it with earlier builds."""
+        record = self.build_record
+        summary = tracer.summary()
+        record.seconds = summary["seconds"]
+        for name, phase in summary["phases"].items():
+            record.phases[name] = phase["seconds"]
+        for name, tool in summary["subprocesses"].items():
+            record.phases["[%s]" % name] = tool["seconds"]
+        baseline = None
+        if self.record_history:
+            with history.BuildHistory(self.history_file) as builds:
+                baseline = builds.baseline(
+                    self.name, platform.system(), self.history_window
+                )
+                builds.record(record)
+        for regression in history.compare(record, baseline, self.regression_threshold):
+            print("Warning: %s" % regression)
+        return record
+
+    def write_size_report(self, sizes):
+        destination = os.path.join(
+            self.output_directory,
+            "%s-%s-%s-sizes.json" % (self.name, self.version, platform.system()),
+        )
+        with open(destination, "w") as fp:
+            json.dump(sizes.to_json(), fp, indent=1, sort_keys=True)
+        print("Generated size report filename: %s" % destination)
+
+    def report_build_trace(self):
+        tracer = tracing.stop_trace()
+        if tracer is None:
+            return
+        print(tracing.format_summary(tracer.summary()))
+        if self.trace_dir is not None:
+            print("Wrote build trace to %s" % tracer.write(self.trace_dir))
+
+    @tracing.traced
+    def freeze_modules(self):
+        """Return the includes and excludes to hand to the freezer.
+
+        With `module_graph`, every module the cached graph reaches is
+        included and every top-level name it cannot find is excluded. The
+        graph is saved to ``build/module-graph.json`` for ``modgraph why``.
+        With `precompile`, the graph's modules are compiled ahead of the
+        freezer.
+        """
+        if not (self.module_graph or self.precompile):
+            return self.includes, self.excludes
+        from . import modgraph
+
+        graph = modgraph.build_graph(
+            script=self.main_module,
+            includes=self.includes,
+            packages=self.extra_packages,
+            excludes=self.excludes,
+        )
+        if not os.path.isdir("build"):
+            os.makedirs("build")
+        graph.save(os.path.join("build", "module-graph.json"))
+        if self.precompile:
+            self.precompile_modules(graph)
+        if not self.module_graph:
+            return self.includes, self.excludes
+        includes = sorted(set(self.includes) | set(graph.modules()))
+        excludes = self.excludes + [
+            name for name in graph.top_level_missing() if name not in self.excludes
+        ]
+        return includes, excludes
+
+    @tracing.traced
+    def precompile_modules(self, graph):
+        """Compile the modules in `graph` at `optimization_level` in worker
+        interpreters, reusing pycs cached by earlier builds.
+
+        `process_frozen_dist` later swaps them in for the freezer's own.
+        """
+        from . import pyccache
+
+        sources = [node.path for node in graph.nodes.values() if node.path]
+        result = pyccache.compile_sources(sources, self.optimization_level)
+        print(
+            "Precompiled %d modules, %d from cache"
+            % (result.compiled, result.reused)
+        )
+        for path, error in sorted(result.errors.items()):
+            print("Warning: could not compile %s: %s" % (path, error))
+        self.precompiled = result
+        self.precompiled_path = graph.path
+        return result
+
+    @tracing.traced
     def build_installer(self):
         if None in (self.name, self.main_module):
             raise RuntimeError("Insufficient information provided to build")
@@ -381,6 +950,7 @@ class InstallerBuilder(object):
             self.certificate_password = os.environ.get(
                 "CERTIFICATE_PASS"
             ) or getpass.getpass("Certificate password:")
+        includes, excludes = self.freeze_modules()
         setup_arguments = {
             "name": self.name,
             "author": self.author,
@@ -393,8 +963,8 @@ class InstallerBuilder(object):
                 "py2exe": {
                     "compressed": self.compressed,
                     "bundle_files": self.bundle_level,
-                    "includes": self.includes,
-                    "excludes": self.excludes,
+                    "includes": includes,
+                    "excludes": excludes,
                     "packages": self.extra_packages,
                     "dll_excludes": self.dll_excludes,
                     "optimize": self.optimization_level,
@@ -406,11 +976,16 @@ class InstallerBuilder(object):
                     "certificate_file": self.certificate_file,
                     "certificate_password": self.certificate_password,
                     "extra_sign": self.extra_files_to_sign,
+                    "variants": self.installer_variants,
+                    "languages": self.languages,
+                    "library_order": self.library_order,
+                    "library_store": self.library_store,
+                    "frozen_dist_hook": self.process_frozen_dist,
                 },
                 "py2app": {
                     "compressed": self.compressed,
-                    "includes": self.includes + self.extra_packages,
-                    "excludes": self.excludes,
+                    "includes": includes + self.extra_packages,
+                    "excludes": excludes,
                     "frameworks": self.osx_frameworks,
                     "optimize": self.optimization_level,
                     "argv_emulation": True,
@@ -444,7 +1019,8 @@ class InstallerBuilder(object):
             setup_arguments[self.app_type][0]["other_resources"] = (
                 innosetup.manifest(self.name),
             )
-        setuptools.setup(**setup_arguments)
+        with tracing.span("setuptools.setup", command=self.build_command):
+            setuptools.setup(**setup_arguments)
 
     def get_copyright(self):
         return "Copyright ©%d %s" % (datetime.date.today().year, self.author)
@@ -597,26 +1173,33 @@ def get_datafiles(directory="share", match="*", target_path=None):
     )
     ppath = os.path.split(os.path.abspath(sys.executable))[0]
     site_packages = os.path.join(ppath, "lib", "site-packages", "")
+    # One entry per directory, with the file names kept in a compact table
+    # rather than one tuple and list per file.
+    table = filetable.FileTable()
     datafiles = []
-    matches = []
 
     for root, dirnames, filenames in os.walk(directory):
         target_path = root.replace(site_packages, "")
         matched_files = fnmatch.filter(filenames, match)
-        if matched_files:
-            print("  Found %d matching files in %s" % (len(matched_files), root))
-
-        for filename in matched_files:
-            matches.append(os.path.join(root, filename))
-            this_filename = os.path.join(root, filename)
-            datafiles.append((target_path, [this_filename]))
+        if not matched_files:
+            continue
+        print("  Found %d matching files in %s" % (len(matched_files), root))
+        dir_id = table.dir_id(root)
+        positions = [table.add(dir_id, filename) for filename in matched_files]
+        datafiles.append((target_path, table.file_list(positions)))
 
     print(
-        "Total files found matching '%s' in %s: %d" % (match, directory, len(datafiles))
+        "Total files found matching '%s' in %s: %d"
+        % (match, directory, count_datafiles(datafiles))
     )
     return datafiles
 
 
+def count_datafiles(datafiles):
+    """Count the files in a setuptools ``data_files`` style list"""
+    return sum(len(files) for target, files in datafiles)
+
+
 def pytz_datafiles():
     import pytz
 
@@ -625,7 +1208,7 @@ def pytz_datafiles():
     files = get_datafiles(path, "*")
     index = path.index("zoneinfo")
     files = [(i[0][index:], i[1]) for i in files]
-    print("Found %d pytz zoneinfo files" % len(files))
+    print("Found %d pytz zoneinfo files" % count_datafiles(files))
     return files
 
 
@@ -636,13 +1219,13 @@ def enchant_datafiles():
     print("Collecting enchant datafiles from: %s" % enchant_path)
 
     dll_files = get_datafiles(enchant_path, "*.dll")
-    print("Found %d enchant DLL files" % len(dll_files))
+    print("Found %d enchant DLL files" % count_datafiles(dll_files))
 
     dic_files = get_datafiles(enchant_path, "*.dic", target_path="")
-    print("Found %d enchant dictionary files" % len(dic_files))
+    print("Found %d enchant dictionary files" % count_datafiles(dic_files))
 
     aff_files = get_datafiles(enchant_path, "*.aff", target_path="")
-    print("Found %d enchant affix files" % len(aff_files))
+    print("Found %d enchant affix files" % count_datafiles(aff_files))
 
     files = []
     files.extend(dll_files)
@@ -651,7 +1234,7 @@ def enchant_datafiles():
 
     index = enchant_path.index("enchant") + 8
     files = [(i[0][index:], i[1]) for i in files]
-    print("Total enchant datafiles: %d" % len(files))
+    print("Total enchant datafiles: %d" % count_datafiles(files))
     return files
 
 
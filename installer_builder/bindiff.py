@@ -0,0 +1,346 @@
+"""Binary patches for large files that changed between two releases.
+
+A patch is a small header followed by an lzma-compressed stream of
+instructions that rebuild the new file from the old one:
+
+* ``C`` - copy ``length`` bytes starting at ``offset`` of the old file
+* ``A`` - append ``length`` literal bytes that follow the instruction
+
+Both inputs are memory mapped and the old file is indexed in fixed size
+blocks, so memory use is bounded by the size of the block index rather
+than by the size of the files being compared.
+"""
+
+import concurrent.futures
+import hashlib
+import json
+import lzma
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+import zipfile
+import zlib
+
+PATCH_MAGIC = b"IBPATCH1"
+PATCH_SUFFIX = ".ibpatch"
+PATCH_MANIFEST = "patch-manifest.json"
+DEFAULT_PATCH_THRESHOLD = 1024 * 1024
+
+MIN_BLOCK_SIZE = 512
+MAX_INDEX_ENTRIES = 1 << 18
+COPY_CHUNK = 64 * 1024
+WRITE_CHUNK = 1024 * 1024
+
+_header = struct.Struct("<QQ32s")
+_copy = struct.Struct("<QQ")
+_add = struct.Struct("<Q")
+
+
+class PatchError(Exception):
+    """Raised when a patch cannot be applied to the given file."""
+
+
+class _Mapped(object):
+    """Read-only mmap of a file which also copes with empty files."""
+
+    def __init__(self, filename):
+        self._fp = open(filename, "rb")
+        size = os.fstat(self._fp.fileno()).st_size
+        if size:
+            self.data = mmap.mmap(self._fp.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self.data = b""
+
+    def __enter__(self):
+        return self.data
+
+    def __exit__(self, *exc_info):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        self._fp.close()
+
+
+def _block_size(old_size):
+    block_size = MIN_BLOCK_SIZE
+    while old_size // block_size > MAX_INDEX_ENTRIES:
+        block_size *= 2
+    return block_size
+
+
+def _mismatch(a, b):
+    """Return the length of the common prefix of two equally sized buffers."""
+    lo, hi = 0, len(a)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[lo:mid] == b[lo:mid]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+class _PatchWriter(object):
+    def __init__(self, fp, new):
+        self._fp = fp
+        self._new = new
+        self.literal_bytes = 0
+
+    def copy(self, offset, length):
+        if length:
+            self._fp.write(b"C" + _copy.pack(offset, length))
+
+    def add(self, start, end):
+        if end <= start:
+            return
+        self._fp.write(b"A" + _add.pack(end - start))
+        for pos in range(start, end, WRITE_CHUNK):
+            self._fp.write(self._new[pos:min(end, pos + WRITE_CHUNK)])
+        self.literal_bytes += end - start
+
+
+def _file_sha256(data):
+    digest = hashlib.sha256()
+    for pos in range(0, len(data), WRITE_CHUNK):
+        digest.update(data[pos:pos + WRITE_CHUNK])
+    return digest.digest()
+
+
+def create_patch(old_filename, new_filename, patch_filename, max_literal_ratio=0.5):
+    """Write a patch turning `old_filename` into `new_filename`.
+
+    Returns the size of the patch, or None when the files differ so much
+    that a patch would not be worth it (more than `max_literal_ratio` of the
+    new file would have to be stored verbatim, or the patch is not smaller
+    than the new file). No patch file is left behind in that case.
+    """
+    with _Mapped(old_filename) as old, _Mapped(new_filename) as new:
+        old_size, new_size = len(old), len(new)
+        block_size = _block_size(old_size)
+        index = {}
+        for offset in range(0, old_size - block_size + 1, block_size):
+            index.setdefault(hash(old[offset:offset + block_size]), offset)
+        max_literal = int(new_size * max_literal_ratio)
+
+        with open(patch_filename, "wb") as raw:
+            raw.write(PATCH_MAGIC)
+            raw.write(_header.pack(old_size, new_size, _file_sha256(new)))
+            with lzma.open(raw, "wb") as fp:
+                writer = _PatchWriter(fp, new)
+                pos = literal_start = 0
+                while pos + block_size <= new_size:
+                    block = new[pos:pos + block_size]
+                    offset = index.get(hash(block))
+                    if offset is None or old[offset:offset + block_size] != block:
+                        pos += 1
+                        if writer.literal_bytes + pos - literal_start > max_literal:
+                            break
+                        continue
+                    # Grow the match backwards into the pending literal run.
+                    back = 0
+                    while (
+                        back < pos - literal_start
+                        and back < offset
+                        and old[offset - back - 1] == new[pos - back - 1]
+                    ):
+                        back += 1
+                    writer.add(literal_start, pos - back)
+                    # ...and forwards as far as the two files agree.
+                    old_end, new_end = offset + block_size, pos + block_size
+                    while old_end < old_size and new_end < new_size:
+                        step = min(COPY_CHUNK, old_size - old_end, new_size - new_end)
+                        a = old[old_end:old_end + step]
+                        b = new[new_end:new_end + step]
+                        if a == b:
+                            old_end += step
+                            new_end += step
+                            continue
+                        common = _mismatch(a, b)
+                        old_end += common
+                        new_end += common
+                        break
+                    writer.copy(offset - back, old_end - offset + back)
+                    pos = literal_start = new_end
+                else:
+                    writer.add(literal_start, new_size)
+                    literal_start = new_size
+        if (
+            literal_start < new_size
+            or writer.literal_bytes > max_literal
+            or os.path.getsize(patch_filename) >= new_size
+        ):
+            os.remove(patch_filename)
+            return None
+    return os.path.getsize(patch_filename)
+
+
+def apply_patch(old_filename, patch_filename, new_filename):
+    """Rebuild `new_filename` from `old_filename` and a patch."""
+    with open(patch_filename, "rb") as raw, _Mapped(old_filename) as old:
+        if raw.read(len(PATCH_MAGIC)) != PATCH_MAGIC:
+            raise PatchError("%s is not a patch file" % patch_filename)
+        old_size, new_size, sha256 = _header.unpack(raw.read(_header.size))
+        if old_size != len(old):
+            raise PatchError(
+                "%s does not match the size of the patched file" % old_filename
+            )
+        digest = hashlib.sha256()
+        with lzma.open(raw, "rb") as fp, open(new_filename, "wb") as out:
+            while True:
+                op = fp.read(1)
+                if not op:
+                    break
+                if op == b"C":
+                    offset, length = _copy.unpack(fp.read(_copy.size))
+                    for pos in range(offset, offset + length, WRITE_CHUNK):
+                        chunk = old[pos:min(offset + length, pos + WRITE_CHUNK)]
+                        digest.update(chunk)
+                        out.write(chunk)
+                elif op == b"A":
+                    (length,) = _add.unpack(fp.read(_add.size))
+                    while length:
+                        chunk = fp.read(min(length, WRITE_CHUNK))
+                        if not chunk:
+                            raise PatchError("Truncated patch %s" % patch_filename)
+                        digest.update(chunk)
+                        out.write(chunk)
+                        length -= len(chunk)
+                else:
+                    raise PatchError("Corrupt patch %s" % patch_filename)
+    if os.path.getsize(new_filename) != new_size or digest.digest() != sha256:
+        raise PatchError("Patched file %s failed verification" % new_filename)
+
+
+def _create_patch_job(job):
+    return job[2], create_patch(*job)
+
+
+def create_patches(jobs, max_workers=None):
+    """Create many patches in parallel.
+
+    `jobs` is an iterable of ``(old_filename, new_filename, patch_filename)``
+    tuples. Returns a dict mapping each patch filename to its size, or to
+    None if the full file should be shipped instead.
+
+    Threads rather than processes: build scripts call ``build()`` at module
+    level, and a spawned worker would import the script and run the whole
+    build again. Hashing and lzma release the GIL, so threads still overlap.
+    """
+    jobs = list(jobs)
+    if not jobs:
+        return {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as pool:
+        return dict(pool.map(_create_patch_job, jobs))
+
+
+def _crc32(filename):
+    crc = 0
+    with open(filename, "rb") as fp:
+        for chunk in iter(lambda: fp.read(WRITE_CHUNK), b""):
+            crc = zlib.crc32(chunk, crc)
+    return crc & 0xFFFFFFFF
+
+
+def _iter_tree(root_dir):
+    for dirpath, dirnames, filenames in os.walk(root_dir):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            yield os.path.relpath(path, root_dir).replace(os.sep, "/"), path
+
+
+def create_patch_archive(
+    base, root_dir, archive_filename, threshold=DEFAULT_PATCH_THRESHOLD, max_workers=None
+):
+    """Write a zip holding only what changed between `base` and `root_dir`.
+
+    `base` is the previous release, either as a directory tree or as its
+    update archive. Unchanged files are left out, new and small changed
+    files are stored whole and changed files of at least `threshold` bytes
+    are stored as binary patches when that is smaller. The archive carries a
+    ``patch-manifest.json`` describing every entry, including deletions.
+    """
+    work_dir = tempfile.mkdtemp(prefix="installer_builder_patch_")
+    try:
+        base_zip = None
+        if os.path.isdir(base):
+            base_files = dict(
+                (name, (os.path.getsize(path), path)) for name, path in _iter_tree(base)
+            )
+        else:
+            base_zip = zipfile.ZipFile(base)
+            base_files = dict(
+                (info.filename, (info.file_size, info.CRC))
+                for info in base_zip.infolist()
+                if not info.is_dir()
+            )
+
+        manifest = {"files": {}}
+        whole, jobs = [], []
+        for name, path in _iter_tree(root_dir):
+            size = os.path.getsize(path)
+            previous = base_files.pop(name, None)
+            if previous is not None and previous[0] == size:
+                if base_zip is not None:
+                    unchanged = previous[1] == _crc32(path)
+                else:
+                    unchanged = _crc32(previous[1]) == _crc32(path)
+                if unchanged:
+                    continue
+            if previous is None or size < threshold:
+                whole.append((name, path))
+                continue
+            old_path = previous[1]
+            if base_zip is not None:
+                old_path = base_zip.extract(name, os.path.join(work_dir, "base"))
+            patch_path = os.path.join(work_dir, "patch-%d" % len(jobs))
+            jobs.append((old_path, path, patch_path, name))
+
+        patches = create_patches([job[:3] for job in jobs], max_workers=max_workers)
+        with zipfile.ZipFile(
+            archive_filename, "w", zipfile.ZIP_DEFLATED, allowZip64=True
+        ) as archive:
+            for old_path, path, patch_path, name in jobs:
+                if patches.get(patch_path) is None:
+                    whole.append((name, path))
+                    continue
+                archive.write(patch_path, name + PATCH_SUFFIX, zipfile.ZIP_STORED)
+                manifest["files"][name] = "patch"
+            for name, path in whole:
+                archive.write(path, name)
+                manifest["files"][name] = "add"
+            for name in base_files:
+                manifest["files"][name] = "delete"
+            archive.writestr(PATCH_MANIFEST, json.dumps(manifest, indent=1, sort_keys=True))
+        if base_zip is not None:
+            base_zip.close()
+        return manifest
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def apply_patch_archive(archive_filename, target_dir):
+    """Bring the release in `target_dir` up to date from a patch archive."""
+    with zipfile.ZipFile(archive_filename) as archive:
+        manifest = json.loads(archive.read(PATCH_MANIFEST).decode("utf-8"))
+        for name, action in sorted(manifest["files"].items()):
+            target = os.path.join(target_dir, *name.split("/"))
+            if action == "delete":
+                if os.path.exists(target):
+                    os.remove(target)
+                continue
+            directory = os.path.dirname(target)
+            if directory and not os.path.isdir(directory):
+                os.makedirs(directory)
+            if action == "add":
+                with archive.open(name) as src, open(target, "wb") as dst:
+                    shutil.copyfileobj(src, dst, WRITE_CHUNK)
+                continue
+            fd, patch_path = tempfile.mkstemp(suffix=PATCH_SUFFIX)
+            with os.fdopen(fd, "wb") as dst, archive.open(name + PATCH_SUFFIX) as src:
+                shutil.copyfileobj(src, dst, WRITE_CHUNK)
+            try:
+                apply_patch(target, patch_path, target + ".new")
+                os.replace(target + ".new", target)
+            finally:
+                os.remove(patch_path)
@@ -0,0 +1,54 @@
+"""Location of the per-user cache shared between builds.
+
+``INSTALLER_BUILDER_CACHE`` overrides the default, which is
+``%LOCALAPPDATA%\\installer_builder\\cache`` on Windows,
+``~/Library/Caches/installer_builder`` on macOS and
+``$XDG_CACHE_HOME/installer_builder`` (``~/.cache``) elsewhere.
+"""
+
+import json
+import os
+import platform
+
+CACHE_ENV = "INSTALLER_BUILDER_CACHE"
+
+
+def default_cache_dir():
+    override = os.environ.get(CACHE_ENV)
+    if override:
+        return override
+    system = platform.system()
+    if system == "Windows":
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+        return os.path.join(base, "installer_builder", "cache")
+    if system == "Darwin":
+        return os.path.expanduser(os.path.join("~", "Library", "Caches", "installer_builder"))
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser(os.path.join("~", ".cache"))
+    return os.path.join(base, "installer_builder")
+
+
+def cache_path(*parts, **kwargs):
+    """Return a path below the cache directory, creating its parent."""
+    root = kwargs.get("cache_dir") or default_cache_dir()
+    path = os.path.join(root, *parts)
+    parent = os.path.dirname(path)
+    if not os.path.isdir(parent):
+        os.makedirs(parent)
+    return path
+
+
+def load_json(path, default=None):
+    """Read a JSON cache file, returning `default` if it is missing or bad."""
+    try:
+        with open(path, encoding="utf-8") as fp:
+            return json.load(fp)
+    except (OSError, ValueError):
+        return default
+
+
+def save_json(path, data):
+    """Atomically replace a JSON cache file."""
+    tmp = "%s.%d.tmp" % (path, os.getpid())
+    with open(tmp, "w", encoding="utf-8") as fp:
+        json.dump(data, fp, indent=1, sort_keys=True)
+    os.replace(tmp, path)
@@ -0,0 +1,232 @@
+"""Compile gettext catalogs (``.po``) to ``.mo`` files, with a cache.
+
+The builder used to bundle only ``.mo`` files that already existed, so
+every build needed a msgfmt pass over the application, wx, app_elements
+and product_key catalogs first. `compile_catalogs` compiles the ``.po``
+files in-process instead. Results are cached in the cache directory by the
+sha256 of the ``.po``, so a catalog is only compiled again after it
+changes, and `stale_catalogs` finds ``.mo`` files that are older than
+their ``.po``.
+
+The compiler follows Python's ``Tools/i18n/msgfmt.py``: fuzzy and
+untranslated messages are left out, contexts and plural forms are
+supported, and messages are encoded in the charset the header declares.
+"""
+
+import ast
+import hashlib
+import os
+import re
+import struct
+
+from . import cache
+
+CATALOG_VERSION = 1
+MO_MAGIC = 0x950412DE
+CHARSET = re.compile(rb"charset=([A-Za-z0-9_.:-]+)")
+KEYWORD = re.compile(r"^(msgctxt|msgid_plural|msgid|msgstr)(?:\[(\d+)\])?\s+(.*)$")
+
+
+class CatalogError(ValueError):
+    """A ``.po`` file could not be parsed."""
+
+
+def parse_po(data, filename="<catalog>"):
+    """Return ``{msgid: msgstr}`` as encoded bytes, ready for `write_mo`.
+
+    Plural msgids and msgstrs are joined with NUL and a context is joined
+    to its msgid with EOT, the way gettext looks them up.
+    """
+    match = CHARSET.search(data)
+    encoding = match.group(1).decode("ascii") if match else "utf-8"
+    if encoding.upper() == "CHARSET":
+        # The placeholder left by xgettext
+        encoding = "utf-8"
+    try:
+        text = data.decode(encoding)
+    except (LookupError, UnicodeDecodeError) as e:
+        raise CatalogError("%s: %s" % (filename, e))
+
+    messages = {}
+    entry = {}
+    # The string being read: a keyword, or (index, "msgstr")
+    field = None
+    fuzzy = False
+
+    def finish():
+        nonlocal field, fuzzy
+        if "msgid" in entry:
+            msgid = entry["msgid"]
+            count = 1 + max([k[0] for k in entry if isinstance(k, tuple)], default=0)
+            msgstr = "\0".join(entry.get((i, "msgstr"), "") for i in range(count))
+            if "msgid_plural" in entry:
+                msgid += "\0" + entry["msgid_plural"]
+            if "msgctxt" in entry:
+                msgid = entry["msgctxt"] + "\x04" + msgid
+            # The header is kept even when fuzzy: it carries the charset
+            if msgid == "" or (not fuzzy and msgstr.strip("\0")):
+                messages[msgid.encode(encoding)] = msgstr.encode(encoding)
+        entry.clear()
+        field = None
+        fuzzy = False
+
+    for number, line in enumerate(text.splitlines(), 1):
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith("#"):
+            # A comment after a msgstr starts the next message
+            if isinstance(field, tuple):
+                finish()
+            if line.startswith("#,") and "fuzzy" in line:
+                fuzzy = True
+            continue
+        keyword = KEYWORD.match(line)
+        if keyword is not None:
+            name, index, line = keyword.groups()
+            if name in ("msgctxt", "msgid") and isinstance(field, tuple):
+                finish()
+            field = (int(index or 0), name) if name == "msgstr" else name
+        if field is None or not line.startswith('"'):
+            raise CatalogError("%s:%d: syntax error" % (filename, number))
+        try:
+            value = ast.literal_eval(line)
+        except (SyntaxError, ValueError):
+            raise CatalogError("%s:%d: bad string" % (filename, number))
+        if isinstance(field, tuple) and "msgid" not in entry:
+            raise CatalogError("%s:%d: msgstr without msgid" % (filename, number))
+        entry[field] = entry.get(field, "") + value
+    finish()
+    return messages
+
+
+def write_mo(messages):
+    """Return the contents of a ``.mo`` file holding `messages`."""
+    keys = sorted(messages)
+    ids = b""
+    strs = b""
+    offsets = []
+    for key in keys:
+        offsets.append((len(ids), len(key), len(strs), len(messages[key])))
+        ids += key + b"\0"
+        strs += messages[key] + b"\0"
+    # The header, two offset tables and no hash table, then the strings
+    keys_start = 7 * 4 + 16 * len(keys)
+    values_start = keys_start + len(ids)
+    key_table = []
+    value_table = []
+    for id_offset, id_length, str_offset, str_length in offsets:
+        key_table += [id_length, keys_start + id_offset]
+        value_table += [str_length, values_start + str_offset]
+    return (
+        struct.pack(
+            "Iiiiiii",
+            MO_MAGIC,
+            0,
+            len(keys),
+            7 * 4,
+            7 * 4 + 8 * len(keys),
+            0,
+            0,
+        )
+        + struct.pack("%di" % len(key_table), *key_table)
+        + struct.pack("%di" % len(value_table), *value_table)
+        + ids
+        + strs
+    )
+
+
+def compile_po(data, filename="<catalog>"):
+    return write_mo(parse_po(data, filename))
+
+
+def cache_key(data):
+    digest = hashlib.sha256(b"%d\0" % CATALOG_VERSION)
+    digest.update(data)
+    return digest.hexdigest()
+
+
+def find_catalogs(locale_path):
+    """Every ``.po`` below `locale_path`."""
+    found = []
+    for dirpath, dirnames, filenames in os.walk(locale_path):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if filename.lower().endswith(".po"):
+                found.append(os.path.join(dirpath, filename))
+    return found
+
+
+def mo_path(po_path):
+    return os.path.splitext(po_path)[0] + ".mo"
+
+
+def stale_catalogs(po_paths):
+    """The ``.po`` files with a ``.mo`` next to them that is older."""
+    stale = []
+    for po in po_paths:
+        mo = mo_path(po)
+        if os.path.exists(mo) and os.path.getmtime(mo) < os.path.getmtime(po):
+            stale.append(po)
+    return stale
+
+
+class CompileResult(object):
+    """What `compile_catalogs` did."""
+
+    def __init__(self):
+        self.catalogs = {}
+        self.compiled = 0
+        self.reused = 0
+        self.errors = {}
+
+    def __repr__(self):
+        return "<CompileResult %d compiled, %d reused, %d errors>" % (
+            self.compiled,
+            self.reused,
+            len(self.errors),
+        )
+
+
+def _compile(path, data, output):
+    """Compile one catalog into the cache; returns an error or None."""
+    try:
+        mo = compile_po(data, path)
+    except CatalogError as e:
+        return str(e)
+    directory = os.path.dirname(output)
+    if not os.path.isdir(directory):
+        os.makedirs(directory, exist_ok=True)
+    tmp = "%s.%d.tmp" % (output, os.getpid())
+    with open(tmp, "wb") as fp:
+        fp.write(mo)
+    os.replace(tmp, output)
+    return None
+
+
+def compile_catalogs(po_paths, cache_dir=None):
+    """Compile every ``.po`` in `po_paths` that is not already cached.
+
+    Returns a `CompileResult` whose `catalogs` maps each ``.po`` to its
+    compiled ``.mo`` in the cache. Catalogs that do not parse are
+    reported in `errors`.
+    """
+    if cache_dir is None:
+        cache_dir = os.path.join(cache.default_cache_dir(), "mo")
+    result = CompileResult()
+    for path in po_paths:
+        with open(path, "rb") as fp:
+            data = fp.read()
+        key = cache_key(data)
+        output = os.path.join(cache_dir, key[:2], key + ".mo")
+        if os.path.exists(output):
+            result.catalogs[path] = output
+            result.reused += 1
+            continue
+        error = _compile(path, data, output)
+        if error is None:
+            result.catalogs[path] = output
+            result.compiled += 1
+        else:
+            result.errors[path] = error
+    return result
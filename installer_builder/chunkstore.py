@@ -0,0 +1,216 @@
+"""Deduplicated storage for release artifacts.
+
+Artifacts are split into content-defined chunks: a chunk ends where a
+short window of bytes matches a pattern derived from a gear table, so an
+insertion or deletion only changes the chunks around it. The pattern is a
+compiled regular expression, so the scan runs in C rather than one byte
+at a time in Python. As in FastCDC, a stricter pattern is used before the
+average size and a looser one after it, which keeps chunk sizes close to
+the average. Each chunk
+is stored once under its sha256 and every artifact is recorded as the list
+of chunks it is made of::
+
+    <root>/chunks/ab/abcdef...
+    <root>/artifacts/<name>.json
+
+Copying a release between build nodes then only needs the chunks the other
+side does not already have, see `ChunkStore.missing_chunks`.
+"""
+
+import functools
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+
+DEFAULT_MIN_CHUNK = 16 * 1024
+DEFAULT_AVG_CHUNK = 64 * 1024
+DEFAULT_MAX_CHUNK = 256 * 1024
+READ_SIZE = 4 * 1024 * 1024
+
+BOUNDARY_WINDOW = 4
+GEAR = tuple(
+    int.from_bytes(hashlib.sha256(bytes([i])).digest()[:8], "little")
+    for i in range(256)
+)
+
+
+@functools.lru_cache()
+def boundary_pattern(avg_size):
+    """A pattern that matches about once every `avg_size` bytes of random data.
+
+    Each of the `BOUNDARY_WINDOW` positions accepts a class of bytes picked
+    by a different part of the gear values, sized so that the chance of a
+    match at any one position is about ``1 / avg_size``.
+    """
+    size = round(256 * avg_size ** (-1.0 / BOUNDARY_WINDOW))
+    size = max(1, min(255, size))
+    classes = []
+    for i in range(BOUNDARY_WINDOW):
+        ranked = sorted(range(256), key=lambda b: (GEAR[b] >> (16 * i)) & 0xFFFF)
+        members = b"".join(re.escape(bytes([b])) for b in sorted(ranked[:size]))
+        classes.append(b"[" + members + b"]")
+    return re.compile(b"".join(classes))
+
+
+def iter_chunks(
+    fp,
+    min_size=DEFAULT_MIN_CHUNK,
+    avg_size=DEFAULT_AVG_CHUNK,
+    max_size=DEFAULT_MAX_CHUNK,
+):
+    """Yield the content-defined chunks of the binary file object `fp`."""
+    strict = boundary_pattern(avg_size * 4)
+    loose = boundary_pattern(max(1, avg_size // 4))
+    buf = bytearray()
+    eof = False
+    while True:
+        if not eof and len(buf) < max_size:
+            data = fp.read(READ_SIZE)
+            if data:
+                buf += data
+                continue
+            eof = True
+        if not buf:
+            return
+        if len(buf) <= min_size:
+            yield bytes(buf)
+            return
+        end = min(len(buf), max_size)
+        normal = max(min_size, min(end, avg_size))
+        match = strict.search(buf, min_size, normal)
+        if match is None:
+            match = loose.search(buf, normal, end)
+        cut = match.end() if match is not None else end
+        yield bytes(buf[:cut])
+        del buf[:cut]
+
+
+class ChunkStore(object):
+    """A directory of deduplicated chunks and the artifacts built from them."""
+
+    def __init__(
+        self,
+        root,
+        min_size=DEFAULT_MIN_CHUNK,
+        avg_size=DEFAULT_AVG_CHUNK,
+        max_size=DEFAULT_MAX_CHUNK,
+    ):
+        self.root = root
+        self.min_size = min_size
+        self.avg_size = avg_size
+        self.max_size = max_size
+        self.chunks_dir = os.path.join(root, "chunks")
+        self.artifacts_dir = os.path.join(root, "artifacts")
+        for directory in (self.chunks_dir, self.artifacts_dir):
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+
+    def chunk_path(self, digest):
+        return os.path.join(self.chunks_dir, digest[:2], digest)
+
+    def has_chunk(self, digest):
+        return os.path.exists(self.chunk_path(digest))
+
+    def put_chunk(self, data):
+        """Store `data` unless it is already present. Returns (digest, is_new)."""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.chunk_path(digest)
+        if os.path.exists(path):
+            return digest, False
+        directory = os.path.dirname(path)
+        if not os.path.isdir(directory):
+            os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+        with os.fdopen(fd, "wb") as fp:
+            fp.write(data)
+        os.replace(tmp, path)
+        return digest, True
+
+    def artifact_path(self, name):
+        return os.path.join(self.artifacts_dir, name + ".json")
+
+    def add(self, filename, name=None):
+        """Chunk `filename` into the store and record it as artifact `name`.
+
+        Returns the artifact record, with ``new_bytes`` set to the number of
+        bytes which were not already in the store.
+        """
+        if name is None:
+            name = os.path.basename(filename)
+        chunks = []
+        size = new_bytes = 0
+        digest = hashlib.sha256()
+        with open(filename, "rb") as fp:
+            for data in iter_chunks(fp, self.min_size, self.avg_size, self.max_size):
+                chunk_digest, is_new = self.put_chunk(data)
+                chunks.append([chunk_digest, len(data)])
+                digest.update(data)
+                size += len(data)
+                if is_new:
+                    new_bytes += len(data)
+        record = {
+            "name": name,
+            "size": size,
+            "sha256": digest.hexdigest(),
+            "chunks": chunks,
+        }
+        tmp = self.artifact_path(name) + ".tmp"
+        with open(tmp, "w") as fp:
+            json.dump(record, fp)
+        os.replace(tmp, self.artifact_path(name))
+        record["new_bytes"] = new_bytes
+        return record
+
+    def artifact(self, name):
+        with open(self.artifact_path(name)) as fp:
+            return json.load(fp)
+
+    def artifacts(self):
+        return sorted(
+            filename[: -len(".json")]
+            for filename in os.listdir(self.artifacts_dir)
+            if filename.endswith(".json")
+        )
+
+    def missing_chunks(self, chunks):
+        """Return the digests from a chunk list which this store lacks."""
+        missing = []
+        seen = set()
+        for chunk in chunks:
+            digest = chunk[0] if isinstance(chunk, (list, tuple)) else chunk
+            if digest not in seen and not self.has_chunk(digest):
+                missing.append(digest)
+            seen.add(digest)
+        return missing
+
+    def import_artifact(self, other, name):
+        """Copy artifact `name` and only the chunks it lacks from `other`."""
+        record = other.artifact(name)
+        missing = self.missing_chunks(record["chunks"])
+        for digest in missing:
+            path = self.chunk_path(digest)
+            directory = os.path.dirname(path)
+            if not os.path.isdir(directory):
+                os.makedirs(directory, exist_ok=True)
+            shutil.copyfile(other.chunk_path(digest), path)
+        shutil.copyfile(other.artifact_path(name), self.artifact_path(name))
+        return missing
+
+    def rebuild(self, name, destination):
+        """Reassemble artifact `name` into the file `destination`."""
+        record = self.artifact(name)
+        digest = hashlib.sha256()
+        with open(destination, "wb") as out:
+            for chunk_digest, size in record["chunks"]:
+                with open(self.chunk_path(chunk_digest), "rb") as fp:
+                    data = fp.read()
+                if len(data) != size:
+                    raise IOError("Chunk %s is damaged" % chunk_digest)
+                digest.update(data)
+                out.write(data)
+        if digest.hexdigest() != record["sha256"]:
+            raise IOError("Rebuilt artifact %s failed verification" % name)
+        return destination
@@ -0,0 +1,333 @@
+"""Decide which payload files are worth compressing in the installer.
+
+Media, images and archives are already compressed, and asking ISCC to
+compress them again only costs CPU time. Files are judged by extension
+first, zip archives by how their members are stored, and anything else
+above a minimum size by how well a quick zlib pass shrinks a sample of its
+first blocks.
+
+`flag_incompressible_files` marks those files in the [Files] section of a
+script written elsewhere. The module also defines named compression
+profiles, which set the LZMA2 [Setup] directives from the build machine's
+CPU count, and a benchmark that compiles one script under each of them::
+
+    python -m installer_builder.compression dist/distutils.iss --iscc ISCC.exe
+"""
+
+import os
+import zipfile
+import zlib
+
+from . import runner
+
+INCOMPRESSIBLE_EXTENSIONS = frozenset(
+    (
+        ".7z",
+        ".aac",
+        ".avi",
+        ".bz2",
+        ".cab",
+        ".flac",
+        ".gif",
+        ".gz",
+        ".ico",
+        ".jpeg",
+        ".jpg",
+        ".m4a",
+        ".mkv",
+        ".mp3",
+        ".mp4",
+        ".ogg",
+        ".opus",
+        ".png",
+        ".webm",
+        ".webp",
+        ".woff2",
+        ".xz",
+        ".zst",
+    )
+)
+ZIP_EXTENSIONS = frozenset((".zip", ".whl", ".jar", ".egg"))
+
+SAMPLE_BLOCK = 64 * 1024
+SAMPLE_BLOCKS = 3
+MIN_SAMPLE_SIZE = 16 * 1024
+INCOMPRESSIBLE_RATIO = 0.95
+
+
+def sample_ratio(filename):
+    """Return compressed/original size for a zlib pass over the first blocks."""
+    with open(filename, "rb") as fp:
+        sample = fp.read(SAMPLE_BLOCK * SAMPLE_BLOCKS)
+    if not sample:
+        return 1.0
+    return len(zlib.compress(sample, 1)) / float(len(sample))
+
+
+def zip_is_compressed(filename):
+    """True if most of the bytes in a zip archive are already deflated."""
+    try:
+        with zipfile.ZipFile(filename) as archive:
+            stored = compressed = 0
+            for info in archive.infolist():
+                if info.compress_type == zipfile.ZIP_STORED:
+                    stored += info.file_size
+                else:
+                    compressed += info.compress_size
+    except (zipfile.BadZipfile, OSError):
+        return False
+    return compressed > stored
+
+
+def is_incompressible(filename, size=None):
+    """Guess whether compressing `filename` again would gain nothing."""
+    ext = os.path.splitext(filename)[1].lower()
+    if ext in INCOMPRESSIBLE_EXTENSIONS:
+        return True
+    if ext in ZIP_EXTENSIONS:
+        return zip_is_compressed(filename)
+    if size is None:
+        size = os.path.getsize(filename)
+    if size < MIN_SAMPLE_SIZE:
+        return False
+    return sample_ratio(filename) >= INCOMPRESSIBLE_RATIO
+
+
+DEFAULT_PROFILE = "balanced"
+MAX_BLOCK_THREADS = 32
+
+
+def _block_threads(cpu_count, limit=MAX_BLOCK_THREADS):
+    if cpu_count is None:
+        cpu_count = os.cpu_count() or 1
+    return max(1, min(cpu_count, limit))
+
+
+def _fast_dev(cpu_count):
+    return {
+        "Compression": "lzma2/fast",
+        "SolidCompression": "no",
+        "LZMAUseSeparateProcess": "yes",
+        "LZMANumBlockThreads": str(_block_threads(cpu_count)),
+        "LZMADictionarySize": "4096",
+    }
+
+
+def _balanced(cpu_count):
+    return {
+        "Compression": "lzma2/normal",
+        "SolidCompression": "yes",
+        "LZMAUseSeparateProcess": "yes",
+        "LZMANumBlockThreads": str(_block_threads(cpu_count)),
+        "LZMADictionarySize": "32768",
+    }
+
+
+def _max_ratio(cpu_count):
+    # Each block thread compresses its own block, which costs ratio, so
+    # only a few are used even on machines with many cores.
+    return {
+        "Compression": "lzma2/ultra64",
+        "SolidCompression": "yes",
+        "LZMAUseSeparateProcess": "yes",
+        "LZMANumBlockThreads": str(_block_threads(cpu_count, limit=2)),
+        "LZMADictionarySize": "131072",
+        "LZMANumFastBytes": "273",
+    }
+
+
+COMPRESSION_PROFILES = {
+    "fast-dev": _fast_dev,
+    "balanced": _balanced,
+    "max-ratio": _max_ratio,
+}
+PROFILE_NAMES = ("fast-dev", "balanced", "max-ratio")
+
+
+def profile_directives(profile, cpu_count=None):
+    """Return the [Setup] directives for a named compression profile."""
+    try:
+        return COMPRESSION_PROFILES[profile](cpu_count)
+    except KeyError:
+        raise ValueError(
+            "Unknown compression profile %r, expected one of %s"
+            % (profile, ", ".join(PROFILE_NAMES))
+        )
+
+
+def apply_setup_directives(script, directives):
+    """Return `script` with `directives` set in its [Setup] section.
+
+    Existing values are replaced in place; missing ones are appended to the
+    section, which is created if the script has none.
+    """
+    remaining = dict(directives)
+    lines = []
+    in_setup = seen_setup = False
+
+    def flush():
+        for name in sorted(remaining):
+            lines.append("%s=%s" % (name, remaining[name]))
+        remaining.clear()
+
+    for line in script.splitlines():
+        stripped = line.strip()
+        if stripped.startswith("[") and "]" in stripped:
+            if in_setup:
+                flush()
+            in_setup = stripped[1 : stripped.index("]")].strip().lower() == "setup"
+            seen_setup = seen_setup or in_setup
+        elif in_setup and "=" in stripped and not stripped.startswith(";"):
+            name = stripped.split("=", 1)[0].strip()
+            for key in list(remaining):
+                if key.lower() == name.lower():
+                    line = "%s=%s" % (key, remaining.pop(key))
+        lines.append(line)
+    if in_setup:
+        flush()
+    if not seen_setup:
+        lines.append("[Setup]")
+        flush()
+    return "\n".join(lines) + "\n"
+
+
+def _entry_params(line):
+    """Split an Inno Setup entry into [(name, value)], keeping quoted ';'."""
+    params = []
+    field = []
+    quoted = False
+    for char in line:
+        if char == '"':
+            quoted = not quoted
+        if char == ";" and not quoted:
+            params.append("".join(field))
+            field = []
+        else:
+            field.append(char)
+    params.append("".join(field))
+    return [
+        tuple(part.strip() for part in param.split(":", 1))
+        for param in params
+        if ":" in param
+    ]
+
+
+def flag_incompressible_files(script, base_dir):
+    """Add ``nocompression`` to [Files] entries of already compressed files.
+
+    Relative ``Source:`` paths are resolved against `base_dir`; wildcards and
+    paths using Inno Setup constants are left alone. Returns the new script
+    and the number and total size of the flagged files.
+    """
+    lines = []
+    section = ""
+    count = size = 0
+    for line in script.splitlines():
+        stripped = line.strip()
+        if stripped.startswith("[") and "]" in stripped:
+            section = stripped[1 : stripped.index("]")].strip().lower()
+        elif section == "files" and stripped and not stripped.startswith(";"):
+            params = _entry_params(stripped)
+            names = [name.lower() for name, value in params]
+            if "source" in names:
+                source = params[names.index("source")][1].strip('"')
+                path = os.path.join(base_dir, source.replace("\\", os.sep))
+                flags = []
+                if "flags" in names:
+                    flags = params[names.index("flags")][1].strip('"').split()
+                if (
+                    "{" not in source
+                    and "nocompression" not in [f.lower() for f in flags]
+                    and os.path.isfile(path)
+                ):
+                    file_size = os.path.getsize(path)
+                    if is_incompressible(path, file_size):
+                        count += 1
+                        size += file_size
+                        flags.append("nocompression")
+                        params = [p for p in params if p[0].lower() != "flags"]
+                        params.append(("Flags", " ".join(flags)))
+                        line = "; ".join("%s: %s" % param for param in params)
+        lines.append(line)
+    return "\n".join(lines) + "\n", count, size
+
+
+def benchmark_profiles(issfile, iscc, profiles=None, cpu_count=None, output_dir=None):
+    """Compile `issfile` once per profile and measure size and time.
+
+    `iscc` is the compiler path, or an argv list for wrappers. Returns a list
+    of dicts with ``profile``, ``seconds``, ``size`` and ``directives``.
+    """
+    if profiles is None:
+        profiles = PROFILE_NAMES
+    if isinstance(iscc, str):
+        iscc = [iscc]
+    if output_dir is None:
+        output_dir = os.path.join(os.path.dirname(os.path.abspath(issfile)), "benchmark")
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+    with open(issfile, encoding="utf-8-sig") as fp:
+        script = fp.read()
+    results = []
+    for profile in profiles:
+        directives = profile_directives(profile, cpu_count)
+        settings = dict(directives)
+        settings["OutputDir"] = os.path.abspath(output_dir)
+        settings["OutputBaseFilename"] = profile
+        # Keep the script next to the original so relative Source: paths work
+        variant = "%s-%s.iss" % (os.path.splitext(issfile)[0], profile)
+        with open(variant, "w", encoding="utf-8-sig") as fp:
+            fp.write(apply_setup_directives(script, settings))
+        try:
+            seconds = runner.run(iscc + ["/Q", variant], echo=False).seconds
+        finally:
+            os.remove(variant)
+        output = os.path.join(output_dir, profile + ".exe")
+        results.append(
+            {
+                "profile": profile,
+                "seconds": seconds,
+                "size": os.path.getsize(output),
+                "directives": directives,
+            }
+        )
+    return results
+
+
+def format_benchmark(results):
+    """Tabulate `benchmark_profiles` results."""
+    from . import format_filesize
+
+    rows = ["%-12s %12s %10s" % ("Profile", "Size", "Seconds")]
+    for result in results:
+        rows.append(
+            "%-12s %12s %10.1f"
+            % (result["profile"], format_filesize(result["size"]), result["seconds"])
+        )
+    return "\n".join(rows)
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Compile an Inno Setup script under each compression profile"
+    )
+    parser.add_argument("issfile", help="script to compile, e.g. dist/distutils.iss")
+    parser.add_argument("--iscc", default="ISCC.exe", help="path to ISCC.exe")
+    parser.add_argument(
+        "--profile",
+        action="append",
+        choices=PROFILE_NAMES,
+        help="profile to benchmark (default: all)",
+    )
+    parser.add_argument("--output-dir", help="where to put the compiled installers")
+    args = parser.parse_args(argv)
+    results = benchmark_profiles(
+        args.issfile, args.iscc, profiles=args.profile, output_dir=args.output_dir
+    )
+    print(format_benchmark(results))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+"""A single index of the dist tree shared by every build step.
+
+Signing, installer script generation, Mac binary thinning, manifests and
+update archives all need to know what is in ``dist``. Rather than each of
+them walking the tree and calling ``stat`` again, the tree is scanned once
+with ``os.scandir`` into a `DistIndex`. Steps which change files (signing,
+lipo, moving the installer away) tell the index with `DistIndex.refresh`
+so it stays accurate without rescanning.
+
+Use `get_index` to share one index per directory within a build.
+"""
+
+import os
+import zipfile
+
+from . import filetable
+
+KIND_DATA = 0
+KIND_EXE = 1
+KIND_DLL = 2
+KIND_SHARED_LIB = 3
+
+KIND_NAMES = {
+    KIND_DATA: "data",
+    KIND_EXE: "exe",
+    KIND_DLL: "dll",
+    KIND_SHARED_LIB: "shared_lib",
+}
+
+EXTENSION_KINDS = {
+    ".exe": KIND_EXE,
+    ".dll": KIND_DLL,
+    ".pyd": KIND_DLL,
+    ".so": KIND_SHARED_LIB,
+    ".dylib": KIND_SHARED_LIB,
+}
+
+
+def classify(name):
+    return EXTENSION_KINDS.get(os.path.splitext(name)[1].lower(), KIND_DATA)
+
+
+def _normprefix(prefix):
+    if not prefix:
+        return ""
+    prefix = os.path.normpath(prefix)
+    if prefix == os.curdir:
+        return ""
+    return prefix
+
+
+class DistIndex(object):
+    """Files below `root`, with sizes, mtimes and a kind classification.
+
+    Entries are stored in a `installer_builder.filetable.FileTable` and
+    handed out as `installer_builder.filetable.FileRecord` views.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.scan()
+
+    def scan(self):
+        """(Re)build the index with a single walk of the tree."""
+        self.table = filetable.FileTable(self.root)
+        self.dirs = self.table.dirs
+        # Scanning adds each directory's files contiguously, so a lookup
+        # only has to search that directory's slice of the name column.
+        self._dir_ranges = {}
+        self._added = {}
+        pending = [""]
+        while pending:
+            reldir = pending.pop()
+            dir_id = self.table.dir_id(reldir)
+            with os.scandir(os.path.join(self.root, reldir)) as it:
+                entries = sorted(it, key=lambda entry: entry.name)
+            subdirs = []
+            start = len(self.table.names)
+            for entry in entries:
+                if entry.is_dir():
+                    if not entry.is_symlink():
+                        subdirs.append(os.path.join(reldir, entry.name))
+                    else:
+                        self.table.dir_id(os.path.join(reldir, entry.name))
+                elif entry.is_file():
+                    st = entry.stat()
+                    self.table.add(
+                        dir_id, entry.name, st.st_size, st.st_mtime, classify(entry.name)
+                    )
+            self._dir_ranges[dir_id] = (start, len(self.table.names))
+            pending.extend(reversed(subdirs))
+
+    def __len__(self):
+        return len(self.table)
+
+    def __iter__(self):
+        return iter(self.table)
+
+    def relpath(self, entry):
+        return self.table.relpath(entry.position)
+
+    def path(self, entry):
+        return self.table.path(entry.position)
+
+    def _key(self, path):
+        relpath = os.path.relpath(path, self.root)
+        if relpath.startswith(os.pardir):
+            raise ValueError("%s is not inside %s" % (path, self.root))
+        reldir, name = os.path.split(relpath)
+        return reldir, name
+
+    def _position(self, reldir, name):
+        dir_id = self.table.find_dir(reldir)
+        if dir_id is None:
+            return None
+        position = self._added.get((dir_id, name))
+        if position is None and dir_id in self._dir_ranges:
+            start, end = self._dir_ranges[dir_id]
+            try:
+                position = self.table.names.index(name, start, end)
+            except ValueError:
+                return None
+        if position is None or self.table.is_deleted(position):
+            return None
+        return position
+
+    def lookup(self, path):
+        """Return the entry for `path`, or None if it is not indexed."""
+        position = self._position(*self._key(path))
+        if position is None:
+            return None
+        return self.table.record(position)
+
+    def refresh(self, path):
+        """Update the index after `path` was created, modified or deleted."""
+        reldir, name = self._key(path)
+        try:
+            st = os.stat(path)
+        except OSError:
+            st = None
+        position = self._position(reldir, name)
+        if st is None:
+            if position is not None:
+                self.table.remove(position)
+            return None
+        if position is None:
+            parts = reldir.split(os.sep) if reldir else []
+            for i in range(len(parts)):
+                self.table.dir_id(os.path.join(*parts[: i + 1]))
+            dir_id = self.table.dir_id(reldir)
+            position = self.table.add(
+                dir_id, name, st.st_size, st.st_mtime, classify(name)
+            )
+            self._added[(dir_id, name)] = position
+            return self.table.record(position)
+        entry = self.table.record(position)
+        entry.size = st.st_size
+        entry.mtime = st.st_mtime
+        return entry
+
+    def iter_files(self, kinds=None, extensions=None, prefix=""):
+        """Yield entries, optionally limited by kind, extension or subdirectory."""
+        table = self.table
+        if extensions is not None:
+            extensions = tuple(e.lower() for e in extensions)
+        prefix = _normprefix(prefix)
+        if prefix:
+            prefix_dirs = set(
+                dir_id
+                for dir_id, reldir in enumerate(self.dirs)
+                if reldir == prefix or reldir.startswith(prefix + os.sep)
+            )
+        for position in table.positions():
+            if prefix and table.dir_ids[position] not in prefix_dirs:
+                continue
+            if (
+                kinds is not None
+                and table.flags[position] & filetable.KIND_MASK not in kinds
+            ):
+                continue
+            if extensions is not None and not table.names[position].lower().endswith(
+                extensions
+            ):
+                continue
+            yield table.record(position)
+
+    def iter_tree(self, prefix=""):
+        """Yield (relative path, path, size) for files below `prefix`.
+
+        Relative paths use forward slashes and are relative to `prefix`, in
+        the shape expected by `installer_builder.manifest.iter_manifest`.
+        """
+        prefix = _normprefix(prefix)
+        base = os.path.join(self.root, prefix) if prefix else self.root
+        for entry in self.iter_files(prefix=prefix):
+            path = self.path(entry)
+            relpath = os.path.relpath(path, base).replace(os.sep, "/")
+            yield relpath, path, entry.size
+
+    def file_list(self, **kwargs):
+        """Return the paths `iter_files` would yield as a compact `FileList`."""
+        return self.table.file_list(
+            entry.position for entry in self.iter_files(**kwargs)
+        )
+
+    def total_size(self, **kwargs):
+        return sum(entry.size for entry in self.iter_files(**kwargs))
+
+    def write_zip(self, filename, prefix=""):
+        """Write the files below `prefix` to a zip archive.
+
+        This is what ``shutil.make_archive(..., "zip", root_dir)`` produces,
+        without walking the tree again.
+        """
+        prefix = _normprefix(prefix)
+        base = os.path.join(self.root, prefix) if prefix else self.root
+        with zipfile.ZipFile(
+            filename, "w", zipfile.ZIP_DEFLATED, allowZip64=True
+        ) as archive:
+            for reldir in sorted(self.dirs):
+                if not reldir:
+                    continue
+                directory = os.path.join(self.root, reldir)
+                arcname = os.path.relpath(directory, base)
+                if arcname != os.curdir and not arcname.startswith(os.pardir):
+                    archive.write(directory, arcname)
+            for entry in self.iter_files(prefix=prefix):
+                path = self.path(entry)
+                archive.write(path, os.path.relpath(path, base))
+        return filename
+
+
+_indexes = {}
+
+
+def get_index(root, rescan=False):
+    """Return the shared index of `root`, scanning it on first use."""
+    key = os.path.abspath(root)
+    index = _indexes.get(key)
+    if index is None:
+        index = _indexes[key] = DistIndex(root)
+    elif rescan:
+        index.scan()
+    return index
+
+
+def discard_index(root):
+    """Forget the shared index of `root`, e.g. after the tree was deleted."""
+    _indexes.pop(os.path.abspath(root), None)
@@ -0,0 +1,64 @@
+"""Disk image sizing and ``hdiutil create`` command lines.
+
+The image is sized from the files in the app bundle rather than a fixed
+guess: every file is rounded up to the HFS+ allocation block, a per-file
+allowance covers the catalog, and a relative margin plus fixed slack leave
+room for the volume's own structures.
+
+Compressed formats:
+
+* ``UDZO`` - zlib, readable on every macOS version (``compression_level``
+  sets the zlib level, 1-9)
+* ``ULFO`` - lzfse, macOS 10.11+; faster to create and open than UDZO
+* ``ULMO`` - lzma, macOS 10.15+; smallest, slowest to create
+"""
+
+import math
+
+DMG_FORMATS = ("UDZO", "ULFO", "ULMO")
+DEFAULT_FORMAT = "UDZO"
+
+BLOCK_SIZE = 4096
+FILE_OVERHEAD = 1024
+DEFAULT_MARGIN = 0.1
+DEFAULT_SLACK = 16 * 1024 * 1024
+MEGABYTE = 1024 * 1024
+
+
+def image_size(sizes, margin=DEFAULT_MARGIN, slack=DEFAULT_SLACK):
+    """Return the image size in bytes needed to hold files of `sizes`."""
+    total = 0
+    for size in sizes:
+        total += -(-size // BLOCK_SIZE) * BLOCK_SIZE + FILE_OVERHEAD
+    return int(total * (1 + margin)) + slack
+
+
+def size_argument(nbytes):
+    """Format a byte count for ``hdiutil -size``, rounded up to whole MB."""
+    return "%dm" % math.ceil(nbytes / float(MEGABYTE))
+
+
+def create_command(
+    srcfolder,
+    output,
+    size,
+    image_format=DEFAULT_FORMAT,
+    volname=None,
+    compression_level=None,
+):
+    """Return the ``hdiutil`` arguments (without the tool) to build an image."""
+    if image_format not in DMG_FORMATS:
+        raise ValueError(
+            "Unknown disk image format %r, expected one of %s"
+            % (image_format, ", ".join(DMG_FORMATS))
+        )
+    command = ["create", "-srcfolder", srcfolder, "-fs", "HFS+"]
+    if volname:
+        command += ["-volname", volname]
+    command += ["-format", image_format, "-size", size_argument(size)]
+    if compression_level is not None:
+        if image_format != "UDZO":
+            raise ValueError("compression_level only applies to UDZO images")
+        command += ["-imagekey", "zlib-level=%d" % compression_level]
+    command += ["-ov", output]
+    return command
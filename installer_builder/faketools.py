@@ -0,0 +1,133 @@
+"""Stand-ins for ISCC, signtool, lipo and hdiutil.
+
+Used by the toolchain's fake mode so the build pipeline can be exercised
+and timed on machines without the real tools::
+
+    python faketools.py iscc dist/distutils.iss
+
+Each fake accepts the arguments the builder passes to the real tool and
+leaves a plausible output behind: ISCC compresses every ``Source:`` file
+into ``OutputDir/OutputBaseFilename.exe``, hdiutil zips the source folder
+into the image path, lipo copies its input and signtool leaves the file
+alone.
+
+This module must stay runnable as a plain script (the toolchain starts it
+by path), so it only imports the package lazily.
+"""
+
+import os
+import shutil
+import sys
+import zipfile
+import zlib
+
+
+def _import_fingerprint():
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from installer_builder import fingerprint
+
+    return fingerprint
+
+
+def iscc(args):
+    # ISCC takes its /switches before the script
+    issfile = args[-1]
+    fingerprint = _import_fingerprint()
+    with open(issfile, encoding="utf-8-sig") as fp:
+        script = fp.read()
+    base_dir = os.path.dirname(os.path.abspath(issfile))
+    setup = {}
+    section = ""
+    for line in script.splitlines():
+        stripped = line.strip()
+        if stripped.startswith("[") and "]" in stripped:
+            section = stripped[1 : stripped.index("]")].lower()
+        elif section == "setup" and "=" in stripped:
+            key, value = stripped.split("=", 1)
+            setup[key.strip().lower()] = value.strip().strip('"')
+    output_dir = os.path.join(base_dir, setup.get("outputdir", "Output"))
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+    output = os.path.join(
+        output_dir, setup.get("outputbasefilename", "mysetup") + ".exe"
+    )
+    compressor = zlib.compressobj(1)
+    with open(output, "wb") as out:
+        out.write(b"MZ fake installer\n")
+        for source in fingerprint.script_sources(script, base_dir):
+            if not os.path.isfile(source):
+                continue
+            with open(source, "rb") as fp:
+                for block in iter(lambda: fp.read(1024 * 1024), b""):
+                    out.write(compressor.compress(block))
+        out.write(compressor.flush())
+    print("Fake ISCC wrote %s" % output)
+
+
+def signtool(args):
+    print("Fake signtool: %s" % args[-1])
+
+
+def _split(args, valued):
+    """Return ({flag: value}, positional args); `valued` flags take a value."""
+    options = {}
+    positional = []
+    args = iter(args)
+    for arg in args:
+        if arg in valued:
+            options[arg] = next(args, None)
+        elif arg.startswith("-"):
+            options[arg] = True
+        else:
+            positional.append(arg)
+    return options, positional
+
+
+def lipo(args):
+    options, positional = _split(args, ("-thin", "-output", "-extract", "-remove"))
+    if "-info" in options or "-archs" in options:
+        print("Non-fat file: %s is architecture: unknown" % positional[-1])
+        return
+    output = options["-output"]
+    if os.path.abspath(positional[0]) != os.path.abspath(output):
+        shutil.copyfile(positional[0], output)
+
+
+def hdiutil(args):
+    options, positional = _split(
+        args,
+        ("-srcfolder", "-size", "-format", "-volname", "-fs", "-imagekey", "-o"),
+    )
+    srcfolder = options["-srcfolder"]
+    output = options.get("-o") or positional[-1]
+    if not output.endswith(".dmg"):
+        output += ".dmg"
+    root = os.path.dirname(os.path.abspath(srcfolder))
+    size = options.get("-size")
+    if size:
+        total = sum(
+            os.path.getsize(os.path.join(dirpath, filename))
+            for dirpath, dirnames, filenames in os.walk(srcfolder)
+            for filename in filenames
+        )
+        if total > int(size.rstrip("m")) * 1024 * 1024:
+            sys.exit("hdiutil: create failed - No space left on device")
+    with zipfile.ZipFile(output, "w", zipfile.ZIP_DEFLATED) as archive:
+        for dirpath, dirnames, filenames in os.walk(srcfolder):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                archive.write(path, os.path.relpath(path, root))
+    print("Fake hdiutil wrote %s" % output)
+
+
+FAKES = {"iscc": iscc, "signtool": signtool, "lipo": lipo, "hdiutil": hdiutil}
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    FAKES[argv[0]](argv[1:])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+"""Compact storage for large lists of files.
+
+Asset-heavy applications ship hundreds of thousands of files, and keeping
+a full path string, a tuple and a list per file adds up quickly. A
+`FileTable` instead stores each directory once in an interned table and
+keeps per-file data in array-backed columns:
+
+* ``dir_ids`` - index into ``dirs`` (``array('I')``)
+* ``names`` - base names, packed into one UTF-8 buffer (`NameColumn`)
+* ``sizes`` / ``mtimes`` - ``array('q')`` / ``array('d')``
+* ``flags`` - kind and status bits (``array('B')``)
+
+Full paths are only built when somebody asks for them. `FileRecord` and
+`FileList` are small ``__slots__`` views onto a table.
+"""
+
+import array
+import collections.abc
+import os
+
+KIND_MASK = 0x0F
+DELETED = 0x80
+
+
+class NameColumn(object):
+    """List-like column of strings packed into a single bytearray."""
+
+    __slots__ = ("data", "offsets")
+
+    def __init__(self):
+        self.data = bytearray()
+        self.offsets = array.array("Q", [0])
+
+    def append(self, name):
+        self.data += name.encode("utf-8", "surrogateescape")
+        self.offsets.append(len(self.data))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, position):
+        if position < 0:
+            position += len(self)
+        start, end = self.offsets[position], self.offsets[position + 1]
+        return self.data[start:end].decode("utf-8", "surrogateescape")
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    def index(self, name, start=0, end=None):
+        """Return the first position of `name` in ``[start, end)``."""
+        if end is None:
+            end = len(self)
+        encoded = name.encode("utf-8", "surrogateescape")
+        offsets = self.offsets
+        for position in range(start, end):
+            if offsets[position + 1] - offsets[position] == len(encoded):
+                if self.data[offsets[position]:offsets[position + 1]] == encoded:
+                    return position
+        raise ValueError("%r is not in the column" % name)
+
+
+class FileRecord(object):
+    """View of a single row of a `FileTable`."""
+
+    __slots__ = ("table", "position")
+
+    def __init__(self, table, position):
+        self.table = table
+        self.position = position
+
+    @property
+    def dir_id(self):
+        return self.table.dir_ids[self.position]
+
+    @property
+    def name(self):
+        return self.table.names[self.position]
+
+    @property
+    def size(self):
+        return self.table.sizes[self.position]
+
+    @size.setter
+    def size(self, value):
+        self.table.sizes[self.position] = value
+
+    @property
+    def mtime(self):
+        return self.table.mtimes[self.position]
+
+    @mtime.setter
+    def mtime(self, value):
+        self.table.mtimes[self.position] = value
+
+    @property
+    def kind(self):
+        return self.table.flags[self.position] & KIND_MASK
+
+    @property
+    def path(self):
+        return self.table.path(self.position)
+
+    def __eq__(self, other):
+        return (
+            isinstance(other, FileRecord)
+            and other.table is self.table
+            and other.position == self.position
+        )
+
+    def __hash__(self):
+        return hash((id(self.table), self.position))
+
+    def __repr__(self):
+        return "<FileRecord %s>" % self.path
+
+
+class FileTable(object):
+    """Column-oriented table of files below an optional common root."""
+
+    def __init__(self, root=""):
+        self.root = root
+        self.dirs = []
+        self._dir_lookup = {}
+        self.dir_ids = array.array("I")
+        self.names = NameColumn()
+        self.sizes = array.array("q")
+        self.mtimes = array.array("d")
+        self.flags = array.array("B")
+        self.deleted = 0
+
+    def dir_id(self, directory):
+        """Return the id of `directory`, adding it to the table if needed."""
+        dir_id = self._dir_lookup.get(directory)
+        if dir_id is None:
+            dir_id = self._dir_lookup[directory] = len(self.dirs)
+            self.dirs.append(directory)
+        return dir_id
+
+    def find_dir(self, directory):
+        return self._dir_lookup.get(directory)
+
+    def add(self, dir_id, name, size=0, mtime=0.0, kind=0):
+        """Append a file and return its position."""
+        position = len(self.names)
+        self.dir_ids.append(dir_id)
+        self.names.append(name)
+        self.sizes.append(size)
+        self.mtimes.append(mtime)
+        self.flags.append(kind & KIND_MASK)
+        return position
+
+    def remove(self, position):
+        if not self.flags[position] & DELETED:
+            self.flags[position] |= DELETED
+            self.deleted += 1
+
+    def is_deleted(self, position):
+        return bool(self.flags[position] & DELETED)
+
+    def __len__(self):
+        return len(self.names) - self.deleted
+
+    def positions(self):
+        flags = self.flags
+        return (i for i in range(len(flags)) if not flags[i] & DELETED)
+
+    def record(self, position):
+        return FileRecord(self, position)
+
+    def __iter__(self):
+        return (FileRecord(self, i) for i in self.positions())
+
+    def relpath(self, position):
+        return os.path.join(self.dirs[self.dir_ids[position]], self.names[position])
+
+    def path(self, position):
+        if self.root:
+            return os.path.join(
+                self.root, self.dirs[self.dir_ids[position]], self.names[position]
+            )
+        return self.relpath(position)
+
+    def file_list(self, positions=None):
+        """Return a `FileList` of the given positions (default: every file)."""
+        if positions is None:
+            positions = self.positions()
+        return FileList(self, positions)
+
+
+class FileList(collections.abc.MutableSequence):
+    """List of paths backed by a `FileTable`.
+
+    It behaves like a list of path strings, but only stores one integer
+    per file and builds each path when it is accessed. The first change
+    to the list (``append``, ``+=``, ``sort``, ...) turns it into a plain
+    list of paths, so the backing table is never modified.
+    """
+
+    __slots__ = ("table", "positions", "_paths")
+
+    def __init__(self, table, positions=()):
+        self.table = table
+        self.positions = array.array("I", positions)
+        self._paths = None
+
+    def _materialize(self):
+        if self._paths is None:
+            self._paths = list(self)
+        return self._paths
+
+    def __len__(self):
+        if self._paths is not None:
+            return len(self._paths)
+        return len(self.positions)
+
+    def __getitem__(self, item):
+        if self._paths is not None:
+            return self._paths[item]
+        if isinstance(item, slice):
+            return FileList(self.table, self.positions[item])
+        return self.table.path(self.positions[item])
+
+    def __setitem__(self, item, value):
+        self._materialize()[item] = value
+
+    def __delitem__(self, item):
+        del self._materialize()[item]
+
+    def insert(self, index, value):
+        self._materialize().insert(index, value)
+
+    def sort(self, key=None, reverse=False):
+        self._materialize().sort(key=key, reverse=reverse)
+
+    def __iter__(self):
+        if self._paths is not None:
+            return iter(self._paths)
+        path = self.table.path
+        return (path(position) for position in self.positions)
+
+    def __add__(self, other):
+        return list(self) + list(other)
+
+    def __radd__(self, other):
+        return list(other) + list(self)
+
+    def __eq__(self, other):
+        if isinstance(other, collections.abc.Sequence) and not isinstance(other, str):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    def __repr__(self):
+        return "FileList(%r)" % list(self)
+
+    def total_size(self):
+        if self._paths is not None:
+            return sum(os.path.getsize(path) for path in self._paths)
+        sizes = self.table.sizes
+        return sum(sizes[position] for position in self.positions)
@@ -0,0 +1,269 @@
+"""Skip recompiling an installer whose inputs have not changed.
+
+A compile is fingerprinted from the rendered Inno Setup script, every file
+it pulls in through ``Source:`` entries and file-valued [Setup] directives,
+and the compiler itself. Files are compared by size and content hash; their
+mtimes only decide whether a hash from the previous run can be reused, so a
+dist tree rebuilt with identical contents still counts as unchanged.
+
+The builder deletes the dist and output directories before every build,
+so the state and a copy of the last installer are kept in the cache
+directory, keyed by the script's path. `is_current` puts that copy back
+when the inputs match::
+
+    cache = CompileCache("dist/distutils.iss")
+    if not cache.is_current("dist/setup.exe", extra_files=[iscc]):
+        subprocess.check_call([iscc, "dist/distutils.iss"])
+        cache.record("dist/setup.exe")
+
+`ConfigCache` does the same for installers that innosetup_builder
+generates from settings rather than from a script.
+"""
+
+import fnmatch
+import hashlib
+import json
+import os
+import re
+import shutil
+
+from . import cache, manifest
+
+STATE_DIR = "fingerprints"
+
+# [Setup] directives that name a file ISCC reads while compiling
+SETUP_FILE_DIRECTIVES = frozenset(
+    (
+        "infoafterfile",
+        "infobeforefile",
+        "licensefile",
+        "setupiconfile",
+        "wizardimagefile",
+        "wizardsmallimagefile",
+    )
+)
+
+_SOURCE_RE = re.compile(r'(?i)(?:^|;)\s*Source\s*:\s*("(?:[^"]|"")*"|[^;]*)')
+_FLAGS_RE = re.compile(r"(?i)(?:^|;)\s*Flags\s*:\s*([^;]*)")
+
+
+def write_if_changed(filename, data):
+    """Write `data` (bytes) to `filename` unless it already holds exactly that.
+
+    Returns True if the file was written.
+    """
+    try:
+        if os.path.getsize(filename) == len(data):
+            with open(filename, "rb") as fp:
+                if fp.read() == data:
+                    return False
+    except OSError:
+        pass
+    with open(filename, "wb") as fp:
+        fp.write(data)
+    return True
+
+
+def _unquote(value):
+    value = value.strip()
+    if len(value) >= 2 and value[0] == value[-1] == '"':
+        value = value[1:-1].replace('""', '"')
+    return value
+
+
+def _expand(pattern, recurse):
+    directory, name = os.path.split(pattern)
+    if not ("*" in name or "?" in name):
+        return [pattern]
+    matches = []
+    for dirpath, dirnames, filenames in os.walk(directory or os.curdir):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if fnmatch.fnmatch(filename, name):
+                matches.append(os.path.join(dirpath, filename))
+        if not recurse:
+            break
+    return matches
+
+
+def entry_source(line):
+    """Return the unquoted ``Source:`` value of a [Files] entry, or None."""
+    match = _SOURCE_RE.search(line.strip())
+    if match:
+        return _unquote(match.group(1))
+
+
+def script_sources(script, base_dir):
+    """Return the files an Inno Setup script reads, relative to `base_dir`.
+
+    Covers ``Source:`` entries (with wildcards expanded) and file-valued
+    [Setup] directives. Paths that use Inno Setup constants or preprocessor
+    expressions cannot be resolved here and are left to the script text.
+    """
+    section = ""
+    source_dir = base_dir
+    entries = []
+    for line in script.lstrip("\ufeff").splitlines():
+        stripped = line.strip()
+        if not stripped or stripped.startswith((";", "#")):
+            continue
+        if stripped.startswith("[") and "]" in stripped:
+            section = stripped[1 : stripped.index("]")].strip().lower()
+            continue
+        if section == "setup" and "=" in stripped:
+            name, value = stripped.split("=", 1)
+            name = name.strip().lower()
+            if name == "sourcedir":
+                source_dir = os.path.join(base_dir, _unquote(value))
+            elif name in SETUP_FILE_DIRECTIVES:
+                entries.append((_unquote(value), False))
+        elif section == "files":
+            match = _SOURCE_RE.search(stripped)
+            if match:
+                flags = _FLAGS_RE.search(stripped)
+                recurse = bool(flags) and "recursesubdirs" in flags.group(1).lower()
+                entries.append((_unquote(match.group(1)), recurse))
+    sources = []
+    for value, recurse in entries:
+        if "{" in value:
+            continue
+        path = value.replace("\\", os.sep)
+        if not os.path.isabs(path):
+            path = os.path.join(source_dir, path)
+        sources.extend(_expand(os.path.normpath(path), recurse))
+    return sources
+
+
+def state_path(key, cache_dir=None):
+    """The state file of the compile keyed by the path `key`."""
+    key = os.path.normcase(os.path.abspath(key))
+    digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+    return cache.cache_path(STATE_DIR, digest[:32] + ".json", cache_dir=cache_dir)
+
+
+class CompileCache(object):
+    """Fingerprint of the inputs of one installer compile."""
+
+    def __init__(self, issfile, state_file=None, cache_dir=None):
+        self.issfile = issfile
+        self.state_file = state_file or state_path(issfile, cache_dir)
+        # The last installer, which the dist directory does not keep
+        self.kept_output = os.path.splitext(self.state_file)[0] + ".installer"
+        self.state = self._load()
+        self.files = {}
+        self.digest = None
+
+    def _load(self):
+        try:
+            with open(self.state_file, encoding="utf-8") as fp:
+                state = json.load(fp)
+        except (OSError, ValueError):
+            return {}
+        return state if isinstance(state, dict) else {}
+
+    def _file_entry(self, path, previous):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        entry = previous.get(path)
+        if entry and entry[0] == st.st_size and entry[1] == st.st_mtime_ns:
+            return entry
+        return [st.st_size, st.st_mtime_ns, manifest.hash_file(path)[0]]
+
+    def inputs(self):
+        """Return the script as bytes and the files it compiles in."""
+        with open(self.issfile, "rb") as fp:
+            script = fp.read()
+        text = script.decode("utf-8", "replace")
+        base_dir = os.path.dirname(os.path.abspath(self.issfile))
+        return script, script_sources(text, base_dir)
+
+    def fingerprint(self, extra_files=()):
+        """Compute the fingerprint of the script and the files it uses."""
+        script, paths = self.inputs()
+        digest = hashlib.sha256(script)
+        paths = list(paths)
+        paths.extend(os.path.abspath(path) for path in extra_files)
+        previous = self.state.get("files", {})
+        self.files = {}
+        for path in paths:
+            if path in self.files:
+                continue
+            entry = self._file_entry(path, previous)
+            self.files[path] = entry
+            if entry is None:
+                digest.update(("\0%s\0missing" % path).encode("utf-8"))
+            else:
+                digest.update(("\0%s\0%d\0%s" % (path, entry[0], entry[2])).encode("utf-8"))
+        self.digest = digest.hexdigest()
+        return self.digest
+
+    def is_current(self, output, extra_files=()):
+        """True if `output` was last compiled from identical inputs.
+
+        The installer kept from that compile is copied back to `output`,
+        replacing whatever was signed or left there since.
+        """
+        digest = self.fingerprint(extra_files)
+        if (
+            digest != self.state.get("fingerprint")
+            or os.path.abspath(output) != self.state.get("output")
+        ):
+            return False
+        try:
+            if os.path.getsize(self.kept_output) != self.state.get("size"):
+                return False
+            directory = os.path.dirname(os.path.abspath(output))
+            os.makedirs(directory, exist_ok=True)
+            tmp = "%s.%d.tmp" % (output, os.getpid())
+            shutil.copyfile(self.kept_output, tmp)
+            os.replace(tmp, output)
+        except OSError:
+            return False
+        return True
+
+    def record(self, output):
+        """Remember the last computed fingerprint as having produced `output`.
+
+        A copy of `output` is kept with the state.
+        """
+        if self.digest is None:
+            self.fingerprint()
+        tmp = "%s.%d.tmp" % (self.kept_output, os.getpid())
+        shutil.copyfile(output, tmp)
+        os.replace(tmp, self.kept_output)
+        self.state = {
+            "fingerprint": self.digest,
+            "output": os.path.abspath(output),
+            "size": os.path.getsize(self.kept_output),
+            "files": dict((k, v) for k, v in self.files.items() if v is not None),
+        }
+        cache.save_json(self.state_file, self.state)
+
+    def invalidate(self):
+        """Forget the recorded compile, forcing the next one to run."""
+        self.state = {}
+        for path in (self.state_file, self.kept_output):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+class ConfigCache(CompileCache):
+    """Fingerprint of an installer generated from settings, without a script.
+
+    `settings` is text describing everything but the payload, which is the
+    list of files in `sources`. The state is keyed by the installer's path.
+    """
+
+    def __init__(self, output, settings, sources, state_file=None, cache_dir=None):
+        CompileCache.__init__(self, output, state_file, cache_dir)
+        self.settings = settings
+        self.sources = sources
+
+    def inputs(self):
+        return self.settings.encode("utf-8"), [
+            os.path.abspath(path) for path in self.sources
+        ]
@@ -0,0 +1,302 @@
+"""A local SQLite history of builds, for spotting regressions.
+
+Each build records its version, phase timings (from
+`installer_builder.tracing`), installer and update archive sizes, file
+count and the size each package contributes to the dist (see
+`installer_builder.sizereport`). A new build is compared with the median
+of the previous few builds of the same application on the same platform;
+any phase or size that grew past the threshold is reported as a
+`Regression`.
+
+Size budgets are hard limits::
+
+    size_budgets={"installer": 80 * 1024 * 1024, "packages": {"wx": 40 * 1024 * 1024}}
+
+`check_budgets` raises `BudgetExceededError` when a build goes over one.
+"""
+
+import sqlite3
+import statistics
+import time
+
+from . import cache
+
+DEFAULT_WINDOW = 5
+DEFAULT_THRESHOLD = 0.1
+# Ignore growth below these, however large it is relative to the baseline
+MIN_SECONDS = 1.0
+MIN_BYTES = 64 * 1024
+
+SCHEMA_VERSION = 1
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS builds (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    version TEXT,
+    platform TEXT NOT NULL,
+    started REAL NOT NULL,
+    seconds REAL,
+    installer_size INTEGER,
+    update_size INTEGER,
+    files INTEGER,
+    dist_size INTEGER
+);
+CREATE INDEX IF NOT EXISTS builds_by_app ON builds (name, platform, started);
+CREATE TABLE IF NOT EXISTS phases (
+    build_id INTEGER NOT NULL REFERENCES builds (id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    seconds REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS packages (
+    build_id INTEGER NOT NULL REFERENCES builds (id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    size INTEGER NOT NULL
+);
+"""
+
+SIZE_METRICS = ("installer_size", "update_size", "dist_size")
+
+
+class BudgetExceededError(RuntimeError):
+    """A build went over one of its size budgets."""
+
+    def __init__(self, failures):
+        self.failures = failures
+        super(BudgetExceededError, self).__init__(
+            "Size budget exceeded: %s" % "; ".join(failures)
+        )
+
+
+class BuildRecord(object):
+    """The measurements kept for one build."""
+
+    def __init__(
+        self,
+        name,
+        version,
+        platform,
+        started=None,
+        seconds=None,
+        installer_size=None,
+        update_size=None,
+        files=None,
+        dist_size=None,
+        phases=None,
+        packages=None,
+    ):
+        self.name = name
+        self.version = version
+        self.platform = platform
+        if started is None:
+            started = time.time()
+        self.started = started
+        self.seconds = seconds
+        self.installer_size = installer_size
+        self.update_size = update_size
+        self.files = files
+        self.dist_size = dist_size
+        self.phases = dict(phases or {})
+        self.packages = dict(packages or {})
+        self.id = None
+
+    def __repr__(self):
+        return "<BuildRecord %s %s on %s>" % (self.name, self.version, self.platform)
+
+
+class Regression(object):
+    """A measurement that grew past the threshold."""
+
+    def __init__(self, kind, name, baseline, current, unit):
+        self.kind = kind
+        self.name = name
+        self.baseline = baseline
+        self.current = current
+        self.unit = unit
+
+    @property
+    def ratio(self):
+        return self.current / self.baseline if self.baseline else float("inf")
+
+    def __str__(self):
+        from . import format_filesize
+
+        if self.unit == "bytes":
+            values = (format_filesize(self.baseline), format_filesize(self.current))
+        else:
+            values = ("%.1fs" % self.baseline, "%.1fs" % self.current)
+        return "%s %s grew from %s to %s (+%.0f%%)" % (
+            self.kind,
+            self.name,
+            values[0],
+            values[1],
+            (self.ratio - 1) * 100,
+        )
+
+
+class BuildHistory(object):
+    """Builds recorded in a SQLite database."""
+
+    def __init__(self, filename=None):
+        if filename is None:
+            filename = cache.cache_path("history.sqlite")
+        self.filename = filename
+        self.db = sqlite3.connect(filename)
+        self.db.execute("PRAGMA foreign_keys = ON")
+        if self.db.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+            self.db.executescript(SCHEMA)
+            self.db.execute("PRAGMA user_version = %d" % SCHEMA_VERSION)
+            self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def record(self, build):
+        """Store `build` and return its id."""
+        with self.db:
+            cursor = self.db.execute(
+                "INSERT INTO builds (name, version, platform, started, seconds,"
+                " installer_size, update_size, files, dist_size)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    build.name,
+                    build.version,
+                    build.platform,
+                    build.started,
+                    build.seconds,
+                    build.installer_size,
+                    build.update_size,
+                    build.files,
+                    build.dist_size,
+                ),
+            )
+            build.id = cursor.lastrowid
+            self.db.executemany(
+                "INSERT INTO phases (build_id, name, seconds) VALUES (?, ?, ?)",
+                [(build.id, name, seconds) for name, seconds in build.phases.items()],
+            )
+            self.db.executemany(
+                "INSERT INTO packages (build_id, name, size) VALUES (?, ?, ?)",
+                [(build.id, name, size) for name, size in build.packages.items()],
+            )
+        return build.id
+
+    def recent(self, name, platform, limit=DEFAULT_WINDOW, before=None):
+        """Return up to `limit` of the latest builds, newest first."""
+        query = "SELECT * FROM builds WHERE name = ? AND platform = ?"
+        params = [name, platform]
+        if before is not None:
+            query += " AND id < ?"
+            params.append(before)
+        query += " ORDER BY started DESC, id DESC LIMIT ?"
+        params.append(limit)
+        cursor = self.db.execute(query, params)
+        columns = [c[0] for c in cursor.description]
+        builds = []
+        for row in cursor.fetchall():
+            values = dict(zip(columns, row))
+            build_id = values.pop("id")
+            build = BuildRecord(**values)
+            build.id = build_id
+            build.phases = dict(
+                self.db.execute(
+                    "SELECT name, seconds FROM phases WHERE build_id = ?", (build_id,)
+                )
+            )
+            build.packages = dict(
+                self.db.execute(
+                    "SELECT name, size FROM packages WHERE build_id = ?", (build_id,)
+                )
+            )
+            builds.append(build)
+        return builds
+
+    def baseline(self, name, platform, window=DEFAULT_WINDOW, before=None):
+        """The median of each measurement over the previous `window` builds.
+
+        Returns None when there is no earlier build.
+        """
+        builds = self.recent(name, platform, window, before)
+        if not builds:
+            return None
+        baseline = BuildRecord(name, None, platform)
+        for metric in ("seconds",) + SIZE_METRICS:
+            values = [
+                getattr(b, metric) for b in builds if getattr(b, metric) is not None
+            ]
+            setattr(baseline, metric, statistics.median(values) if values else None)
+        for attribute in ("phases", "packages"):
+            values = {}
+            for build in builds:
+                for key, value in getattr(build, attribute).items():
+                    values.setdefault(key, []).append(value)
+            setattr(
+                baseline,
+                attribute,
+                dict((key, statistics.median(v)) for key, v in values.items()),
+            )
+        return baseline
+
+
+def _grew(baseline, current, threshold, minimum):
+    if baseline is None or current is None:
+        return False
+    return current - baseline >= minimum and current > baseline * (1 + threshold)
+
+
+def compare(build, baseline, threshold=DEFAULT_THRESHOLD):
+    """Return the `Regression` of every measurement of `build` that grew."""
+    if baseline is None:
+        return []
+    regressions = []
+    if _grew(baseline.seconds, build.seconds, threshold, MIN_SECONDS):
+        regressions.append(
+            Regression("build", "time", baseline.seconds, build.seconds, "seconds")
+        )
+    for metric in SIZE_METRICS:
+        old, new = getattr(baseline, metric), getattr(build, metric)
+        if _grew(old, new, threshold, MIN_BYTES):
+            regressions.append(
+                Regression("size", metric.replace("_size", ""), old, new, "bytes")
+            )
+    for name, seconds in sorted(build.phases.items()):
+        old = baseline.phases.get(name)
+        if _grew(old, seconds, threshold, MIN_SECONDS):
+            regressions.append(Regression("phase", name, old, seconds, "seconds"))
+    for name, size in sorted(build.packages.items()):
+        old = baseline.packages.get(name)
+        if _grew(old, size, threshold, MIN_BYTES):
+            regressions.append(Regression("package", name, old, size, "bytes"))
+    return regressions
+
+
+def check_budgets(build, budgets):
+    """Raise `BudgetExceededError` if `build` is over any of `budgets`."""
+    from . import format_filesize
+
+    if not budgets:
+        return
+    limits = []
+    for key, limit in sorted(budgets.items()):
+        if key == "packages":
+            continue
+        if key + "_size" not in SIZE_METRICS:
+            raise ValueError("Unknown size budget %r" % key)
+        limits.append((key, getattr(build, key + "_size"), limit))
+    limits += [
+        ("package %s" % name, build.packages.get(name), limit)
+        for name, limit in sorted(budgets.get("packages", {}).items())
+    ]
+    failures = [
+        "%s is %s, over its budget of %s"
+        % (name, format_filesize(size), format_filesize(limit))
+        for name, size, limit in limits
+        if size is not None and size > limit
+    ]
+    if failures:
+        raise BudgetExceededError(failures)
@@ -0,0 +1,358 @@
+"""Find bundled modules the application never imports.
+
+py2exe and py2app bundle everything their module finders can reach, which
+is a lot more than the application imports when it runs. This module:
+
+1. **records** the modules a run of the application actually loads. The
+   main module (or a scenario script that drives the application) runs in a
+   child interpreter under an import audit hook, and every module is
+   written to a trace file once the next import or a background sweep
+   (every `FLUSH_INTERVAL` seconds) sees it loaded, so a GUI that has to be
+   killed after a timeout still leaves a complete trace
+2. **compares** the trace with a built dist and emits the smallest exclude
+   list that removes every bundled module the run did not load
+3. **validates** a trimmed build: every module the run imported must still
+   be in the bundle, and can optionally be imported from it
+
+From the command line::
+
+    python -m installer_builder.importtrace record imports.txt main.py --timeout 60
+    python -m installer_builder.importtrace excludes imports.txt dist -o excludes.txt
+    python -m installer_builder.importtrace validate imports.txt dist --import-check
+
+The generated list is passed to the builder with
+``excludes=importtrace.load_modules("excludes.txt")``, and
+``import_trace="imports.txt"`` makes every build validate itself against
+the trace.
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import zipfile
+
+from . import distindex, runner, sizereport
+
+# Loaded by the frozen application's own bootstrap, before anything could
+# be traced
+ALWAYS_KEEP = (
+    "__main__",
+    "_memimporter",
+    "boot_common",
+    "codecs",
+    "encodings",
+    "importlib",
+    "io",
+    "zipextimporter",
+    "zipimport",
+)
+
+STARTUP_PREFIX = "="
+IMPORT_PREFIX = "+"
+FLUSH_INTERVAL = 0.2
+
+# Runs in the traced interpreter, so it must not import anything itself:
+# whatever it imported would be recorded as used by the application.
+RECORDER = r"""
+import _thread, atexit, sys, time
+def _record_imports(output, script, argv):
+    seen = set()
+    trace = open(output, "w")
+    def record(prefix, name):
+        if name not in seen:
+            seen.add(name)
+            trace.write(prefix + name + "\n")
+            trace.flush()
+    for name in list(sys.modules):
+        record(%(startup)r, name)
+    # The audit event comes before the module is found, so a name is only
+    # recorded once a later event, a sweep or exit shows the import
+    # succeeded. The sweep covers a run that is killed (skipping atexit)
+    # right after its last import.
+    pending = []
+    lock = _thread.allocate_lock()
+    def confirm():
+        with lock:
+            for name in pending:
+                if name in sys.modules:
+                    record(%(imported)r, name)
+            del pending[:]
+    def hook(event, args):
+        if event == "import":
+            confirm()
+            with lock:
+                pending.append(args[0])
+    def sweep():
+        while True:
+            time.sleep(%(interval)r)
+            confirm()
+    sys.addaudithook(hook)
+    atexit.register(confirm)
+    _thread.start_new_thread(sweep, ())
+    sys.argv = [script] + argv
+    sys.path[0] = script.rpartition(%(sep)r)[0] or "."
+    with open(script, "rb") as fp:
+        code = compile(fp.read(), script, "exec")
+    main = {"__name__": "__main__", "__file__": script, "__builtins__": __builtins__}
+    exec(code, main)
+_record_imports(sys.argv[1], sys.argv[2], sys.argv[3:])
+""" % {
+    "startup": STARTUP_PREFIX,
+    "imported": IMPORT_PREFIX,
+    "interval": FLUSH_INTERVAL,
+    "sep": os.sep,
+}
+
+CHECKER = r"""
+import importlib, json, sys
+with open(sys.argv[1]) as fp:
+    request = json.load(fp)
+sys.path[:] = request["path"]
+failures = {}
+for name in request["modules"]:
+    try:
+        importlib.import_module(name)
+    except BaseException as e:
+        failures[name] = "%s: %s" % (type(e).__name__, e)
+with open(sys.argv[1], "w") as fp:
+    json.dump(failures, fp)
+"""
+
+
+class ImportTrace(object):
+    """Modules seen by a recorded run, and the order they were loaded in."""
+
+    def __init__(self, startup=(), imported=()):
+        self.startup = set(startup)
+        self.imported = set(imported)
+        self.order = list(startup) + list(imported)
+
+    @property
+    def modules(self):
+        return self.startup | self.imported
+
+    @classmethod
+    def load(cls, filename):
+        trace = cls()
+        with open(filename) as fp:
+            for line in fp:
+                line = line.strip()
+                if line.startswith(STARTUP_PREFIX):
+                    trace.startup.add(line[len(STARTUP_PREFIX):])
+                    trace.order.append(line[len(STARTUP_PREFIX):])
+                elif line.startswith(IMPORT_PREFIX):
+                    trace.imported.add(line[len(IMPORT_PREFIX):])
+                    trace.order.append(line[len(IMPORT_PREFIX):])
+        return trace
+
+
+def record(
+    script, output, argv=(), python=sys.executable, timeout=None, cwd=None, env=None
+):
+    """Run `script` under the import recorder, writing the trace to `output`.
+
+    With a `timeout` the application is killed when it expires, which is
+    the normal way to end a GUI run. Returns the loaded `ImportTrace`.
+    """
+    result = runner.run(
+        [python, "-c", RECORDER, os.path.abspath(output), os.path.abspath(script)]
+        + list(argv),
+        timeout=timeout,
+        check=False,
+        cwd=cwd,
+        env=env,
+        label="importtrace",
+    )
+    if not os.path.exists(output):
+        raise RuntimeError("The import recorder did not start: %s" % result.display)
+    if not result.ok and not result.timed_out:
+        print(
+            "Warning: %s exited with status %s; the trace may be incomplete"
+            % (script, result.returncode)
+        )
+    return ImportTrace.load(output)
+
+
+def zip_member_module(name):
+    """The dotted module a zip member holds, or None if it is not a module."""
+    parts = [p for p in name.split("/") if p and p != "__pycache__"]
+    if not parts or not sizereport.MODULE_EXTENSION.search(parts[-1]):
+        return None
+    dotted = sizereport.module_owner(parts)[2]
+    if dotted.endswith(".__init__"):
+        dotted = dotted[: -len(".__init__")]
+    return dotted
+
+
+def _add_module(modules, filename, dotted):
+    if not sizereport.MODULE_EXTENSION.search(filename):
+        return
+    if dotted.endswith(".__init__"):
+        dotted = dotted[: -len(".__init__")]
+    modules.add(dotted)
+
+
+def bundled_modules(files):
+    """Return the dotted names of every module in a dist.
+
+    `files` yields ``(relative path, path, size)`` tuples as produced by
+    `installer_builder.distindex.DistIndex.iter_tree`.
+    """
+    modules = set()
+    for relpath, path, size in files:
+        if relpath.lower().endswith(".zip") and zipfile.is_zipfile(path):
+            with zipfile.ZipFile(path) as archive:
+                for name in archive.namelist():
+                    module = zip_member_module(name)
+                    if module is not None:
+                        modules.add(module)
+            continue
+        dotted = sizereport.classify_path(relpath)[2]
+        if dotted is not None:
+            _add_module(modules, relpath, dotted)
+    return modules
+
+
+def _with_parents(names):
+    result = set()
+    for name in names:
+        parts = name.split(".")
+        for i in range(1, len(parts) + 1):
+            result.add(".".join(parts[:i]))
+    return result
+
+
+def unused_modules(bundled, trace, keep=ALWAYS_KEEP):
+    """The fewest module names whose exclusion drops everything unused.
+
+    A package is listed instead of its submodules when nothing in it was
+    imported. Modules in `keep`, and their submodules, are never listed.
+    """
+    used = _with_parents(trace.modules)
+    kept = tuple(keep)
+    kept_packages = tuple(name + "." for name in kept)
+    excludes = []
+    for name in sorted(_with_parents(bundled)):
+        if name in used or name in kept or name.startswith(kept_packages):
+            continue
+        parent = name.rpartition(".")[0]
+        if not parent or parent in used or parent in kept:
+            excludes.append(name)
+    return excludes
+
+
+def missing_modules(bundled, trace):
+    """Modules the run imported that are not in the bundle.
+
+    Built-in modules and namespace packages (bundled only through their
+    submodules) count as present.
+    """
+    present = _with_parents(bundled) | set(sys.builtin_module_names)
+    return sorted(name for name in trace.imported if name not in present)
+
+
+def bundle_path(files, root):
+    """The ``sys.path`` a frozen application would use for the dist at `root`."""
+    path = [root]
+    for relpath, full_path, size in files:
+        directory = os.path.dirname(full_path)
+        if relpath.lower().endswith(".zip"):
+            path.append(full_path)
+        elif sizereport.LIBRARY_DIRS.match(os.path.basename(directory)):
+            path.append(directory)
+    return list(dict.fromkeys(path))
+
+
+def check_imports(modules, path, python=sys.executable, timeout=None):
+    """Import `modules` from `path` only, in an isolated interpreter.
+
+    Returns ``{module: error}`` for every module that failed. The
+    interpreter must be the version the bundle was built with.
+    """
+    fd, request = tempfile.mkstemp(suffix=".json")
+    try:
+        with os.fdopen(fd, "w") as fp:
+            json.dump({"modules": sorted(modules), "path": path}, fp)
+        runner.run(
+            [python, "-I", "-S", "-c", CHECKER, request],
+            timeout=timeout,
+            echo=False,
+            label="importcheck",
+        )
+        with open(request) as fp:
+            return json.load(fp)
+    finally:
+        os.remove(request)
+
+
+def load_modules(filename):
+    """Read a module list written by ``excludes``, skipping comments."""
+    with open(filename) as fp:
+        return [
+            line.strip() for line in fp if line.strip() and not line.startswith("#")
+        ]
+
+
+def dist_files(dist):
+    return list(distindex.get_index(dist).iter_tree())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    record_parser = commands.add_parser("record", help="trace an application run")
+    record_parser.add_argument("trace")
+    record_parser.add_argument("script")
+    record_parser.add_argument("args", nargs=argparse.REMAINDER)
+    record_parser.add_argument("--timeout", type=float)
+    record_parser.add_argument("--python", default=sys.executable)
+    excludes_parser = commands.add_parser("excludes", help="list unused modules")
+    excludes_parser.add_argument("trace")
+    excludes_parser.add_argument("dist")
+    excludes_parser.add_argument("-o", "--output")
+    validate_parser = commands.add_parser("validate", help="check a trimmed build")
+    validate_parser.add_argument("trace")
+    validate_parser.add_argument("dist")
+    validate_parser.add_argument("--import-check", action="store_true")
+    validate_parser.add_argument("--python", default=sys.executable)
+    args = parser.parse_args(argv)
+
+    if args.command == "record":
+        trace = record(
+            args.script, args.trace, args.args, python=args.python, timeout=args.timeout
+        )
+        print("Recorded %d modules" % len(trace.modules))
+        return 0
+    trace = ImportTrace.load(args.trace)
+    files = dist_files(args.dist)
+    bundled = bundled_modules(files)
+    if args.command == "excludes":
+        excludes = unused_modules(bundled, trace)
+        text = "# %d of %d bundled modules were not imported\n%s\n" % (
+            len(excludes),
+            len(bundled),
+            "\n".join(excludes),
+        )
+        if args.output:
+            with open(args.output, "w") as fp:
+                fp.write(text)
+        else:
+            sys.stdout.write(text)
+        return 0
+    missing = missing_modules(bundled, trace)
+    for name in missing:
+        print("Missing from the bundle: %s" % name)
+    failures = {}
+    if args.import_check:
+        failures = check_imports(
+            trace.imported, bundle_path(files, args.dist), python=args.python
+        )
+        for name, error in sorted(failures.items()):
+            print("Cannot import %s: %s" % (name, error))
+    return 1 if missing or failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -168,9 +168,12 @@ History
 from __future__ import absolute_import, print_function
 import distutils.command
 import distutils.core
+import distutils.errors
 
+import array
 import ctypes
 import io
+import itertools
 import os
 import platform
 import re
@@ -192,7 +195,18 @@ from py2exe.distutils_buildexe import py2exe
 import py2exe
 
 
-from . import signtool
+from . import (
+    compression,
+    distindex,
+    fingerprint,
+    format_filesize,
+    languages,
+    libzip,
+    runner,
+    signtool,
+    toolchain,
+    tracing,
+)
 
 RT_MANIFEST = 24
 
@@ -397,8 +411,11 @@ class IssFile(io.TextIOWrapper):
     ]
 
     def __init__(self, filename, mode='w', encoding='utf-8'):
-        # Open a buffered binary file and wrap it
-        binary_file = open(filename, mode.replace('t', '') + 'b')
+        # Open a buffered binary file (or use the given stream) and wrap it
+        if isinstance(filename, str):
+            binary_file = open(filename, mode.replace('t', '') + 'b')
+        else:
+            binary_file = filename
         super().__init__(binary_file, encoding=encoding)
         # Write BOM for better compatibility with Inno Setup
         if 'w' in mode and encoding.lower() == 'utf-8':
@@ -466,10 +483,13 @@ class InnoScript(object):
         ".pyd",
     )
     iss_metadata = {}
+    nocompression_size = 0
 
     def __init__(self, dist_dir, metadata, inno_script, inno_setup_exe=None, 
                  bundle_vcr=True, register_startup=False, zip_option=False, 
-                 extra_inno_script=None):
+                 extra_inno_script=None, compression_profile=None,
+                 force=False, issfile=None, output_base_filename=None,
+                 languages=None, exclude=None):
         """Initialize the InnoScript with the necessary parameters.
         
         Args:
@@ -481,13 +501,27 @@ class InnoScript(object):
             register_startup: Whether to register the app to run at startup
             zip_option: Whether to zip the setup file (True/False or filename)
             extra_inno_script: Additional Inno Setup script content
+            compression_profile: Name of a profile from
+                compression.COMPRESSION_PROFILES, or None for metadata_map
+            force: Run ISCC even if the script and its files are unchanged
+            issfile: Where to write the script (default dist_dir/distutils.iss)
+            output_base_filename: Installer name without extension
+            languages: Language names to include when the script has no
+                [Languages] section (default: every installed language)
+            exclude: Files in dist_dir that are not part of the payload
         """
         self.dist_dir = dist_dir
         self._metadata = metadata
-        self.issfile = os.path.join(dist_dir, "distutils.iss")
+        self.issfile = issfile or os.path.join(dist_dir, "distutils.iss")
         self.bundle_vcr = bundle_vcr
         self.register_startup = register_startup
         self.zip_option = zip_option
+        self.compression_profile = compression_profile
+        self.force = force
+        self.output_base_filename = output_base_filename
+        self.languages = languages
+        self.exclude = exclude or []
+        self.compile_cache = fingerprint.CompileCache(self.issfile)
         
         # Handle inno_script (file path or content)
         if os.path.isfile(inno_script):
@@ -523,7 +557,7 @@ class InnoScript(object):
     def chop(self, filename, dirname=""):
         """get relative path"""
         if not dirname:
-            dirname = self.builder.dist_dir
+            dirname = self.dist_dir
         if dirname[-1] not in "\\/":
             dirname += "\\"
         if filename.startswith(dirname):
@@ -533,44 +567,66 @@ class InnoScript(object):
         return filename
 
     def _scan_dist_dir(self):
-        """Scan the dist directory to categorize files."""
-        results = {
-            'executables': [],
-            'windows_exes': [],
-            'com_servers': [],
-            'services': [],
-            'dlls': [],
-            'data_files': [],
-            'lib_files': [],
-            'other': [],
-        }
-        
-        # Walk through the dist directory
-        for root, dirs, files in os.walk(self.dist_dir):
-            for fname in files:
-                fpath = os.path.join(root, fname)
-                ext = os.path.splitext(fname)[1].lower()
-                
-                if ext == '.exe':
-                    results['executables'].append(fpath)
-                    # Try to determine the type of executable
-                    # This is a simplistic approach - in a real implementation
-                    # we would need more information from py2exe
-                    if 'w' in fname.lower() or 'win' in fname.lower():
-                        results['windows_exes'].append(fpath)
-                elif ext in ('.dll', '.pyd'):
-                    results['dlls'].append(fpath)
-                    # Check if it's a COM server DLL
-                    if 'com' in fname.lower():
-                        results['com_servers'].append(fpath)
-                    # Check if it's a service DLL
-                    elif 'service' in fname.lower():
-                        results['services'].append(fpath)
-                else:
-                    # Basic categorization for other files
-                    results['data_files'].append(fpath)
-                    
-        return results
+        """Scan the dist directory to categorize files.
+
+        Each category is a `FileList` of positions in the shared dist index,
+        so no path strings are kept around for large trees.
+        """
+        categories = (
+            'executables',
+            'windows_exes',
+            'com_servers',
+            'services',
+            'dlls',
+            'data_files',
+            'lib_files',
+            'other',
+        )
+        positions = dict((name, array.array('I')) for name in categories)
+
+        # The script and the last installer live in dist_dir too, but are
+        # build outputs rather than part of the payload
+        build_files = [self.issfile]
+        build_files.extend(self.exclude)
+        previous_output = self.compile_cache.state.get("output")
+        if previous_output:
+            build_files.extend((previous_output, previous_output + ".zip"))
+        build_files = set(os.path.normcase(os.path.abspath(f)) for f in build_files)
+        build_names = set(os.path.basename(f) for f in build_files)
+
+        # Query the shared dist index rather than walking the tree again
+        index = distindex.get_index(self.dist_dir)
+        for entry in index:
+            fname = entry.name.lower()
+            position = entry.position
+            if (
+                os.path.normcase(entry.name) in build_names
+                and os.path.normcase(os.path.abspath(index.path(entry))) in build_files
+            ):
+                continue
+
+            if entry.kind == distindex.KIND_EXE:
+                positions['executables'].append(position)
+                # Try to determine the type of executable
+                # This is a simplistic approach - in a real implementation
+                # we would need more information from py2exe
+                if 'w' in fname or 'win' in fname:
+                    positions['windows_exes'].append(position)
+            elif entry.kind == distindex.KIND_DLL:
+                positions['dlls'].append(position)
+                # Check if it's a COM server DLL
+                if 'com' in fname:
+                    positions['com_servers'].append(position)
+                # Check if it's a service DLL
+                elif 'service' in fname:
+                    positions['services'].append(position)
+            else:
+                # Basic categorization for other files
+                positions['data_files'].append(position)
+
+        return dict(
+            (name, index.table.file_list(positions[name])) for name in categories
+        )
 
     @property
     def metadata(self):
@@ -608,37 +664,22 @@ class InnoScript(object):
         """Find the Inno Setup compiler executable."""
         if self._inno_setup_exe and os.path.isfile(self._inno_setup_exe):
             return self._inno_setup_exe
-            
-        # Try registry (prefer 64-bit view first)
-        keys_to_try = [
-            (winreg.HKEY_LOCAL_MACHINE, r"SOFTWARE\Microsoft\Windows\CurrentVersion\Uninstall\Inno Setup 6_is1", winreg.KEY_READ | winreg.KEY_WOW64_64KEY),
-            (winreg.HKEY_LOCAL_MACHINE, r"SOFTWARE\Wow6432Node\Microsoft\Windows\CurrentVersion\Uninstall\Inno Setup 6_is1", winreg.KEY_READ | winreg.KEY_WOW64_32KEY),
-            (winreg.HKEY_CURRENT_USER, r"SOFTWARE\Microsoft\Windows\CurrentVersion\Uninstall\Inno Setup 6_is1", winreg.KEY_READ | winreg.KEY_WOW64_64KEY),
-            (winreg.HKEY_CURRENT_USER, r"SOFTWARE\Wow6432Node\Microsoft\Windows\CurrentVersion\Uninstall\Inno Setup 6_is1", winreg.KEY_READ | winreg.KEY_WOW64_32KEY),
-        ]
-        
-        for root, key, flags in keys_to_try:
-            try:
-                with winreg.OpenKey(root, key, 0, flags) as handle:
-                    install_location, _ = winreg.QueryValueEx(handle, "InstallLocation")
-                    if install_location:
-                        iscc_path = os.path.join(install_location, "ISCC.exe")
-                        if os.path.isfile(iscc_path):
-                            return iscc_path
-            except OSError:
-                continue
-
-        # Try default Program Files locations
-        for pf_var in ["ProgramFiles", "ProgramFiles(x86)"]:
-            pf_path = os.environ.get(pf_var)
-            if pf_path:
-                iscc_path = os.path.join(pf_path, "Inno Setup 6", "ISCC.exe")
-                if os.path.isfile(iscc_path):
-                    return iscc_path
-                    
+        tool = toolchain.get_toolchain().resolve("iscc")
+        if tool is not None:
+            return tool.path
         # Last resort - just return the filename and hope it's in PATH
         return "ISCC.exe"
 
+    @property
+    def iscc_command(self):
+        """argv prefix that runs the compiler (a stand-in in fake mode)."""
+        if self._inno_setup_exe and os.path.isfile(self._inno_setup_exe):
+            return [self._inno_setup_exe]
+        tool = toolchain.get_toolchain().resolve("iscc")
+        if tool is not None:
+            return list(tool.argv)
+        return ["ISCC.exe"]
+
     @property
     def msvcfiles(self):
         """Get MSVC runtime files if needed.
@@ -689,8 +730,14 @@ class InnoScript(object):
         metadata = self.metadata
         iss_metadata = dict((k, v % metadata)
                             for k, v in self.metadata_map.items())
-        iss_metadata["OutputDir"] = self.builder.dist_dir
+        iss_metadata["OutputDir"] = self.dist_dir
         iss_metadata["AppId"] = self.appid
+        if self.output_base_filename:
+            iss_metadata["OutputBaseFilename"] = self.output_base_filename
+        if self.compression_profile:
+            iss_metadata.update(
+                compression.profile_directives(self.compression_profile)
+            )
         # add InfoBeforeFile
         for filename in (
             "README",
@@ -764,36 +811,48 @@ class InnoScript(object):
         excludes.extend(findfiles(files, "w9xpopen.exe"))
 
         # Add all files from the dist directory
-        files.extend(self.created_files.get('executables', []))
-        files.extend(self.created_files.get('dlls', []))
-        files.extend(self.created_files.get('data_files', []))
-        
+        files = [
+            files,
+            self.created_files.get('executables', []),
+            self.created_files.get('dlls', []),
+            self.created_files.get('data_files', []),
+        ]
+
         # Handle Tkinter if present
         if os.path.exists(os.path.join(self.dist_dir, "tcl")):
             tcl_dst_dir = os.path.join(self.dist_dir, "tcl")
-            files.append(tcl_dst_dir)
+            files.append([tcl_dst_dir])
 
+        user_lines = "".join(lines)
         stored = set()
-        for filename in files:
+        nocompression_count = 0
+        self.nocompression_size = 0
+        for filename in itertools.chain.from_iterable(files):
             if filename in excludes:
                 continue
             relname = self.chop(filename)
             # user operation given or already wrote
-            if relname in "".join(lines) or relname in stored:
+            if relname in user_lines or relname in stored:
                 continue
 
             flags = list(self.default_flags)
             place = ""
+            extraargs = {}
 
             if os.path.isfile(filename):
                 if os.path.splitext(relname)[1].lower() in self.bin_exts:
                     flags.append("restartreplace")
                     flags.append("uninsrestartdelete")
 
+                # Don't make ISCC recompress media and archives
+                size = os.path.getsize(filename)
+                if compression.is_incompressible(filename, size):
+                    flags.append("nocompression")
+                    nocompression_count += 1
+                    self.nocompression_size += size
+
                 if filename.startswith(self.dist_dir):
                     place = os.path.dirname(relname)
-
-                extraargs = {}
             else:  # isdir
                 if filename.startswith(self.dist_dir):
                     place = relname
@@ -808,6 +867,11 @@ class InnoScript(object):
             )
             stored.add(relname)
 
+        if nocompression_count:
+            print(
+                "%d already compressed files (%s) will be stored without compression"
+                % (nocompression_count, format_filesize(self.nocompression_size))
+            )
         self.handle_iss(lines, fp)
 
     def _iter_bin_files(self, category, lines=[]):
@@ -994,23 +1058,25 @@ class InnoScript(object):
             return
 
         innopath = os.path.dirname(self.innoexepath)
-        for root, dirs, files in os.walk(innopath):
-            for basename in files:
-                if not basename.lower().endswith(".isl"):
-                    continue
-                filename = self.chop(os.path.join(root, basename), innopath)
-                fp.issline(
-                    Name=os.path.splitext(basename)[0],
-                    MessagesFile="compiler:%s" % filename,
-                )
+        catalog = languages.language_catalog(innopath)
+        for name, filename in languages.select_languages(catalog, self.languages):
+            fp.issline(
+                Name=name,
+                MessagesFile="compiler:%s" % filename,
+            )
 
     def handle_iss_code(self, lines, fp):
         self.handle_iss(lines, fp)
         fp.write(DEFAULT_CODES)
 
     def create(self):
-        """Create the Inno Setup script file."""
-        fp = IssFile(self.issfile, "wt")
+        """Create the Inno Setup script file.
+
+        The script is rendered in memory and only written if it differs from
+        the one on disk, so an unchanged script keeps its mtime.
+        """
+        buffer = io.BytesIO()
+        fp = IssFile(buffer, "wt")
         fp.write('; This file is created by py2exe InnoSetup extension.\n')
 
         # write "#define CONSTANT value"
@@ -1048,16 +1114,33 @@ class InnoScript(object):
                 handler([], fp)
                 fp.write("\n")
 
+        fp.flush()
+        if not fingerprint.write_if_changed(self.issfile, buffer.getvalue()):
+            print(f"{self.issfile} is unchanged")
+
     def compile_script(self):
-        """Compile the Inno Setup script into an installer."""
-        try:
-            subprocess.check_call([self.innoexepath, self.issfile])
-        except (WindowsError, subprocess.CalledProcessError) as e:
-            raise EnvironmentError(
-                f"Failed to compile the installer: {e}\n"
-                "Please ensure InnoSetup 6+ is installed correctly."
-            )
+        """Compile the Inno Setup script into an installer.
+
+        ISCC is skipped when the script, every file it references and the
+        compiler are identical to the last compile and its installer still
+        exists.
+        """
         setupfile = self.setup_file_path
+        innoexepath = self.innoexepath
+        tools = [innoexepath] if os.path.isfile(innoexepath) else []
+        if not self.force and self.compile_cache.is_current(setupfile, tools):
+            print(f"Installer is up to date, skipping ISCC: {setupfile}")
+        else:
+            try:
+                with tracing.span("iscc", script=self.issfile):
+                    runner.run(self.iscc_command + [self.issfile])
+            except (WindowsError, subprocess.CalledProcessError) as e:
+                self.compile_cache.invalidate()
+                raise EnvironmentError(
+                    f"Failed to compile the installer: {e}\n"
+                    "Please ensure InnoSetup 6+ is installed correctly."
+                )
+            self.compile_cache.record(setupfile)
 
         # zip the setup file if requested
         if self.zip_option:
@@ -1105,9 +1188,18 @@ class innosetup(distutils.core.Command):
         ("zip=", None, "zip the setup file (True/False or filename)"),
         ("register-startup=", None, "register application to run at startup"),
         ("dist-dir=", "d", "directory to put final built distributions in"),
+        ("compression-profile=", None,
+         "compression profile: fast-dev, balanced or max-ratio"),
+        ("force", "f",
+         "compile the installer even if its script and files are unchanged"),
+        ("languages=", None,
+         "comma separated Inno Setup languages to include (default: all)"),
+        ("library-order=", None,
+         "import trace of app startup to reorder library.zip by"),
+        ("library-store", None, "store library.zip members uncompressed"),
     ]
     
-    boolean_options = ["bundle_vcr", "zip", "register_startup"]
+    boolean_options = ["bundle_vcr", "zip", "register_startup", "force", "library_store"]
 
     def initialize_options(self):
         """Initialize command options."""
@@ -1121,6 +1213,13 @@ class innosetup(distutils.core.Command):
         self.zip = False
         self.register_startup = False
         self.dist_dir = None
+        self.compression_profile = None
+        self.force = False
+        self.languages = None
+        self.library_order = None
+        self.library_store = False
+        # A callable, so only set through setup() options
+        self.frozen_dist_hook = None
         
     def finalize_options(self):
         """Finalize command options."""
@@ -1148,45 +1247,37 @@ class innosetup(distutils.core.Command):
         if isinstance(self.extra_sign, str):
             self.extra_sign = [self.extra_sign]
 
+        self.languages = languages.parse_languages(self.languages)
+
+        if (
+            self.compression_profile
+            and self.compression_profile not in compression.COMPRESSION_PROFILES
+        ):
+            raise distutils.errors.DistutilsOptionError(
+                "compression-profile must be one of %s"
+                % ", ".join(compression.PROFILE_NAMES)
+            )
+
     def _find_inno_setup(self):
         """Find the Inno Setup compiler."""
         if self.inno_setup_exe and os.path.isfile(self.inno_setup_exe):
             return self.inno_setup_exe
-            
-        # Try registry (prefer 64-bit view first)
-        keys_to_try = [
-            (winreg.HKEY_LOCAL_MACHINE, r"SOFTWARE\Microsoft\Windows\CurrentVersion\Uninstall\Inno Setup 6_is1", winreg.KEY_READ | winreg.KEY_WOW64_64KEY),
-            (winreg.HKEY_LOCAL_MACHINE, r"SOFTWARE\Wow6432Node\Microsoft\Windows\CurrentVersion\Uninstall\Inno Setup 6_is1", winreg.KEY_READ | winreg.KEY_WOW64_32KEY),
-            (winreg.HKEY_CURRENT_USER, r"SOFTWARE\Microsoft\Windows\CurrentVersion\Uninstall\Inno Setup 6_is1", winreg.KEY_READ | winreg.KEY_WOW64_64KEY),
-            (winreg.HKEY_CURRENT_USER, r"SOFTWARE\Wow6432Node\Microsoft\Windows\CurrentVersion\Uninstall\Inno Setup 6_is1", winreg.KEY_READ | winreg.KEY_WOW64_32KEY),
-        ]
-        
-        for root, key, flags in keys_to_try:
-            try:
-                with winreg.OpenKey(root, key, 0, flags) as handle:
-                    install_location, _ = winreg.QueryValueEx(handle, "InstallLocation")
-                    if install_location:
-                        iscc_path = os.path.join(install_location, "ISCC.exe")
-                        if os.path.isfile(iscc_path):
-                            return iscc_path
-            except OSError:
-                continue
-
-        # Try default Program Files locations
-        for pf_var in ["ProgramFiles", "ProgramFiles(x86)"]:
-            pf_path = os.environ.get(pf_var)
-            if pf_path:
-                iscc_path = os.path.join(pf_path, "Inno Setup 6", "ISCC.exe")
-                if os.path.isfile(iscc_path):
-                    return iscc_path
-                    
-        return None  # Not found
+        tool = toolchain.get_toolchain().resolve("iscc")
+        return tool.path if tool is not None else None
 
     def run(self):
         """Run the command: build the installer."""
         # First, run py2exe to create the executable
-        self.run_command('py2exe')
+        with tracing.span("py2exe"):
+            self.run_command('py2exe')
         py2exe_cmd = self.get_finalized_command('py2exe')
+        if self.frozen_dist_hook is not None:
+            self.frozen_dist_hook(self.dist_dir)
+        if self.library_order:
+            with tracing.span("reorder_library"):
+                libzip.optimize_dist(
+                    self.dist_dir, self.library_order, store=self.library_store
+                )
         
         # Find Inno Setup
         inno_exe_path = self._find_inno_setup()
@@ -1215,11 +1306,14 @@ class innosetup(distutils.core.Command):
             dist_dir=self.dist_dir,
             metadata=self.distribution.metadata,
             inno_script=inno_script_content,
-            inno_setup_exe=inno_exe_path,
+            inno_setup_exe=self.inno_setup_exe,
             bundle_vcr=self.bundle_vcr,
             register_startup=self.register_startup,
             zip_option=self.zip,
-            extra_inno_script=self.extra_inno_script
+            extra_inno_script=self.extra_inno_script,
+            compression_profile=self.compression_profile,
+            force=self.force,
+            languages=self.languages,
         )
         
         # Sign executables if requested
@@ -1239,10 +1333,9 @@ class innosetup(distutils.core.Command):
     def sign_executables(self):
         """Sign all executables in the dist directory."""
         # Find all executables in the dist directory
-        for root, _, files in os.walk(self.dist_dir):
-            for file in files:
-                if file.lower().endswith('.exe'):
-                    self.sign_executable(os.path.join(root, file))
+        index = distindex.get_index(self.dist_dir)
+        for entry in list(index.iter_files(kinds=(distindex.KIND_EXE,))):
+            self.sign_executable(index.path(entry))
                     
         # Sign any extra files specified
         if self.extra_sign:
@@ -1263,6 +1356,8 @@ class innosetup(distutils.core.Command):
                 certificate_file=self.certificate_file,
                 certificate_password=self.certificate_password,
             )
+            if not os.path.relpath(exepath, self.dist_dir).startswith(os.pardir):
+                distindex.get_index(self.dist_dir).refresh(exepath)
             print(f"Signed: {exepath}")
         except Exception as e:
             self.warn(f"Failed to sign {exepath}: {e}")
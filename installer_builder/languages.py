@@ -0,0 +1,128 @@
+"""Inno Setup language catalog.
+
+Inno Setup ships one ``.isl`` messages file per language: ``Default.isl``
+(English) in the install directory and the rest under ``Languages``. The
+catalog maps language names to those files relative to the install
+directory, which is what ``MessagesFile: "compiler:..."`` expects.
+
+Walking the install directory on every build is wasteful, so catalogs are
+cached per install path and compiler version in the user cache.
+"""
+
+import os
+
+from . import cache
+
+CATALOG_CACHE = "inno-languages.json"
+
+# Names people use for the languages whose .isl file is named differently
+ALIASES = {
+    "english": "Default",
+}
+
+
+def scan_catalog(innopath):
+    """Walk an Inno Setup install directory and return {name: relpath}."""
+    catalog = {}
+    for root, dirs, files in os.walk(innopath):
+        dirs.sort()
+        for basename in sorted(files):
+            name, ext = os.path.splitext(basename)
+            if ext.lower() != ".isl":
+                continue
+            relpath = os.path.relpath(os.path.join(root, basename), innopath)
+            catalog.setdefault(name, relpath.replace("/", "\\"))
+    return catalog
+
+
+def compiler_version(innopath):
+    """Identify the compiler build in `innopath` by its ISCC.exe stat."""
+    try:
+        st = os.stat(os.path.join(innopath, "ISCC.exe"))
+    except OSError:
+        return "unknown"
+    return "%d-%d" % (st.st_size, st.st_mtime_ns)
+
+
+def language_catalog(innopath, version=None, cache_dir=None):
+    """Return the catalog for `innopath`, scanning it only on a cache miss."""
+    innopath = os.path.abspath(innopath)
+    if version is None:
+        version = compiler_version(innopath)
+    filename = cache.cache_path(CATALOG_CACHE, cache_dir=cache_dir)
+    cached = cache.load_json(filename, {})
+    key = "%s|%s" % (os.path.normcase(innopath), version)
+    if key in cached:
+        return cached[key]
+    catalog = scan_catalog(innopath)
+    # Drop entries for other versions of the same install
+    prefix = os.path.normcase(innopath) + "|"
+    cached = dict((k, v) for k, v in cached.items() if not k.startswith(prefix))
+    cached[key] = catalog
+    cache.save_json(filename, cached)
+    return catalog
+
+
+def parse_languages(value):
+    """Turn a comma separated option value into a list of names."""
+    if not value:
+        return None
+    if isinstance(value, str):
+        value = value.split(",")
+    return [name.strip() for name in value if name.strip()]
+
+
+def select_languages(catalog, languages=None):
+    """Return sorted (name, relpath) pairs for `languages` (default: all).
+
+    Names are matched case-insensitively; unknown names raise ValueError.
+    """
+    if not languages:
+        return sorted(catalog.items(), key=lambda item: item[0].lower())
+    lookup = dict((name.lower(), name) for name in catalog)
+    selected = []
+    for requested in languages:
+        name = ALIASES.get(requested.lower(), requested)
+        if name.lower() not in lookup:
+            raise ValueError(
+                "Inno Setup has no %r language, expected one of %s"
+                % (requested, ", ".join(sorted(catalog)))
+            )
+        name = lookup[name.lower()]
+        if (name, catalog[name]) not in selected:
+            selected.append((name, catalog[name]))
+    return selected
+
+
+def language_entries(selected):
+    """[Languages] entries for (name, relpath) pairs from `select_languages`."""
+    return [
+        'Name: "%s"; MessagesFile: "compiler:%s"' % (name, relpath)
+        for name, relpath in selected
+    ]
+
+
+def replace_languages(script, selected):
+    """Return `script` with its [Languages] section listing `selected`.
+
+    The section is added at the end if the script has none.
+    """
+    lines = []
+    in_languages = replaced = False
+    for line in script.splitlines():
+        stripped = line.strip()
+        if stripped.startswith("[") and "]" in stripped:
+            in_languages = (
+                stripped[1 : stripped.index("]")].strip().lower() == "languages"
+            )
+            if in_languages and not replaced:
+                lines.append(line)
+                lines.extend(language_entries(selected))
+                replaced = True
+                continue
+        if not in_languages:
+            lines.append(line)
+    if not replaced:
+        lines.append("[Languages]")
+        lines.extend(language_entries(selected))
+    return "\n".join(lines) + "\n"
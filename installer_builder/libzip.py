@@ -0,0 +1,196 @@
+"""Lay out ``library.zip`` in the order the application imports it.
+
+py2exe and py2app write the module archive in whatever order their module
+finders produced. At startup the frozen application then reads hundreds of
+small members scattered across the file, which is slow on spinning disks
+and network shares. `reorder_zip` rewrites the archive so the members the
+application loads at startup (from an `installer_builder.importtrace`
+trace of a startup run) come first, in the order they were imported,
+followed by everything else in its original order. With ``store=True``
+members are stored uncompressed, so nothing has to be inflated either.
+
+The length of the hot region is recorded in the archive comment
+(``installer_builder:hot=<bytes>``). The application can call a copy of
+`prefetch` first thing in its main module to pull that region into the OS
+cache with one sequential read; it only needs the standard library.
+"""
+
+import os
+import re
+import zipfile
+
+from . import distindex, importtrace
+
+COMMENT_PREFIX = b"installer_builder:hot="
+COMMENT_PATTERN = re.compile(re.escape(COMMENT_PREFIX) + rb"(\d+)")
+PREFETCH_CHUNK = 1024 * 1024
+
+
+class ReorderResult(object):
+    """What `reorder_zip` did to an archive."""
+
+    def __init__(self, filename, members, hot_members, hot_bytes, size, old_size):
+        self.filename = filename
+        self.members = members
+        self.hot_members = hot_members
+        self.hot_bytes = hot_bytes
+        self.size = size
+        self.old_size = old_size
+
+    def __repr__(self):
+        return "<ReorderResult %s: %d of %d members hot>" % (
+            self.filename,
+            self.hot_members,
+            self.members,
+        )
+
+
+def startup_order(infos, order):
+    """Sort `infos` so members of the modules in `order` come first.
+
+    Returns ``(hot, cold)`` lists of `zipfile.ZipInfo`.
+    """
+    by_module = {}
+    for info in infos:
+        module = importtrace.zip_member_module(info.filename)
+        if module is not None:
+            by_module.setdefault(module, []).append(info)
+    hot = []
+    seen = set()
+    for module in order:
+        for info in by_module.get(module, ()):
+            if info.filename not in seen:
+                seen.add(info.filename)
+                hot.append(info)
+    cold = [info for info in infos if info.filename not in seen]
+    return hot, cold
+
+
+def copy_info(info, compress_type):
+    copy = zipfile.ZipInfo(info.filename, info.date_time)
+    copy.external_attr = info.external_attr
+    copy.create_system = info.create_system
+    copy.comment = info.comment
+    copy.compress_type = compress_type
+    return copy
+
+
+def reorder_zip(filename, order, store=False, output=None):
+    """Rewrite `filename` with the modules in `order` first.
+
+    The new archive replaces `filename` unless `output` is given.
+    Returns a `ReorderResult`.
+    """
+    if output is None:
+        output = filename
+    tmp = output + ".tmp"
+    old_size = os.path.getsize(filename)
+    with zipfile.ZipFile(filename) as source:
+        hot, cold = startup_order(
+            [info for info in source.infolist() if not info.is_dir()], order
+        )
+        directories = [info for info in source.infolist() if info.is_dir()]
+        try:
+            with zipfile.ZipFile(tmp, "w", allowZip64=True) as target:
+                for info in hot:
+                    compress_type = zipfile.ZIP_STORED if store else info.compress_type
+                    target.writestr(
+                        copy_info(info, compress_type), source.read(info.filename)
+                    )
+                # Members are written out one after another, so the file
+                # position is where the last hot member ends
+                hot_bytes = target.fp.tell()
+                for info in directories + cold:
+                    compress_type = zipfile.ZIP_STORED if store else info.compress_type
+                    target.writestr(
+                        copy_info(info, compress_type), source.read(info.filename)
+                    )
+                target.comment = COMMENT_PREFIX + str(hot_bytes).encode("ascii")
+            os.replace(tmp, output)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+    return ReorderResult(
+        output,
+        len(hot) + len(cold),
+        len(hot),
+        hot_bytes,
+        os.path.getsize(output),
+        old_size,
+    )
+
+
+def hot_region(filename):
+    """The length of the hot region recorded in `filename`, or None."""
+    with zipfile.ZipFile(filename) as archive:
+        match = COMMENT_PATTERN.match(archive.comment)
+    return int(match.group(1)) if match else None
+
+
+def prefetch(filename):
+    """Read the hot region of a reordered archive into the OS cache.
+
+    Only uses the standard library, and reads just the end of the file to
+    find the region, so an application can copy it into its main module.
+    """
+    with open(filename, "rb") as fp:
+        fp.seek(0, 2)
+        size = fp.tell()
+        # The comment is at the very end, after the end of central directory
+        fp.seek(max(0, size - 64))
+        match = re.search(rb"installer_builder:hot=(\d+)$", fp.read())
+        if match is None:
+            return 0
+        remaining = int(match.group(1))
+        fp.seek(0)
+        while remaining > 0:
+            data = fp.read(min(PREFETCH_CHUNK, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+    return int(match.group(1))
+
+
+def find_library_zips(dist_dir):
+    """The module archives of a frozen dist: py2exe's ``library.zip`` or
+    py2app's ``Contents/Resources/lib/pythonXY.zip``."""
+    candidates = [os.path.join(dist_dir, "library.zip")]
+    for app in os.listdir(dist_dir) if os.path.isdir(dist_dir) else ():
+        lib = os.path.join(dist_dir, app, "Contents", "Resources", "lib")
+        if app.endswith(".app") and os.path.isdir(lib):
+            candidates += [
+                os.path.join(lib, name)
+                for name in sorted(os.listdir(lib))
+                if re.match(r"python\d+\.zip$", name)
+            ]
+    return [path for path in candidates if zipfile.is_zipfile(path)]
+
+
+def optimize_dist(dist_dir, trace_file, store=False):
+    """Reorder every module archive in `dist_dir` by the startup trace.
+
+    The shared dist index is refreshed for each rewritten archive.
+    """
+    from . import format_filesize
+
+    order = importtrace.ImportTrace.load(trace_file).order
+    results = []
+    archives = find_library_zips(dist_dir)
+    if not archives:
+        print("No library.zip to reorder (the modules are bundled in the executable)")
+    for filename in archives:
+        result = reorder_zip(filename, order, store=store)
+        distindex.get_index(dist_dir).refresh(filename)
+        print(
+            "Reordered %s: %d of %d members in a %s hot region, %s -> %s"
+            % (
+                filename,
+                result.hot_members,
+                result.members,
+                format_filesize(result.hot_bytes),
+                format_filesize(result.old_size),
+                format_filesize(result.size),
+            )
+        )
+        results.append(result)
+    return results
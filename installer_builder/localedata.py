@@ -0,0 +1,109 @@
+"""Prune babel's ``locale-data`` to the locales an application ships.
+
+babel keeps one ``.dat`` file per locale, about 800 of them, and loading a
+locale also loads its parents: ``pt_BR`` needs ``pt`` and ``root``, and
+babel's ``parent_exceptions`` send some locales elsewhere (``es_MX`` to
+``es_419``, ``zh_Hant`` to ``root``). `required_locales` resolves those
+chains so that only the files the shipped languages can load are bundled.
+
+The shipped languages are the directories of the application's gettext
+catalogs (``locale/pt_BR/LC_MESSAGES/app.mo``), or an explicit list.
+"""
+
+import os
+import re
+
+ROOT = "root"
+# Bundled whatever the catalogs say: the source language and the base of
+# every chain
+ALWAYS = (ROOT, "en")
+DAT_EXTENSION = ".dat"
+
+
+def normalize(name):
+    """A babel identifier for a gettext or POSIX locale name.
+
+    ``pt-BR``, ``pt_BR.UTF-8`` and ``sr@latin`` become ``pt_BR``, ``pt_BR``
+    and ``sr``.
+    """
+    name = re.split(r"[.@]", name, 1)[0]
+    return name.replace("-", "_")
+
+
+def parent_locale(name, parent_exceptions):
+    """The locale babel loads before `name`, or None for ``root``."""
+    if name == ROOT:
+        return None
+    parent = parent_exceptions.get(name)
+    if parent:
+        return parent
+    parts = name.split("_")
+    return ROOT if len(parts) == 1 else "_".join(parts[:-1])
+
+
+def babel_parent_exceptions():
+    from babel import core
+
+    return core.get_global("parent_exceptions")
+
+
+def babel_canonicalize(name):
+    """babel's own name for `name` (``zh_TW`` is ``zh_Hant_TW``), or None."""
+    import babel
+
+    try:
+        return str(babel.Locale.parse(name))
+    except (ValueError, babel.UnknownLocaleError):
+        return None
+
+
+def required_locales(locales, parent_exceptions=None, canonicalize=None, always=ALWAYS):
+    """Every locale that loading `locales` needs, parents included."""
+    if parent_exceptions is None:
+        parent_exceptions = babel_parent_exceptions()
+    if canonicalize is None:
+        canonicalize = babel_canonicalize
+    pending = list(always)
+    for name in locales:
+        name = normalize(name)
+        pending.append(name)
+        canonical = canonicalize(name)
+        if canonical:
+            pending.append(canonical)
+    required = set()
+    while pending:
+        name = pending.pop()
+        if name in required:
+            continue
+        required.add(name)
+        parent = parent_locale(name, parent_exceptions)
+        if parent is not None:
+            pending.append(parent)
+    return required
+
+
+def catalog_locales(locale_path):
+    """The locales with a gettext catalog (``.mo`` or ``.po``) in `locale_path`."""
+    found = set()
+    if not os.path.isdir(locale_path):
+        return found
+    for entry in os.listdir(locale_path):
+        for dirpath, dirnames, filenames in os.walk(os.path.join(locale_path, entry)):
+            if any(f.lower().endswith((".mo", ".po")) for f in filenames):
+                found.add(normalize(entry))
+                break
+    return found
+
+
+def prune(files, locales, parent_exceptions=None, canonicalize=None):
+    """The files of babel's ``locale-data`` that `locales` need.
+
+    Files that are not locale data (babel's license, for one) are kept.
+    """
+    required = required_locales(locales, parent_exceptions, canonicalize)
+    kept = []
+    for path in files:
+        stem, ext = os.path.splitext(os.path.basename(path))
+        if ext != DAT_EXTENSION or stem in required:
+            kept.append(path)
+    return kept
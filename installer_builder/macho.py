@@ -0,0 +1,145 @@
+"""Read Mach-O and fat (universal) binary headers.
+
+Only the first few hundred bytes of a file are needed to tell whether it
+is a Mach-O binary, whether it is fat, and which architectures it holds.
+`thin_files` uses this to run ``lipo -thin`` only on fat binaries that
+contain the target architecture, and runs those in parallel.
+"""
+
+import concurrent.futures
+import os
+import platform
+import struct
+
+from . import runner
+
+MH_MAGIC = 0xFEEDFACE
+MH_CIGAM = 0xCEFAEDFE
+MH_MAGIC_64 = 0xFEEDFACF
+MH_CIGAM_64 = 0xCFFAEDFE
+FAT_MAGIC = 0xCAFEBABE
+FAT_MAGIC_64 = 0xCAFEBABF
+
+# Java class files share FAT_MAGIC; their next field (the class file
+# version) is always at least 45, far more architectures than a real fat
+# binary has.
+MAX_FAT_ARCHS = 30
+
+CPU_ARCH_ABI64 = 0x01000000
+CPU_TYPE_X86 = 7
+CPU_TYPE_ARM = 12
+CPU_TYPE_POWERPC = 18
+
+CPU_TYPES = {
+    CPU_TYPE_X86: "i386",
+    CPU_TYPE_X86 | CPU_ARCH_ABI64: "x86_64",
+    CPU_TYPE_ARM: "arm",
+    CPU_TYPE_ARM | CPU_ARCH_ABI64: "arm64",
+    CPU_TYPE_POWERPC: "ppc",
+    CPU_TYPE_POWERPC | CPU_ARCH_ABI64: "ppc64",
+}
+
+
+def arch_name(cputype):
+    return CPU_TYPES.get(cputype, "cputype-%d" % cputype)
+
+
+def host_arch():
+    """The architecture binaries should be thinned to by default."""
+    machine = platform.machine().lower()
+    if machine in ("arm64", "aarch64"):
+        return "arm64"
+    if machine in ("x86_64", "amd64"):
+        return "x86_64"
+    return machine or "x86_64"
+
+
+class MachOHeader(object):
+    """What the header of a file says about it."""
+
+    __slots__ = ("fat", "archs")
+
+    def __init__(self, fat, archs):
+        self.fat = fat
+        self.archs = archs
+
+    def __repr__(self):
+        return "<MachOHeader %s%s>" % ("fat " if self.fat else "", " ".join(self.archs))
+
+
+def parse_header(data):
+    """Parse the start of a file; return a `MachOHeader` or None."""
+    if len(data) < 8:
+        return None
+    magic = struct.unpack(">I", data[:4])[0]
+    if magic in (MH_MAGIC, MH_MAGIC_64):
+        return MachOHeader(False, [arch_name(struct.unpack(">i", data[4:8])[0])])
+    if magic in (MH_CIGAM, MH_CIGAM_64):
+        return MachOHeader(False, [arch_name(struct.unpack("<i", data[4:8])[0])])
+    if magic not in (FAT_MAGIC, FAT_MAGIC_64):
+        return None
+    count = struct.unpack(">I", data[4:8])[0]
+    if not 0 < count <= MAX_FAT_ARCHS:
+        return None
+    entry_size = 20 if magic == FAT_MAGIC else 32
+    archs = []
+    for i in range(count):
+        offset = 8 + i * entry_size
+        if len(data) < offset + 4:
+            return None
+        archs.append(arch_name(struct.unpack(">i", data[offset:offset + 4])[0]))
+    return MachOHeader(True, archs)
+
+
+def read_header(filename):
+    with open(filename, "rb") as fp:
+        head = fp.read(8)
+        if len(head) == 8 and struct.unpack(">I", head[:4])[0] in (FAT_MAGIC, FAT_MAGIC_64):
+            # Enough for the largest fat_arch table we accept
+            head += fp.read(MAX_FAT_ARCHS * 32)
+    return parse_header(head)
+
+
+def needs_thinning(filename, arch):
+    """True if `filename` is a fat binary holding `arch` and something else."""
+    try:
+        header = read_header(filename)
+    except OSError:
+        return False
+    return (
+        header is not None
+        and header.fat
+        and arch in header.archs
+        and len(set(header.archs)) > 1
+    )
+
+
+def thin_file(filename, arch, lipo):
+    """Replace `filename` with its `arch` slice using the `lipo` argv prefix."""
+    tmp = filename + ".thin"
+    try:
+        runner.run(lipo + ["-thin", arch, filename, "-output", tmp])
+        os.replace(tmp, filename)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return filename
+
+
+def thin_files(filenames, arch, lipo, max_workers=None):
+    """Thin every fat binary in `filenames` that holds `arch`.
+
+    `lipo` is either an argv prefix or a callable returning one, so the
+    tool is only looked up if something needs thinning. Returns the files
+    that were thinned.
+    """
+    candidates = [f for f in filenames if needs_thinning(f, arch)]
+    if not candidates:
+        return []
+    if callable(lipo):
+        lipo = lipo()
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    # lipo does the work in its own process, the threads only wait on it
+    with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+        return list(executor.map(lambda f: thin_file(f, arch, lipo), candidates))
@@ -0,0 +1,150 @@
+"""JSON-lines manifest of everything in a dist tree.
+
+Each line describes one file::
+
+    {"path": "lib/library.zip", "size": 123, "sha256": "...", "type": "data"}
+
+The tree is walked once with ``os.scandir`` and files are hashed on a
+thread pool (hashlib releases the GIL for large buffers) through mmap'd
+reads. Only a bounded number of files are in flight at once, so memory use
+stays constant however large the tree is.
+"""
+
+import collections
+import concurrent.futures
+import hashlib
+import json
+import mmap
+import os
+
+HASH_CHUNK = 8 * 1024 * 1024
+MAX_IN_FLIGHT = 64
+
+MACHO_MAGICS = (
+    b"\xfe\xed\xfa\xce",
+    b"\xce\xfa\xed\xfe",
+    b"\xfe\xed\xfa\xcf",
+    b"\xcf\xfa\xed\xfe",
+)
+FAT_MAGICS = (
+    b"\xca\xfe\xba\xbe",
+    b"\xca\xfe\xba\xbf",
+)
+
+
+def file_type(header):
+    """Classify a file from its first bytes as pe, macho, macho-fat or data."""
+    if header[:2] == b"MZ":
+        return "pe"
+    if header[:4] in MACHO_MAGICS:
+        return "macho"
+    # Java class files share the fat magic; their version word is >= 45.
+    if header[:4] in FAT_MAGICS and int.from_bytes(header[4:8], "big") < 45:
+        return "macho-fat"
+    return "data"
+
+
+def hash_file(path):
+    """Return (sha256 hexdigest, file type) for `path`."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as fp:
+        size = os.fstat(fp.fileno()).st_size
+        if not size:
+            return digest.hexdigest(), "data"
+        with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            kind = file_type(data[:8])
+            for pos in range(0, size, HASH_CHUNK):
+                digest.update(data[pos:pos + HASH_CHUNK])
+    return digest.hexdigest(), kind
+
+
+def iter_files(root_dir):
+    """Yield (relative path, absolute path, size) for every file under root_dir.
+
+    Relative paths always use forward slashes and are yielded in a stable,
+    sorted order.
+    """
+    pending = [""]
+    while pending:
+        prefix = pending.pop()
+        directory = os.path.join(root_dir, prefix) if prefix else root_dir
+        with os.scandir(directory) as entries:
+            entries = sorted(entries, key=lambda entry: entry.name)
+        subdirs = []
+        for entry in entries:
+            relpath = prefix + entry.name
+            if entry.is_dir(follow_symlinks=False):
+                subdirs.append(relpath + "/")
+            elif entry.is_file():
+                yield relpath, entry.path, entry.stat().st_size
+        pending.extend(reversed(subdirs))
+
+
+def iter_manifest(root_dir, max_workers=None, files=None):
+    """Yield manifest entries for `root_dir` in path order.
+
+    `files` may supply the (relative path, path, size) tuples from an
+    existing listing of the tree, such as a
+    `installer_builder.distindex.DistIndex`, instead of walking it again.
+    """
+    if files is None:
+        files = iter_files(root_dir)
+    if max_workers is None:
+        max_workers = min(32, (os.cpu_count() or 1) * 2)
+    window = collections.deque()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for relpath, path, size in files:
+            window.append((relpath, size, pool.submit(hash_file, path)))
+            if len(window) >= MAX_IN_FLIGHT:
+                yield _entry(*window.popleft())
+        while window:
+            yield _entry(*window.popleft())
+
+
+def _entry(relpath, size, future):
+    sha256, kind = future.result()
+    return {"path": relpath, "size": size, "sha256": sha256, "type": kind}
+
+
+def write_manifest(root_dir, filename, max_workers=None, files=None):
+    """Write the manifest of `root_dir` to `filename`.
+
+    Returns a summary dict with the number of files and total bytes.
+    """
+    count = total = 0
+    with open(filename, "w", encoding="utf-8") as fp:
+        for entry in iter_manifest(root_dir, max_workers=max_workers, files=files):
+            fp.write(json.dumps(entry, sort_keys=True) + "\n")
+            count += 1
+            total += entry["size"]
+    return {"files": count, "size": total}
+
+
+def read_manifest(filename):
+    """Yield the entries of a manifest written by `write_manifest`."""
+    with open(filename, encoding="utf-8") as fp:
+        for line in fp:
+            if line.strip():
+                yield json.loads(line)
+
+
+def load_manifest(filename):
+    """Return a dict mapping each path in a manifest to its entry."""
+    return dict((entry["path"], entry) for entry in read_manifest(filename))
+
+
+def verify_manifest(root_dir, filename, max_workers=None):
+    """Compare `root_dir` with a manifest.
+
+    Returns a dict with ``missing``, ``extra`` and ``changed`` path lists.
+    """
+    expected = load_manifest(filename)
+    result = {"missing": [], "extra": [], "changed": []}
+    for entry in iter_manifest(root_dir, max_workers=max_workers):
+        previous = expected.pop(entry["path"], None)
+        if previous is None:
+            result["extra"].append(entry["path"])
+        elif previous["size"] != entry["size"] or previous["sha256"] != entry["sha256"]:
+            result["changed"].append(entry["path"])
+    result["missing"] = sorted(expected)
+    return result
@@ -0,0 +1,382 @@
+"""A cached module dependency graph for the application.
+
+The graph starts from the main script, `includes` and `extra_packages`
+and follows every ``import`` statically, the same way the freezers'
+module finders do. Parsing source is the expensive part, so each file's
+imports are kept in a cache in the cache directory. A file is parsed again
+only when its size or mtime changed and its sha256 no longer matches, so
+a rebuild only reads the modules that were actually edited or upgraded.
+
+The resolved graph feeds the freezer: every module found becomes an
+include and every top-level name that cannot be found becomes an exclude,
+so the freezer neither misses modules nor searches ``sys.path`` for ones
+that do not exist. The graph is saved next to the build and can answer
+"why is X bundled?"::
+
+    python -m installer_builder.modgraph why build/module-graph.json wx.stc
+"""
+
+import argparse
+import ast
+import collections
+import hashlib
+import importlib.machinery
+import json
+import os
+import sys
+
+from . import cache
+
+CACHE_VERSION = 1
+MAIN = "__main__"
+
+KIND_SOURCE = "source"
+KIND_PACKAGE = "package"
+KIND_NAMESPACE = "namespace"
+KIND_EXTENSION = "extension"
+KIND_BUILTIN = "builtin"
+KIND_SCRIPT = "script"
+
+
+class ModuleNode(object):
+    """A module in the graph and the modules it imports."""
+
+    def __init__(self, name, path, kind, search_locations=None):
+        self.name = name
+        self.path = path
+        self.kind = kind
+        self.search_locations = search_locations
+        self.imports = []
+
+    @property
+    def is_package(self):
+        return self.search_locations is not None
+
+    def __repr__(self):
+        return "<ModuleNode %s %s>" % (self.kind, self.name)
+
+
+def scan_imports(source, filename="<source>"):
+    """Return the import statements in `source`.
+
+    Each is ``(level, module, names)``: `names` is None for ``import x``
+    and the imported names for ``from x import a, b``.
+    """
+    imports = []
+    for node in ast.walk(ast.parse(source, filename)):
+        if isinstance(node, ast.Import):
+            imports.extend((0, alias.name, None) for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            if node.module == "__future__":
+                continue
+            imports.append(
+                (node.level, node.module or "", [alias.name for alias in node.names])
+            )
+    return imports
+
+
+class ImportCache(object):
+    """Parsed imports of source files, reused while a file is unchanged."""
+
+    def __init__(self, filename=None):
+        if filename is None:
+            filename = cache.cache_path("modgraph.json")
+        self.filename = filename
+        data = cache.load_json(filename, {})
+        if data.get("version") != CACHE_VERSION:
+            data = {"version": CACHE_VERSION, "files": {}}
+        self.files = data["files"]
+        self.parsed = 0
+        self.reused = 0
+        self.dirty = False
+
+    def imports(self, path):
+        st = os.stat(path)
+        entry = self.files.get(path)
+        if entry is not None and entry[:2] == [st.st_size, st.st_mtime_ns]:
+            self.reused += 1
+            return entry[3]
+        with open(path, "rb") as fp:
+            source = fp.read()
+        digest = hashlib.sha256(source).hexdigest()
+        if entry is not None and entry[2] == digest:
+            # Touched but not changed
+            imports = entry[3]
+            self.reused += 1
+        else:
+            try:
+                imports = [list(i) for i in scan_imports(source, path)]
+            except (SyntaxError, ValueError):
+                imports = []
+            self.parsed += 1
+        self.files[path] = [st.st_size, st.st_mtime_ns, digest, imports]
+        self.dirty = True
+        return imports
+
+    def save(self):
+        if self.dirty:
+            cache.save_json(
+                self.filename, {"version": CACHE_VERSION, "files": self.files}
+            )
+            self.dirty = False
+
+
+class ModuleGraph(object):
+    """Modules reachable from the roots, with the edges between them."""
+
+    def __init__(self, path=None, excludes=(), import_cache=None):
+        self.path = list(sys.path if path is None else path)
+        self.excludes = set(excludes)
+        self.import_cache = import_cache
+        self.nodes = {}
+        self.roots = []
+        self.missing = set()
+        self._not_found = set()
+        self._pending = collections.deque()
+
+    def is_excluded(self, name):
+        parts = name.split(".")
+        return any(
+            ".".join(parts[:i]) in self.excludes for i in range(1, len(parts) + 1)
+        )
+
+    def find(self, name):
+        """Find `name` without importing anything; None if it does not exist."""
+        if name in self.nodes:
+            return self.nodes[name]
+        if name in self._not_found:
+            return None
+        if name in sys.builtin_module_names:
+            return self._add(ModuleNode(name, None, KIND_BUILTIN))
+        parent, _, _ = name.rpartition(".")
+        if parent:
+            parent_node = self.find(parent)
+            if parent_node is None or not parent_node.is_package:
+                self._not_found.add(name)
+                return None
+            search = parent_node.search_locations
+        else:
+            search = self.path
+        spec = importlib.machinery.PathFinder.find_spec(name, search)
+        if spec is None:
+            self._not_found.add(name)
+            return None
+        locations = spec.submodule_search_locations
+        if locations is not None:
+            locations = list(locations)
+        origin = spec.origin if spec.has_location else None
+        if origin is None:
+            kind = KIND_NAMESPACE
+        elif locations is not None:
+            kind = KIND_PACKAGE
+        elif origin.endswith(".py"):
+            kind = KIND_SOURCE
+        else:
+            kind = KIND_EXTENSION
+        return self._add(ModuleNode(name, origin, kind, locations))
+
+    def _add(self, node):
+        self.nodes[node.name] = node
+        self._pending.append(node)
+        return node
+
+    def _import(self, importer, name):
+        """Record that `importer` imports `name` (and so its parents)."""
+        if self.is_excluded(name):
+            return None
+        parts = name.split(".")
+        node = None
+        for i in range(1, len(parts) + 1):
+            node = self.find(".".join(parts[:i]))
+            if node is None:
+                self.missing.add(".".join(parts[:i]))
+                return None
+            if node.name not in importer.imports:
+                importer.imports.append(node.name)
+        return node
+
+    def _scan(self, node):
+        if node.kind not in (KIND_SOURCE, KIND_PACKAGE, KIND_SCRIPT) or not node.path:
+            return
+        if not node.path.endswith(".py"):
+            return
+        if self.import_cache is not None:
+            imports = self.import_cache.imports(node.path)
+        else:
+            with open(node.path, "rb") as fp:
+                imports = scan_imports(fp.read(), node.path)
+        if node.is_package:
+            package = node.name
+        else:
+            package = node.name.rpartition(".")[0]
+        for level, module, names in imports:
+            if level:
+                base = package.split(".") if package else []
+                if level - 1:
+                    base = base[: -(level - 1)]
+                module = ".".join(base + ([module] if module else []))
+                if not module:
+                    continue
+            target = self._import(node, module)
+            if target is None or not names or not target.is_package:
+                continue
+            for name in names:
+                # from package import submodule
+                if name != "*" and self.find(target.name + "." + name) is not None:
+                    self._import(node, target.name + "." + name)
+
+    def add_script(self, path):
+        node = ModuleNode(MAIN, os.path.abspath(path), KIND_SCRIPT)
+        self.roots.append(MAIN)
+        script_dir = os.path.dirname(node.path)
+        if script_dir not in self.path:
+            self.path.insert(0, script_dir)
+        self._add(node)
+        return node
+
+    def add_module(self, name):
+        node = None if self.is_excluded(name) else self.find(name)
+        if node is None:
+            self.missing.add(name)
+            return None
+        self.roots.append(name)
+        return node
+
+    def add_package(self, name):
+        """Add a package and every module below it."""
+        node = self.add_module(name)
+        pending = [node] if node is not None and node.is_package else []
+        while pending:
+            package = pending.pop()
+            for location in package.search_locations:
+                try:
+                    entries = sorted(os.listdir(location))
+                except OSError:
+                    continue
+                for entry in entries:
+                    stem = entry.split(".", 1)[0]
+                    if not stem.isidentifier() or stem == "__init__":
+                        continue
+                    child = self.find(package.name + "." + stem)
+                    if child is None or self.is_excluded(child.name):
+                        continue
+                    if child.name not in package.imports:
+                        package.imports.append(child.name)
+                    if child.is_package:
+                        pending.append(child)
+
+    def resolve(self):
+        """Scan every module reachable from the roots."""
+        while self._pending:
+            self._scan(self._pending.popleft())
+        if self.import_cache is not None:
+            self.import_cache.save()
+        return self
+
+    def modules(self):
+        return sorted(name for name in self.nodes if name != MAIN)
+
+    def top_level_missing(self):
+        """Missing top-level names, the ones worth excluding from a freeze."""
+        return sorted(name for name in self.missing if "." not in name)
+
+    def why(self, name):
+        """The shortest import chain from a root to `name`, or None."""
+        parents = {}
+        queue = collections.deque(root for root in self.roots if root in self.nodes)
+        seen = set(queue)
+        while queue:
+            current = queue.popleft()
+            if current == name:
+                chain = [current]
+                while chain[-1] in parents:
+                    chain.append(parents[chain[-1]])
+                return list(reversed(chain))
+            for imported in self.nodes[current].imports:
+                if imported not in seen and imported in self.nodes:
+                    seen.add(imported)
+                    parents[imported] = current
+                    queue.append(imported)
+        return None
+
+    def to_json(self):
+        return {
+            "roots": self.roots,
+            "missing": sorted(self.missing),
+            "modules": dict(
+                (
+                    node.name,
+                    {
+                        "path": node.path,
+                        "kind": node.kind,
+                        "imports": node.imports,
+                        "search_locations": node.search_locations,
+                    },
+                )
+                for node in self.nodes.values()
+            ),
+        }
+
+    def save(self, filename):
+        with open(filename, "w") as fp:
+            json.dump(self.to_json(), fp, indent=1, sort_keys=True)
+
+    @classmethod
+    def load(cls, filename):
+        with open(filename) as fp:
+            data = json.load(fp)
+        graph = cls(path=[])
+        for name, entry in data["modules"].items():
+            node = ModuleNode(
+                name, entry["path"], entry["kind"], entry["search_locations"]
+            )
+            node.imports = entry["imports"]
+            graph.nodes[name] = node
+        graph.roots = data["roots"]
+        graph.missing = set(data["missing"])
+        return graph
+
+
+def build_graph(
+    script=None, includes=(), packages=(), excludes=(), path=None, cache_file=None
+):
+    """Resolve the graph for a freeze, reusing cached imports."""
+    import_cache = ImportCache(cache_file)
+    graph = ModuleGraph(path, excludes, import_cache)
+    if script is not None:
+        graph.add_script(script)
+    for name in includes:
+        graph.add_module(name)
+    for name in packages:
+        graph.add_package(name)
+    graph.resolve()
+    print(
+        "Module graph: %d modules, %d missing; parsed %d files, %d from cache"
+        % (
+            len(graph.modules()),
+            len(graph.top_level_missing()),
+            import_cache.parsed,
+            import_cache.reused,
+        )
+    )
+    return graph
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    why_parser = commands.add_parser("why", help="show why a module is bundled")
+    why_parser.add_argument("graph", help="a saved module graph")
+    why_parser.add_argument("module")
+    args = parser.parse_args(argv)
+    graph = ModuleGraph.load(args.graph)
+    chain = graph.why(args.module)
+    if chain is None:
+        print("%s is not in the graph" % args.module)
+        return 1
+    print(" -> ".join(chain))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,8 +1,24 @@
+import copy
 import distutils.core
+import distutils.errors
+import importlib.metadata
+import json
 import os
 import pathlib
 import platform
 
+from . import (
+    compression,
+    distindex,
+    fingerprint,
+    languages,
+    libzip,
+    runner,
+    toolchain,
+    tracing,
+    variants,
+)
+
 # Only import Windows-specific modules on Windows
 if platform.system() == "Windows":
     from . import signtool
@@ -39,6 +55,79 @@ def create_installer_config(builder_instance, dist_dir):
     return installer
 
 
+# Everything create_installer_config sets, apart from the files
+INSTALLER_SETTINGS = (
+    "app_name",
+    "app_version",
+    "author",
+    "main_executable",
+    "app_short_description",
+    "run_at_startup",
+    "output_base_filename",
+)
+
+
+def variant_metadata(installer_config, metadata):
+    """Distribution metadata for a variant's InnoScript.
+
+    The fields that create_installer_config sets for the main installer are
+    taken from `installer_config`, so every installer of a build names the
+    same application, version and publisher.
+    """
+    metadata = copy.copy(metadata)
+    metadata.name = installer_config.app_name
+    metadata.version = installer_config.app_version
+    metadata.author = installer_config.author
+    metadata.description = installer_config.app_short_description
+    return metadata
+
+
+def render_installer_script(installer):
+    """Return the Inno Setup script innosetup_builder made for `installer`.
+
+    Releases of innosetup_builder that can render their script
+    (``Installer.render()``) let the command edit it and run ISCC itself;
+    None means only ``InnosetupCompiler.build`` is available.
+    """
+    render = getattr(installer, "render", None)
+    if render is None:
+        return None
+    return render()
+
+
+def drop_sources(script, base_dir, paths):
+    """Return `script` without the [Files] entries that install `paths`."""
+    paths = set(os.path.normcase(os.path.abspath(path)) for path in paths)
+    lines = []
+    section = ""
+    for line in script.splitlines():
+        stripped = line.strip()
+        if stripped.startswith("[") and "]" in stripped:
+            section = stripped[1 : stripped.index("]")].strip().lower()
+        elif section == "files":
+            source = fingerprint.entry_source(stripped)
+            if source is not None:
+                path = os.path.join(base_dir, source.replace("\\", os.sep))
+                if os.path.normcase(os.path.abspath(path)) in paths:
+                    continue
+        lines.append(line)
+    return "\n".join(lines) + "\n"
+
+
+def installer_settings(installer):
+    """Text describing an innosetup_builder.Installer apart from its files"""
+    settings = dict(
+        (name, getattr(installer, name, None)) for name in INSTALLER_SETTINGS
+    )
+    try:
+        settings["innosetup_builder"] = importlib.metadata.version(
+            "innosetup_builder"
+        )
+    except importlib.metadata.PackageNotFoundError:
+        pass
+    return json.dumps(settings, sort_keys=True, default=str)
+
+
 class NewInnoSetupCommand(distutils.core.Command):
     """Replacement for innosetup.innosetup command using innosetup_builder"""
     
@@ -51,7 +140,17 @@ class NewInnoSetupCommand(distutils.core.Command):
         ("extra-sign=", None, "extra files to be signed"),
         ("register-startup=", None, "register application to run at startup"),
         ("dist-dir=", "d", "directory to put final built distributions in"),
+        ("languages=", None,
+         "comma separated Inno Setup languages for the installers"),
+        ("compression-profile=", None,
+         "compression profile for the installers: "
+         "fast-dev, balanced or max-ratio"),
+        ("library-order=", None,
+         "import trace of app startup to reorder library.zip by"),
+        ("library-store", None, "store library.zip members uncompressed"),
     ]
+
+    boolean_options = ["library_store"]
     
     def initialize_options(self):
         self.extra_inno_script = None
@@ -60,15 +159,46 @@ class NewInnoSetupCommand(distutils.core.Command):
         self.extra_sign = []
         self.register_startup = False
         self.dist_dir = None
+        self.variants = []
+        self.languages = None
+        self.compression_profile = None
+        self.library_order = None
+        self.library_store = False
+        # A callable, so only set through setup() options
+        self.frozen_dist_hook = None
+        self.installer_config = None
         
     def finalize_options(self):
         self.set_undefined_options('bdist', ('dist_dir', 'dist_dir'))
         if self.dist_dir is None:
             self.dist_dir = "dist"
+        self.variants = [
+            variants.InstallerVariant.from_value(v) for v in self.variants or []
+        ]
+        self.languages = languages.parse_languages(self.languages)
+        if (
+            self.compression_profile
+            and self.compression_profile not in compression.COMPRESSION_PROFILES
+        ):
+            raise distutils.errors.DistutilsOptionError(
+                "compression-profile must be one of %s"
+                % ", ".join(compression.PROFILE_NAMES)
+            )
             
     def run(self):
         # Run py2exe first to create executable
-        self.run_command('py2exe')
+        with tracing.span("py2exe"):
+            self.run_command('py2exe')
+
+        # Let the builder trim the modules, then lay out library.zip for
+        # startup, before anything is signed or packed
+        if self.frozen_dist_hook is not None:
+            self.frozen_dist_hook(self.dist_dir)
+        if self.library_order:
+            with tracing.span("reorder_library"):
+                libzip.optimize_dist(
+                    self.dist_dir, self.library_order, store=self.library_store
+                )
         
         # Sign executables if requested
         if self.certificate_file:
@@ -80,26 +210,228 @@ class NewInnoSetupCommand(distutils.core.Command):
         # Sign the installer if requested  
         if self.certificate_file:
             self._sign_installer()
+
+        # Extra installers reuse the frozen and signed dist
+        if self.variants:
+            self._create_variants()
     
+    def _installer_path(self):
+        metadata = self.distribution.metadata
+        return os.path.join(
+            self.dist_dir, f"{metadata.name}-{metadata.version}-setup.exe"
+        )
+
+    def _issfile(self):
+        return os.path.join(self.dist_dir, "distutils.iss")
+
+    def _build_outputs(self):
+        """Installers and scripts this command writes into the dist"""
+        metadata = self.distribution.metadata
+        outputs = [self._installer_path(), self._issfile()]
+        for variant in self.variants:
+            outputs.append(self._variant_issfile(variant))
+            outputs.append(os.path.join(
+                self.dist_dir,
+                variant.installer_filename(metadata.name, metadata.version),
+            ))
+        return outputs
+
+    def _variant_issfile(self, variant):
+        return os.path.join(self.dist_dir, f"distutils-{variant.name}.iss")
+
     def _create_installer(self):
-        import innosetup_builder
-        
+        """Build the main installer, unless its inputs are unchanged.
+
+        When innosetup_builder can render its script, the script is
+        adjusted like the variants' (compression profile, languages,
+        already compressed files stored as is) and compiled here;
+        otherwise innosetup_builder builds the installer itself.
+        """
         # Create installer config from distribution metadata
         installer_config = create_installer_config(self, self.dist_dir)
+        self.installer_config = installer_config
+        script = render_installer_script(installer_config)
+        if script is None:
+            self._build_installer(installer_config)
+        else:
+            self._compile_installer(self._installer_script(script))
+
+    def _installer_script(self, script):
+        """Adjust the script innosetup_builder rendered for the main installer"""
+        script = drop_sources(script, self.dist_dir, self._build_outputs())
+        directives = {}
+        if self.compression_profile:
+            directives.update(
+                compression.profile_directives(self.compression_profile)
+            )
+        directives["OutputDir"] = os.path.abspath(self.dist_dir)
+        directives["OutputBaseFilename"] = os.path.splitext(
+            os.path.basename(self._installer_path())
+        )[0]
+        script = compression.apply_setup_directives(script, directives)
+        if self.languages:
+            selected = languages.select_languages(
+                self._language_catalog(), self.languages
+            )
+            script = languages.replace_languages(script, selected)
+        script, count, size = compression.flag_incompressible_files(
+            script, self.dist_dir
+        )
+        if count:
+            from . import format_filesize
+
+            print(
+                "%d already compressed files (%s) will be stored without compression"
+                % (count, format_filesize(size))
+            )
+        return script
+
+    def _language_catalog(self):
+        tool = toolchain.get_toolchain().require("iscc")
+        if tool.source == "fake":
+            # The fake ISCC does not read messages files
+            return dict(
+                (name, "Languages\\%s.isl" % name) for name in self.languages
+            )
+        return languages.language_catalog(os.path.dirname(tool.path))
+
+    def _compile_installer(self, script):
+        """Compile the main installer script with ISCC, unless it is unchanged.
+
+        The script is written to the dist, and ISCC is skipped when it,
+        every file it packs and the compiler match the last compile.
+        """
+        output = self._installer_path()
+        issfile = self._issfile()
+        fingerprint.write_if_changed(issfile, script.encode("utf-8-sig"))
+        index = distindex.get_index(self.dist_dir)
+        index.refresh(issfile)
+        compile_cache = fingerprint.CompileCache(issfile)
+        tool = toolchain.get_toolchain().require("iscc")
+        if compile_cache.is_current(output, [tool.path]):
+            print(f"Installer is up to date, skipping ISCC: {output}")
+            index.refresh(output)
+            return
+        try:
+            with tracing.span("iscc", script=issfile):
+                runner.run(tool.argv + [issfile])
+        except Exception:
+            compile_cache.invalidate()
+            raise
+        compile_cache.record(output)
+        index.refresh(output)
+
+        print(f"Created installer: {os.path.basename(output)}")
+
+    def _build_installer(self, installer_config):
+        """Have innosetup_builder build the main installer.
+
+        The payload is every file of the dist but the installers and
+        scripts of this command. When it, the installer settings and ISCC
+        match the last build, that build's installer is reused.
+        """
+        import innosetup_builder
+
+        if self.compression_profile:
+            print(
+                "Warning: innosetup_builder cannot render its script, so the "
+                f"{self.compression_profile} compression profile only applies "
+                "to installer variants"
+            )
+        if self.languages:
+            print(
+                "Warning: innosetup_builder cannot render its script, so "
+                "languages only apply to installer variants"
+            )
+        output = self._installer_path()
+        outputs = set(
+            os.path.normcase(os.path.abspath(path))
+            for path in self._build_outputs()
+        )
+        index = distindex.get_index(self.dist_dir)
+        sources = []
+        for entry in index.iter_files():
+            path = index.path(entry)
+            if os.path.normcase(os.path.abspath(path)) not in outputs:
+                sources.append(path)
+        compile_cache = fingerprint.ConfigCache(
+            output, installer_settings(installer_config), sources
+        )
+        tool = toolchain.get_toolchain().resolve("iscc")
+        tools = [tool.path] if tool is not None else []
+        if compile_cache.is_current(output, tools):
+            print(f"Installer is up to date, skipping ISCC: {output}")
+            index.refresh(output)
+            return
+        if tool is not None and tool.source == "fake":
+            print(
+                "Warning: innosetup_builder cannot render its script and "
+                "runs the real ISCC, even with fake tools"
+            )
         
         # Create compiler and build installer
         innosetup_compiler = innosetup_builder.InnosetupCompiler()
-        innosetup_compiler.build(installer_config, self.dist_dir)
+        try:
+            # innosetup_builder starts ISCC itself; still hold a job slot and
+            # record the time like any other tool
+            with runner.track("innosetup_builder", "innosetup_builder ISCC"):
+                innosetup_compiler.build(installer_config, self.dist_dir)
+        except Exception:
+            compile_cache.invalidate()
+            raise
+        compile_cache.record(output)
+        index.refresh(output)
         
-        output_name = f"{installer_config.app_name}-{installer_config.app_version}-setup.exe"
-        print(f"Created installer: {output_name}")
+        print(f"Created installer: {os.path.basename(output)}")
+    
+    def _create_variants(self):
+        """Build every installer variant from the same dist directory.
+
+        innosetup_builder has no hook for per-installer script text,
+        languages or compression, so variants are rendered with InnoScript,
+        from the same installer config as the main installer.
+        """
+        from . import innosetup
+
+        installer_config = self.installer_config
+        if installer_config is None:
+            installer_config = create_installer_config(self, self.dist_dir)
+        metadata = variant_metadata(installer_config, self.distribution.metadata)
+        issfiles = [self._variant_issfile(variant) for variant in self.variants]
+        # Keep every variant's script and installer out of the others' payload
+        exclude = self._build_outputs()
+
+        scripts = []
+        for variant, issfile in zip(self.variants, issfiles):
+            script = innosetup.InnoScript(
+                dist_dir=self.dist_dir,
+                metadata=metadata,
+                inno_script=innosetup.DEFAULT_ISS,
+                register_startup=installer_config.run_at_startup,
+                bundle_vcr=False,
+                extra_inno_script=variant.extra_inno_script,
+                compression_profile=self.compression_profile,
+                issfile=issfile,
+                output_base_filename=variant.get_output_base_filename(
+                    metadata.name, metadata.version
+                ),
+                languages=variant.languages or self.languages,
+                exclude=exclude,
+            )
+            script.create()
+            scripts.append(script)
+
+        workers = variants.pool_size(len(scripts))
+        print(f"Compiling {len(scripts)} installer variants, {workers} at a time")
+        for installer in variants.compile_variants(scripts, max_workers=workers):
+            if self.certificate_file:
+                self._sign_file(installer)
     
     def _sign_executables(self):
         """Sign all executables in dist directory"""
-        for root, _, files in os.walk(self.dist_dir):
-            for file in files:
-                if file.lower().endswith('.exe'):
-                    self._sign_file(os.path.join(root, file))
+        index = distindex.get_index(self.dist_dir)
+        for entry in list(index.iter_files(kinds=(distindex.KIND_EXE,))):
+            self._sign_file(index.path(entry))
                     
         # Sign extra files if specified
         if self.extra_sign:
@@ -108,8 +440,8 @@ class NewInnoSetupCommand(distutils.core.Command):
     
     def _sign_installer(self):
         """Sign the created installer"""
-        installer_name = f"{self.distribution.metadata.name}-{self.distribution.metadata.version}-setup.exe"
-        installer_path = os.path.join(self.dist_dir, installer_name)
+        installer_path = self._installer_path()
+        distindex.get_index(self.dist_dir).refresh(installer_path)
         if os.path.exists(installer_path):
             self._sign_file(installer_path)
     
@@ -129,6 +461,7 @@ class NewInnoSetupCommand(distutils.core.Command):
                 certificate_file=self.certificate_file,
                 certificate_password=self.certificate_password,
             )
+            distindex.get_index(self.dist_dir).refresh(filepath)
             print(f"Signed: {os.path.basename(filepath)}")
         except Exception as e:
             print(f"Warning: Failed to sign {filepath}: {e}")
\ No newline at end of file
@@ -0,0 +1,313 @@
+"""Per-package bytecode optimization and stripping policies.
+
+`optimization_level` applies to the whole freeze, but ``-OO`` breaks
+packages that read their own docstrings at runtime while saving a lot in
+the big ones that do not. Policies are keyed by package (the most
+specific dotted prefix wins, ``"*"`` matches everything else)::
+
+    package_policies={
+        "*": {"drop_pycache": True, "strip_stubs": True},
+        "wx": {"optimize": 2, "drop_tests": True},
+        "sqlalchemy": {"optimize": 2, "drop_sources": True},
+    }
+
+After freezing, `apply_to_dist` rewrites the module archives and library
+directories of the dist:
+
+* ``optimize`` - recompile the package's modules at this level, from their
+  sources on the build machine, through `installer_builder.pyccache`
+* ``drop_sources`` - remove ``.py`` files that have a compiled module next
+  to them
+* ``drop_tests`` - remove ``test`` and ``tests`` directories in the package
+* ``drop_pycache`` - remove ``__pycache__`` leftovers, which a frozen
+  application never reads
+* ``strip_stubs`` - remove ``.pyi`` type stubs and ``py.typed`` markers
+
+The savings are reported per policy and per action.
+"""
+
+import os
+import zipfile
+
+from . import distindex, libzip, modgraph, pyccache, sizereport
+
+DEFAULT = "*"
+ACTION_OPTIMIZE = "optimize"
+ACTION_SOURCES = "sources"
+ACTION_TESTS = "tests"
+ACTION_PYCACHE = "pycache"
+ACTION_STUBS = "stubs"
+
+TEST_DIRS = ("test", "tests")
+STUB_FILES = ("py.typed",)
+
+
+class PackagePolicy(object):
+    """What to do with the modules of one package."""
+
+    def __init__(
+        self,
+        optimize=None,
+        drop_sources=False,
+        drop_tests=False,
+        drop_pycache=False,
+        strip_stubs=False,
+    ):
+        if optimize not in (None, 0, 1, 2):
+            raise ValueError("Invalid optimization level %r" % (optimize,))
+        self.optimize = optimize
+        self.drop_sources = drop_sources
+        self.drop_tests = drop_tests
+        self.drop_pycache = drop_pycache
+        self.strip_stubs = strip_stubs
+
+    @classmethod
+    def from_value(cls, value):
+        """Accept a `PackagePolicy` or a dict of its arguments."""
+        if isinstance(value, cls):
+            return value
+        return cls(**value)
+
+    def drop_reason(self, parts):
+        """The action that drops the file with path `parts`, or None.
+
+        `parts` are relative to the library directory or archive, so the
+        first one is the top-level package.
+        """
+        name = parts[-1]
+        if self.drop_pycache and "__pycache__" in parts:
+            return ACTION_PYCACHE
+        if self.drop_tests and any(part in TEST_DIRS for part in parts[1:-1]):
+            return ACTION_TESTS
+        if self.strip_stubs and (name.endswith(".pyi") or name in STUB_FILES):
+            return ACTION_STUBS
+        return None
+
+    def __repr__(self):
+        return "<PackagePolicy %r>" % self.__dict__
+
+
+def parse_policies(policies):
+    """Return ``{package: PackagePolicy}`` for the builder's option."""
+    return dict(
+        (package, PackagePolicy.from_value(value))
+        for package, value in (policies or {}).items()
+    )
+
+
+def policy_for(policies, module):
+    """Return ``(key, policy)`` of the most specific policy for `module`.
+
+    Both are None when no policy applies.
+    """
+    parts = module.split(".")
+    for i in range(len(parts), 0, -1):
+        key = ".".join(parts[:i])
+        if key in policies:
+            return key, policies[key]
+    if DEFAULT in policies:
+        return DEFAULT, policies[DEFAULT]
+    return None, None
+
+
+class PolicyReport(object):
+    """Bytes saved by each policy and action."""
+
+    def __init__(self):
+        self.saved = {}
+        self.files = {}
+
+    def add(self, key, action, size, files=1):
+        saved = self.saved.setdefault(key, {})
+        saved[action] = saved.get(action, 0) + size
+        counts = self.files.setdefault(key, {})
+        counts[action] = counts.get(action, 0) + files
+
+    @property
+    def total(self):
+        return sum(sum(actions.values()) for actions in self.saved.values())
+
+    def format(self):
+        from . import format_filesize
+
+        rows = []
+        for key, actions in sorted(self.saved.items()):
+            for action, size in sorted(actions.items()):
+                rows.append(
+                    "%-24s %-10s %6d files %10s"
+                    % (key, action, self.files[key][action], format_filesize(size))
+                )
+        rows.append("Package policies saved %s" % format_filesize(self.total))
+        return "\n".join(rows)
+
+
+def _module(parts):
+    """The dotted module of a compiled or source file, or None."""
+    if not sizereport.MODULE_EXTENSION.search(parts[-1]):
+        return None
+    dotted = sizereport.module_owner(parts)[2]
+    if dotted.endswith(".__init__"):
+        dotted = dotted[: -len(".__init__")]
+    return dotted
+
+
+class _Planner(object):
+    """Decides what happens to each file of a container (archive or directory)."""
+
+    def __init__(self, policies, graph):
+        self.policies = policies
+        self.graph = graph
+        self.recompile = {}
+
+    def plan(self, names):
+        """Return ``{name: (key, action)}`` for files to drop or recompile.
+
+        `names` are the container's files as slash separated relative paths.
+        """
+        compiled = set()
+        for name in names:
+            if name.endswith(".pyc"):
+                compiled.add(name[: -len(".pyc")])
+        plan = {}
+        for name in names:
+            parts = [part for part in name.split("/") if part]
+            # site-packages below lib/python3.11 and the like
+            while len(parts) > 1 and sizereport.LIBRARY_DIRS.match(parts[0]):
+                parts = parts[1:]
+            if not parts:
+                continue
+            key, policy = policy_for(self.policies, ".".join(parts[:-1]) or parts[0])
+            module = _module(parts)
+            if module is not None:
+                key, policy = policy_for(self.policies, module)
+            if policy is None:
+                continue
+            reason = policy.drop_reason(parts)
+            if reason is None and policy.drop_sources and name.endswith(".py"):
+                if name[: -len(".py")] in compiled:
+                    reason = ACTION_SOURCES
+            if reason is not None:
+                plan[name] = (key, reason)
+            elif (
+                policy.optimize is not None
+                and name.endswith(".pyc")
+                and "__pycache__" not in parts
+            ):
+                node = self.graph.find(module)
+                if node is not None and node.path and node.path.endswith(".py"):
+                    self.recompile[name] = (node.path, policy.optimize)
+                    plan[name] = (key, ACTION_OPTIMIZE)
+        return plan
+
+    def compile(self, pyc_cache=None):
+        """Compile the sources to recompile; returns ``{name: pyc bytes}``."""
+        by_level = {}
+        for path, level in self.recompile.values():
+            by_level.setdefault(level, set()).add(path)
+        results = dict(
+            (level, pyccache.compile_sources(paths, level, pyc_cache))
+            for level, paths in by_level.items()
+        )
+        compiled = {}
+        for name, (path, level) in self.recompile.items():
+            data = results[level].read(path)
+            if data is not None:
+                compiled[name] = data
+        return compiled
+
+
+def apply_to_zip(filename, policies, graph, report, pyc_cache=None):
+    """Apply `policies` to the members of a module archive.
+
+    The archive is only rewritten when something changed.
+    """
+    planner = _Planner(policies, graph)
+    with zipfile.ZipFile(filename) as source:
+        infos = [info for info in source.infolist() if not info.is_dir()]
+        plan = planner.plan([info.filename for info in infos])
+        if not plan:
+            return
+        compiled = planner.compile(pyc_cache)
+        tmp = filename + ".tmp"
+        try:
+            with zipfile.ZipFile(tmp, "w", allowZip64=True) as target:
+                for info in source.infolist():
+                    key, action = plan.get(info.filename, (None, None))
+                    if action is None or action == ACTION_OPTIMIZE:
+                        data = compiled.get(info.filename)
+                        if data is None:
+                            data = source.read(info.filename)
+                        copy = libzip.copy_info(info, info.compress_type)
+                        target.writestr(copy, data)
+                        if info.filename in compiled:
+                            written = target.getinfo(info.filename).compress_size
+                            report.add(key, action, info.compress_size - written)
+                    else:
+                        report.add(key, action, info.compress_size)
+            os.replace(tmp, filename)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+
+def apply_to_directory(directory, policies, graph, report, pyc_cache=None):
+    """Apply `policies` to the files below a library directory."""
+    names = []
+    for dirpath, dirnames, filenames in os.walk(directory):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            names.append(os.path.relpath(path, directory).replace(os.sep, "/"))
+    planner = _Planner(policies, graph)
+    plan = planner.plan(names)
+    compiled = planner.compile(pyc_cache)
+    changed = []
+    for name, (key, action) in sorted(plan.items()):
+        path = os.path.join(directory, *name.split("/"))
+        size = os.path.getsize(path)
+        if action == ACTION_OPTIMIZE:
+            if name not in compiled:
+                continue
+            with open(path, "wb") as fp:
+                fp.write(compiled[name])
+            report.add(key, action, size - len(compiled[name]))
+        else:
+            os.remove(path)
+            report.add(key, action, size)
+        changed.append(path)
+    return changed
+
+
+def library_dirs(dist_dir):
+    """Top-most directories of the dist whose children are packages."""
+    found = []
+    for dirpath, dirnames, filenames in os.walk(dist_dir):
+        if sizereport.LIBRARY_DIRS.match(os.path.basename(dirpath)):
+            found.append(dirpath)
+            # Nested library dirs (lib/python3.11/site-packages) are walked
+            # as part of this one
+            dirnames[:] = []
+    return found
+
+
+def apply_to_dist(dist_dir, policies, path=None, pyc_cache=None):
+    """Apply `policies` to every module archive and library directory.
+
+    `path` is where the sources to recompile are looked up, ``sys.path``
+    by default. Returns a `PolicyReport`.
+    """
+    policies = parse_policies(policies)
+    report = PolicyReport()
+    if not policies:
+        return report
+    graph = modgraph.ModuleGraph(path)
+    index = distindex.get_index(dist_dir)
+    for filename in libzip.find_library_zips(dist_dir):
+        apply_to_zip(filename, policies, graph, report, pyc_cache)
+        index.refresh(filename)
+    for directory in library_dirs(dist_dir):
+        for changed in apply_to_directory(
+            directory, policies, graph, report, pyc_cache
+        ):
+            index.refresh(changed)
+    print(report.format())
+    return report
@@ -0,0 +1,245 @@
+"""Run postbuild steps as a dependency graph.
+
+Each step is a command with a name, the names of the steps it depends on
+and optionally a concurrency pool. Steps whose dependencies have finished
+run side by side on a worker pool; a pool limit caps how many steps of one
+kind (say, uploads) run at once. A failed step skips everything that
+depends on it, while independent steps carry on.
+
+Every step's output goes to its own log file, and its exit status, wall
+time and peak RSS are collected for the report at the end.
+
+Plain strings in ``postbuild_commands`` still run through the shell, each
+one after the previous string, as before; dicts declare a step::
+
+    postbuild_commands={
+        "windows": [
+            {"name": "checksum", "command": ["certutil", "-hashfile", "release/app.exe"]},
+            {"name": "upload", "command": "upload.bat", "pool": "network"},
+            {"name": "announce", "command": "announce.bat", "depends": ["upload"]},
+        ]
+    }
+"""
+
+import concurrent.futures
+import os
+import re
+import threading
+
+from . import runner
+
+DEFAULT_LOG_DIR = os.path.join("build", "postbuild")
+
+
+class PostbuildError(RuntimeError):
+    """Raised after the graph has run if any step failed."""
+
+    def __init__(self, results):
+        self.results = results
+        failed = [r.step.name for r in results if r.status == "failed"]
+        super(PostbuildError, self).__init__(
+            "Postbuild steps failed: %s" % ", ".join(failed)
+        )
+
+
+class PostbuildStep(object):
+    """One command in the postbuild graph."""
+
+    def __init__(
+        self, name, command, depends=(), pool=None, shell=None, cwd=None, env=None,
+        timeout=None,
+    ):
+        self.name = name
+        self.command = command
+        self.depends = list(depends)
+        self.pool = pool
+        if shell is None:
+            shell = isinstance(command, str)
+        self.shell = shell
+        self.cwd = cwd
+        self.env = env
+        self.timeout = timeout
+
+    def __repr__(self):
+        return "<PostbuildStep %s>" % self.name
+
+
+class StepResult(object):
+    """How a step went."""
+
+    def __init__(self, step, status, returncode=None, seconds=0.0, peak_rss=None,
+                 log_file=None, error=None):
+        self.step = step
+        self.status = status
+        self.returncode = returncode
+        self.seconds = seconds
+        self.peak_rss = peak_rss
+        self.log_file = log_file
+        self.error = error
+
+
+def _slug(name):
+    return re.sub(r"[^A-Za-z0-9_.-]+", "_", name)
+
+
+def make_steps(commands):
+    """Turn the entries of a ``postbuild_commands`` list into steps.
+
+    Strings become shell steps that depend on the preceding string, which
+    keeps the order they always ran in. Dicts and `PostbuildStep` objects
+    only wait for the steps they list in ``depends``.
+    """
+    steps = []
+    names = set()
+    previous_string = None
+    for i, command in enumerate(commands):
+        if isinstance(command, PostbuildStep):
+            step = command
+        elif isinstance(command, dict):
+            step = PostbuildStep(**command)
+        else:
+            name = "step%d" % (i + 1)
+            depends = [previous_string] if previous_string else []
+            step = PostbuildStep(name, command, depends=depends)
+            previous_string = name
+        if step.name in names:
+            raise ValueError("Duplicate postbuild step name %r" % step.name)
+        names.add(step.name)
+        steps.append(step)
+    for step in steps:
+        for dependency in step.depends:
+            if dependency not in names:
+                raise ValueError(
+                    "Postbuild step %r depends on unknown step %r"
+                    % (step.name, dependency)
+                )
+    _check_acyclic(steps)
+    return steps
+
+
+def _check_acyclic(steps):
+    depends = dict((step.name, step.depends) for step in steps)
+    state = {}
+
+    def visit(name, path):
+        if state.get(name) == "done":
+            return
+        if state.get(name) == "visiting":
+            raise ValueError(
+                "Postbuild steps form a cycle: %s" % " -> ".join(path + [name])
+            )
+        state[name] = "visiting"
+        for dependency in depends[name]:
+            visit(dependency, path + [name])
+        state[name] = "done"
+
+    for step in steps:
+        visit(step.name, [])
+
+
+def run_step(step, log_dir):
+    """Run one step with its output going to ``<log_dir>/<name>.log``."""
+    log_file = os.path.join(log_dir, _slug(step.name) + ".log")
+    try:
+        result = runner.run(
+            step.command,
+            shell=step.shell,
+            cwd=step.cwd,
+            env=step.env,
+            timeout=step.timeout,
+            check=False,
+            log_file=log_file,
+            echo=False,
+            label=step.name,
+            limit=False,
+        )
+    except OSError as e:
+        return StepResult(step, "failed", log_file=log_file, error=str(e))
+    return StepResult(
+        step,
+        "ok" if result.ok else "failed",
+        result.returncode,
+        result.seconds,
+        result.peak_rss,
+        log_file,
+        error="timed out after %ss" % step.timeout if result.timed_out else None,
+    )
+
+
+def run_graph(steps, max_workers=None, pool_limits=None, log_dir=DEFAULT_LOG_DIR):
+    """Run `steps` respecting dependencies and limits; return their results.
+
+    Results are in the order the steps were declared. Raises `PostbuildError`
+    once everything that could run has run, if any step failed.
+    """
+    if max_workers is None:
+        max_workers = min(len(steps), os.cpu_count() or 1) or 1
+    pool_limits = pool_limits or {}
+    if not os.path.isdir(log_dir):
+        os.makedirs(log_dir)
+    results = {}
+    pending = list(steps)
+    running = {}
+    pool_usage = {}
+    lock = threading.Lock()
+
+    def can_start(step):
+        if any(d not in results for d in step.depends):
+            return False
+        if step.pool is None or step.pool not in pool_limits:
+            return True
+        return pool_usage.get(step.pool, 0) < max(1, pool_limits[step.pool])
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+        while pending or running:
+            for step in list(pending):
+                blocked = [d for d in step.depends if d in results and results[d].status != "ok"]
+                if blocked:
+                    pending.remove(step)
+                    results[step.name] = StepResult(
+                        step, "skipped", error="%s did not succeed" % blocked[0]
+                    )
+                    continue
+                if len(running) >= max_workers or not can_start(step):
+                    continue
+                pending.remove(step)
+                with lock:
+                    pool_usage[step.pool] = pool_usage.get(step.pool, 0) + 1
+                print("Starting postbuild step %s" % step.name)
+                running[executor.submit(run_step, step, log_dir)] = step
+            if not running:
+                continue
+            done, _ = concurrent.futures.wait(
+                running, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            for future in done:
+                step = running.pop(future)
+                with lock:
+                    pool_usage[step.pool] -= 1
+                results[step.name] = future.result()
+    ordered = [results[step.name] for step in steps]
+    if any(result.status == "failed" for result in ordered):
+        raise PostbuildError(ordered)
+    return ordered
+
+
+def format_results(results):
+    """Tabulate step results for the build log."""
+    from . import format_filesize
+
+    rows = ["%-20s %-8s %5s %9s %10s  %s" % ("Step", "Status", "Exit", "Seconds", "Peak RSS", "Log")]
+    for result in results:
+        rows.append(
+            "%-20s %-8s %5s %9.1f %10s  %s"
+            % (
+                result.step.name,
+                result.status,
+                "" if result.returncode is None else result.returncode,
+                result.seconds,
+                "" if result.peak_rss is None else format_filesize(result.peak_rss),
+                " ".join(
+                    filter(None, (result.log_file, result.error and "(%s)" % result.error))
+                ),
+            )
+        )
+    return "\n".join(rows)
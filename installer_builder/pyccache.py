@@ -0,0 +1,231 @@
+"""Compile modules in parallel, keeping the bytecode between builds.
+
+py2exe and py2app compile every module they bundle one after another, on
+every build. With the builder's ``precompile`` option, `compile_sources`
+compiles every module the module graph reaches before freezing, spread
+over worker interpreters at the build's optimization level, and the
+compiled modules then replace the freezer's in the dist (through
+`installer_builder.pkgpolicy`, which also uses the cache for its own
+per-package levels).
+
+Each pyc is kept in a private cache directory under a key made from the
+source's sha256, the interpreter's magic number and the optimization
+level, so a module is compiled once no matter how many builds, branches or
+checkouts use the same source. Code objects record the path they were
+compiled from, so `CompileResult.read` rewrites it to the path of the
+source asking for the pyc. The interpreter's own ``__pycache__``
+directories are left alone.
+
+The pycs are hash-based (PEP 552), so they do not depend on the mtime of
+the source on the build machine.
+
+Workers run this file as a plain script (``python -c WORKER pyccache.py
+jobs.json``), so it only imports the package lazily.
+"""
+
+import hashlib
+import importlib.util
+import json
+import marshal
+import os
+import sys
+import tempfile
+import types
+
+# Hash-based pyc that is checked against its source (PEP 552)
+FLAGS_CHECKED_HASH = 0b11
+HEADER_SIZE = 16
+
+# Starting an interpreter costs more than compiling a few modules
+MIN_BATCH = 32
+
+WORKER = r"""
+import importlib.util, sys
+spec = importlib.util.spec_from_file_location("_pyccache_worker", sys.argv[1])
+module = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(module)
+module.compile_jobs(sys.argv[2])
+"""
+
+
+def cache_key(source, optimize):
+    digest = hashlib.sha256(importlib.util.MAGIC_NUMBER)
+    digest.update(b"%d\0" % optimize)
+    digest.update(source)
+    return digest.hexdigest()
+
+
+def pyc_data(code, source):
+    """The contents of a checked hash-based pyc for `code`."""
+    return (
+        importlib.util.MAGIC_NUMBER
+        + FLAGS_CHECKED_HASH.to_bytes(4, "little")
+        + importlib.util.source_hash(source)
+        + marshal.dumps(code)
+    )
+
+
+def _with_filename(code, filename):
+    consts = tuple(
+        _with_filename(const, filename) if isinstance(const, types.CodeType) else const
+        for const in code.co_consts
+    )
+    return code.replace(co_filename=filename, co_consts=consts)
+
+
+def read_pyc(pyc_path, filename):
+    """Return the pyc at `pyc_path` as if it was compiled from `filename`."""
+    with open(pyc_path, "rb") as fp:
+        data = fp.read()
+    code = marshal.loads(data[HEADER_SIZE:])
+    if code.co_filename == filename:
+        return data
+    return data[:HEADER_SIZE] + marshal.dumps(_with_filename(code, filename))
+
+
+class CompileResult(object):
+    """What `compile_sources` did."""
+
+    def __init__(self):
+        self.pycs = {}
+        self.compiled = 0
+        self.reused = 0
+        self.errors = {}
+
+    def read(self, path):
+        """The pyc for the source at `path`, or None if it did not compile."""
+        pyc_path = self.pycs.get(path)
+        if pyc_path is not None:
+            return read_pyc(pyc_path, path)
+
+    def __repr__(self):
+        return "<CompileResult %d compiled, %d reused, %d errors>" % (
+            self.compiled,
+            self.reused,
+            len(self.errors),
+        )
+
+
+class PycCache(object):
+    """Compiled modules stored by `cache_key`."""
+
+    def __init__(self, directory=None):
+        if directory is None:
+            from . import cache
+
+            directory = os.path.join(cache.default_cache_dir(), "pyc")
+        self.directory = directory
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], key + ".pyc")
+
+
+def _compile(path, pyc_path, optimize):
+    """Compile one source into the cache; returns an error or None."""
+    try:
+        with open(path, "rb") as fp:
+            source = fp.read()
+        code = compile(source, path, "exec", dont_inherit=True, optimize=optimize)
+    except (OSError, SyntaxError, ValueError) as e:
+        return "%s: %s" % (type(e).__name__, e)
+    directory = os.path.dirname(pyc_path)
+    if not os.path.isdir(directory):
+        os.makedirs(directory, exist_ok=True)
+    tmp = "%s.%d.tmp" % (pyc_path, os.getpid())
+    with open(tmp, "wb") as fp:
+        fp.write(pyc_data(code, source))
+    os.replace(tmp, pyc_path)
+    return None
+
+
+def compile_jobs(filename):
+    """Worker entry point: compile the ``[path, pyc_path, optimize]`` jobs
+    listed in `filename`, then replace its contents with ``{path: error}``."""
+    with open(filename) as fp:
+        jobs = json.load(fp)
+    errors = {}
+    for path, pyc_path, optimize in jobs:
+        error = _compile(path, pyc_path, optimize)
+        if error is not None:
+            errors[path] = error
+    with open(filename, "w") as fp:
+        json.dump(errors, fp)
+
+
+def _run_batch(jobs):
+    from . import runner
+
+    fd, filename = tempfile.mkstemp(suffix=".json")
+    try:
+        with os.fdopen(fd, "w") as fp:
+            json.dump(jobs, fp)
+        runner.run(
+            [sys.executable, "-I", "-c", WORKER, os.path.abspath(__file__), filename],
+            echo=False,
+            label="pyccompile",
+        )
+        with open(filename) as fp:
+            return json.load(fp)
+    finally:
+        os.remove(filename)
+
+
+def _run_jobs(jobs, max_workers):
+    """Compile `jobs`, in worker interpreters when there are enough of them.
+
+    Workers are separate interpreters started through the runner, so they
+    count against its job limit and never import the build script that
+    started them. Returns ``{path: error}``.
+    """
+    if max_workers is None:
+        from . import runner
+
+        max_workers = runner.job_limit()
+    workers = min(max_workers, len(jobs) // MIN_BATCH)
+    if workers <= 1:
+        errors = {}
+        for path, pyc_path, optimize in jobs:
+            error = _compile(path, pyc_path, optimize)
+            if error is not None:
+                errors[path] = error
+        return errors
+    import concurrent.futures
+
+    batches = [jobs[i::workers] for i in range(workers)]
+    errors = {}
+    # The threads only wait on the worker interpreters
+    with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+        for batch_errors in executor.map(_run_batch, batches):
+            errors.update(batch_errors)
+    return errors
+
+
+def compile_sources(paths, optimize=0, pyc_cache=None, max_workers=None):
+    """Compile every ``.py`` in `paths` that is not already cached.
+
+    Up to `max_workers` worker interpreters (default: the runner's job
+    limit) share the sources that need compiling. Returns a
+    `CompileResult` whose `pycs` maps each source to its cached pyc.
+    Sources that do not compile are reported in `errors` and keep the
+    bytecode the freezer gave them.
+    """
+    if pyc_cache is None:
+        pyc_cache = PycCache()
+    result = CompileResult()
+    jobs = []
+    for path in sorted(set(paths)):
+        if not path.endswith(".py"):
+            continue
+        with open(path, "rb") as fp:
+            source = fp.read()
+        pyc_path = pyc_cache.path(cache_key(source, optimize))
+        result.pycs[path] = pyc_path
+        if os.path.exists(pyc_path):
+            result.reused += 1
+        else:
+            jobs.append([path, pyc_path, optimize])
+    result.errors = _run_jobs(jobs, max_workers)
+    for path in result.errors:
+        del result.pycs[path]
+    result.compiled = len(jobs) - len(result.errors)
+    return result
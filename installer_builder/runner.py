@@ -0,0 +1,381 @@
+"""One way to run external tools.
+
+Every subprocess the package starts goes through `run`, which
+
+* takes an argv list (a shell string only when ``shell=True`` is asked for)
+* limits how many tools run at once across all threads (`set_job_limit`)
+* applies an optional timeout, killing the tool when it expires
+* streams output to the console and/or a log file while keeping only a
+  bounded tail in memory
+* records wall time, CPU time, peak RSS, bytes written and exit status for
+  the last `METRICS_LIMIT` calls (`metrics`)
+
+Tools that a library starts itself can still be timed and limited with
+`track`.
+
+Secrets passed in ``redact`` are masked wherever the command is displayed,
+including in the exceptions raised for failures.
+"""
+
+import collections
+import contextlib
+import ctypes
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+DEFAULT_CAPTURE_LIMIT = 64 * 1024
+READ_SIZE = 64 * 1024
+POLL_INTERVAL = 0.05
+# Each result keeps up to `capture_limit` bytes of output
+METRICS_LIMIT = 256
+
+_job_limit = os.cpu_count() or 1
+_jobs = threading.BoundedSemaphore(_job_limit)
+_metrics = collections.deque(maxlen=METRICS_LIMIT)
+_metrics_lock = threading.Lock()
+_listeners = []
+
+
+class CommandError(subprocess.CalledProcessError):
+    """A tool exited with a non-zero status (or timed out)."""
+
+    def __init__(self, result):
+        super(CommandError, self).__init__(
+            result.returncode, result.display, output=result.output
+        )
+        self.result = result
+
+    def __str__(self):
+        if self.result.timed_out:
+            return "Command '%s' timed out after %ss" % (
+                self.result.display,
+                self.result.timeout,
+            )
+        return "Command '%s' returned non-zero exit status %s" % (
+            self.result.display,
+            self.returncode,
+        )
+
+
+class CommandResult(object):
+    """What happened when a tool ran."""
+
+    def __init__(self, argv, display, label):
+        self.argv = argv
+        self.display = display
+        self.label = label
+        self.returncode = None
+        self.start = None
+        self.seconds = 0.0
+        self.cpu_seconds = None
+        self.peak_rss = None
+        self.write_bytes = None
+        self.output = b""
+        self.output_bytes = 0
+        self.timed_out = False
+        self.timeout = None
+
+    @property
+    def ok(self):
+        return self.returncode == 0 and not self.timed_out
+
+    @property
+    def truncated(self):
+        return self.output_bytes > len(self.output)
+
+    def check(self):
+        if not self.ok:
+            raise CommandError(self)
+        return self
+
+    def __repr__(self):
+        return "<CommandResult %s: %s in %.2fs>" % (
+            self.label,
+            self.returncode,
+            self.seconds,
+        )
+
+
+def set_job_limit(limit):
+    """Allow at most `limit` tools to run at the same time."""
+    global _job_limit, _jobs
+    _job_limit = max(1, int(limit))
+    _jobs = threading.BoundedSemaphore(_job_limit)
+
+
+def job_limit():
+    return _job_limit
+
+
+@contextlib.contextmanager
+def job_limit_scope(limit):
+    """Apply `limit` until the block exits; None keeps the current limit."""
+    if limit is None:
+        yield
+        return
+    previous = _job_limit
+    set_job_limit(limit)
+    try:
+        yield
+    finally:
+        set_job_limit(previous)
+
+
+def metrics():
+    """Return the results of the last `METRICS_LIMIT` calls, in completion order."""
+    with _metrics_lock:
+        return list(_metrics)
+
+
+def reset_metrics():
+    with _metrics_lock:
+        _metrics.clear()
+
+
+def add_listener(callback):
+    """Call ``callback(result)`` after every command finishes."""
+    _listeners.append(callback)
+
+
+def remove_listener(callback):
+    _listeners.remove(callback)
+
+
+def display_command(argv, redact=()):
+    if isinstance(argv, str):
+        text = argv
+    else:
+        text = subprocess.list2cmdline([str(a) for a in argv])
+    for secret in redact:
+        if secret:
+            text = text.replace(secret, "********")
+    return text
+
+
+if os.name == "nt":
+
+    class _PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+        _fields_ = [
+            ("cb", ctypes.c_ulong),
+            ("PageFaultCount", ctypes.c_ulong),
+            ("PeakWorkingSetSize", ctypes.c_size_t),
+            ("WorkingSetSize", ctypes.c_size_t),
+            ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+            ("PagefileUsage", ctypes.c_size_t),
+            ("PeakPagefileUsage", ctypes.c_size_t),
+        ]
+
+    class _IO_COUNTERS(ctypes.Structure):
+        _fields_ = [
+            (name, ctypes.c_ulonglong)
+            for name in (
+                "ReadOperationCount",
+                "WriteOperationCount",
+                "OtherOperationCount",
+                "ReadTransferCount",
+                "WriteTransferCount",
+                "OtherTransferCount",
+            )
+        ]
+
+
+def _windows_usage(process, result):
+    handle = int(process._handle)
+    counters = _PROCESS_MEMORY_COUNTERS()
+    counters.cb = ctypes.sizeof(counters)
+    if ctypes.windll.psapi.GetProcessMemoryInfo(
+        handle, ctypes.byref(counters), counters.cb
+    ):
+        result.peak_rss = counters.PeakWorkingSetSize
+    times = [ctypes.c_ulonglong() for _ in range(4)]
+    if ctypes.windll.kernel32.GetProcessTimes(
+        handle, *[ctypes.byref(t) for t in times]
+    ):
+        # kernel and user time, in 100ns units
+        result.cpu_seconds = (times[2].value + times[3].value) / 1e7
+    io = _IO_COUNTERS()
+    if ctypes.windll.kernel32.GetProcessIoCounters(handle, ctypes.byref(io)):
+        result.write_bytes = io.WriteTransferCount
+
+
+def _kill(process):
+    if hasattr(os, "killpg"):
+        # Timed commands get their own session, so this also takes down
+        # anything a shell started
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+            return
+        except OSError:
+            pass
+    process.kill()
+
+
+def _wait(process, timeout, result):
+    """Wait for `process`, filling in its exit status and resource usage."""
+    if hasattr(os, "wait4"):
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            options = 0 if deadline is None else os.WNOHANG
+            pid, status, usage = os.wait4(process.pid, options)
+            if pid:
+                break
+            if time.time() > deadline:
+                _kill(process)
+                result.timed_out = True
+                pid, status, usage = os.wait4(process.pid, 0)
+                break
+            time.sleep(POLL_INTERVAL)
+        process.returncode = os.waitstatus_to_exitcode(status)
+        # ru_maxrss is in kilobytes on Linux and bytes on macOS
+        scale = 1 if sys.platform == "darwin" else 1024
+        result.peak_rss = usage.ru_maxrss * scale
+        result.cpu_seconds = usage.ru_utime + usage.ru_stime
+        # ru_oublock counts 512 byte blocks written to storage
+        result.write_bytes = usage.ru_oublock * 512
+        return
+    try:
+        process.wait(timeout)
+    except subprocess.TimeoutExpired:
+        _kill(process)
+        result.timed_out = True
+        process.wait()
+    if os.name == "nt":
+        _windows_usage(process, result)
+
+
+def _echo(block):
+    out = getattr(sys.stdout, "buffer", None)
+    if out is None:
+        sys.stdout.write(block.decode("utf-8", "replace"))
+    else:
+        out.write(block)
+        out.flush()
+
+
+def _pump(stream, sinks, tail, result, limit):
+    size = 0
+    for block in iter(lambda: stream.read1(READ_SIZE), b""):
+        size += len(block)
+        for sink in sinks:
+            sink(block)
+        tail.append(block)
+        total = sum(len(b) for b in tail)
+        while tail and total - len(tail[0]) >= limit:
+            total -= len(tail.popleft())
+    result.output_bytes = size
+
+
+def run(
+    argv,
+    shell=False,
+    cwd=None,
+    env=None,
+    timeout=None,
+    check=True,
+    log_file=None,
+    echo=True,
+    capture_limit=DEFAULT_CAPTURE_LIMIT,
+    redact=(),
+    label=None,
+    limit=True,
+):
+    """Run a tool and return its `CommandResult`.
+
+    Output (stdout and stderr merged) is copied to the console when `echo`
+    is true and to `log_file` when given; the last `capture_limit` bytes
+    are kept in ``result.output``. With `check`, a failure or timeout raises
+    `CommandError`. Callers that bound their own concurrency (the postbuild
+    graph) pass ``limit=False`` to bypass the shared job limit.
+    """
+    if isinstance(argv, str) and not shell:
+        raise TypeError("Pass an argv list, or shell=True for a command string")
+    if not isinstance(argv, str):
+        argv = [str(a) for a in argv]
+    display = display_command(argv, redact)
+    if label is None:
+        label = os.path.basename(argv if isinstance(argv, str) else argv[0]).split()[0]
+    result = CommandResult(argv, display, label)
+    result.timeout = timeout
+    if env is not None:
+        full_env = dict(os.environ)
+        full_env.update(env)
+        env = full_env
+
+    sinks = []
+    log = None
+    if log_file is not None:
+        log = open(log_file, "wb")
+        sinks.append(log.write)
+    if echo:
+        sinks.append(_echo)
+    tail = collections.deque()
+    try:
+        with _jobs if limit else contextlib.nullcontext():
+            result.start = time.time()
+            process = subprocess.Popen(
+                argv,
+                shell=shell,
+                cwd=cwd,
+                env=env,
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                start_new_session=timeout is not None and hasattr(os, "killpg"),
+            )
+            reader = threading.Thread(
+                target=_pump,
+                args=(process.stdout, sinks, tail, result, capture_limit),
+            )
+            reader.daemon = True
+            reader.start()
+            try:
+                _wait(process, timeout, result)
+            finally:
+                # A killed tool's children may still hold the pipe open
+                reader.join(5 if result.timed_out else None)
+                process.stdout.close()
+            result.seconds = time.time() - result.start
+    finally:
+        if log is not None:
+            log.close()
+    result.output = b"".join(tail)[-capture_limit:] if capture_limit else b""
+    result.returncode = process.returncode
+    _record(result)
+    if check:
+        result.check()
+    return result
+
+
+def _record(result):
+    with _metrics_lock:
+        _metrics.append(result)
+    for listener in list(_listeners):
+        listener(result)
+
+
+@contextlib.contextmanager
+def track(label, display=None, limit=True):
+    """Account for a tool that a library starts on our behalf.
+
+    The block takes a job slot like `run` does, and its wall time is
+    recorded in `metrics` and passed to the listeners. Exit status is 0 if
+    the block completes and 1 if it raises; CPU time, memory and output
+    are unknown.
+    """
+    result = CommandResult([label], display or label, label)
+    with _jobs if limit else contextlib.nullcontext():
+        result.start = time.time()
+        result.returncode = 1
+        try:
+            yield result
+            result.returncode = 0
+        finally:
+            result.seconds = time.time() - result.start
+            _record(result)
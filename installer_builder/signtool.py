@@ -1,11 +1,12 @@
 from __future__ import print_function
 import os
-import subprocess
 import sys
 import platform
 import logging
 import winreg
 
+from . import runner, toolchain, tracing
+
 # Set up module logger
 logger = logging.getLogger(__name__)
 
@@ -83,9 +84,9 @@ def find_signtool():
     # Check PATH
     logger.info("Checking system PATH...")
     try:
-        result = subprocess.run(["where", "signtool.exe"], capture_output=True, text=True, check=False)
+        result = runner.run(["where", "signtool.exe"], check=False, echo=False)
         if result.returncode == 0:
-            for path in result.stdout.strip().split('\n'):
+            for path in result.output.decode("mbcs", "replace").strip().splitlines():
                 # Determine architecture from path
                 arch = "unknown"
                 version = "unknown"
@@ -222,7 +223,7 @@ def sign(filename, url='', description='', timestamp_server=DEFAULT_TIMESTAMP_SE
         The return code from signtool
         
     Raises:
-        subprocess.CalledProcessError: If signtool fails
+        runner.CommandError: If signtool fails
         FileNotFoundError: If the file to sign or certificate file doesn't exist
         SignToolNotFoundError: If signtool.exe cannot be found
     """
@@ -232,32 +233,31 @@ def sign(filename, url='', description='', timestamp_server=DEFAULT_TIMESTAMP_SE
     if not certificate_file or not os.path.exists(certificate_file):
         raise FileNotFoundError(f"Certificate file not found: {certificate_file}")
     
-    # Find signtool.exe
-    try:
-        signtool_path = find_signtool()
-        logger.info(f"Using signtool: {signtool_path}")
-    except SignToolNotFoundError as e:
-        logger.error(f"Error finding signtool: {e}")
+    # Find signtool.exe (resolved once per build by the toolchain)
+    tool = toolchain.get_toolchain().resolve("signtool")
+    if tool is None:
         logger.error("You can download the Windows SDK from: https://developer.microsoft.com/en-us/windows/downloads/windows-sdk/")
-        raise
+        raise SignToolNotFoundError()
+    logger.info(f"Using signtool: {tool.path}")
     
     # Build the command
-    command = f'"{signtool_path}" sign /fd SHA256 /t {timestamp_server}'
+    command = tool.argv + ['sign', '/fd', 'SHA256', '/t', timestamp_server]
     if url:
-        command += f' /du {url}'
+        command += ['/du', url]
     if description:
-        command += f' /d "{description}"'
-    command += f' /f "{certificate_file}" /p "{certificate_password}"'
-    command += f' /v "{filename}"'
+        command += ['/d', description]
+    command += ['/f', certificate_file, '/p', certificate_password]
+    command += ['/v', filename]
     
     # Don't log the command with the password
-    safe_command = command.replace(certificate_password, '********') if certificate_password else command
+    redact = [certificate_password] if certificate_password else []
     logger.info(f"Signing: {os.path.basename(filename)}")
-    logger.info(safe_command)
+    logger.info(runner.display_command(command, redact))
     
     try:
-        return subprocess.check_call(command, shell=True)
-    except subprocess.CalledProcessError as e:
+        with tracing.span("sign", file=os.path.basename(filename)):
+            return runner.run(command, redact=redact).returncode
+    except runner.CommandError as e:
         logger.error(f"Error signing {filename}: {e}")
         logger.error("Make sure the certificate is valid and you have permission to sign.")
         raise
@@ -276,17 +276,12 @@ if __name__ == "__main__":
         
         # Verify the signtool is usable
         try:
-            result = subprocess.run(
-                [signtool_path, "/?"],
-                capture_output=True,
-                text=True,
-                check=False
-            )
+            result = runner.run([signtool_path, "/?"], check=False, echo=False)
             if result.returncode == 0:
                 logger.info("Verified signtool is working correctly.")
             else:
                 logger.warning(f"Signtool returned error code {result.returncode}.")
-                logger.warning(f"Error output: {result.stderr}")
+                logger.warning(f"Error output: {result.output.decode('mbcs', 'replace')}")
         except Exception as e:
             logger.warning(f"Could not verify signtool: {e}")
             
@@ -0,0 +1,276 @@
+"""Where the bytes in a dist come from.
+
+Every file in the dist, and every member of the zip archives in it
+(``library.zip``, ``python311.zip``), is attributed to an owner:
+
+* ``package`` - the top-level Python package or module, for files below a
+  ``lib``/``site-packages`` directory, zip members and extension modules
+  such as ``wx._core.pyd``
+* ``native`` - a DLL, shared library, executable or framework that is not
+  part of a package
+* ``data`` - anything else, by its top-level directory
+
+Zip members count with their compressed size, which is what they add to
+the installer. The report can be diffed against the sizes of a previous
+build, and suggests entries from the exclude helpers (`standard_wx_excludes`
+and friends) for modules that are in the dist but not excluded.
+
+Run ``python -m installer_builder.sizereport dist`` for a report of any
+dist directory.
+"""
+
+import argparse
+import importlib
+import json
+import re
+import zipfile
+
+from . import distindex
+
+KIND_PACKAGE = "package"
+KIND_NATIVE = "native"
+KIND_DATA = "data"
+
+EXCLUDE_HELPERS = (
+    "standard_wx_excludes",
+    "sqlite_sqlalchemy_excludes",
+    "app_framework_excludes",
+    "stdlib_excludes",
+    "win32_excludes",
+)
+
+# Directories below which the first path component is a top-level package
+LIBRARY_DIRS = re.compile(
+    r"^(?:lib|lib-dynload|site-packages|python\d+(?:\.\d+)?)$", re.I
+)
+# A module file name's extension, with any interpreter tag before it
+MODULE_EXTENSION = re.compile(
+    r"(?:\.(?:cpython|cp\d|abi3|pypy)[^.]*)?\.(?:py[cwdo]?|pyd|so)$", re.I
+)
+NATIVE_KINDS = (distindex.KIND_EXE, distindex.KIND_DLL, distindex.KIND_SHARED_LIB)
+
+
+class Owner(object):
+    """The files attributed to one package or native dependency."""
+
+    def __init__(self, name, kind):
+        self.name = name
+        self.kind = kind
+        self.size = 0
+        self.files = 0
+
+    def __repr__(self):
+        return "<Owner %s %s: %d bytes>" % (self.kind, self.name, self.size)
+
+
+class Suggestion(object):
+    """A helper's exclude that would remove `size` bytes from the dist."""
+
+    def __init__(self, helper, module, size):
+        self.helper = helper
+        self.module = module
+        self.size = size
+
+    def __repr__(self):
+        return "<Suggestion %s from %s>" % (self.module, self.helper)
+
+
+def module_owner(parts):
+    """Return ``(package, kind, dotted module)`` for a module's path parts."""
+    dotted = ".".join(parts[:-1] + [MODULE_EXTENSION.sub("", parts[-1])])
+    return dotted.split(".")[0], KIND_PACKAGE, dotted
+
+
+def classify_path(relpath):
+    """Return ``(owner, kind, dotted module or None)`` for a dist file.
+
+    `relpath` is relative to the dist root and uses forward slashes.
+    """
+    parts = [part for part in relpath.split("/") if part and part != "__pycache__"]
+    for i, part in enumerate(parts[:-1]):
+        if LIBRARY_DIRS.match(part):
+            i += 1
+            while i < len(parts) - 1 and LIBRARY_DIRS.match(parts[i]):
+                i += 1
+            return module_owner(parts[i:])
+    if parts[0] == "Contents" and len(parts) > 2:
+        # A macOS bundle: Frameworks, Resources, MacOS...
+        parts = parts[1:]
+    if len(parts) == 1:
+        if MODULE_EXTENSION.search(parts[0]):
+            # py2exe puts extension modules at the top as wx._core.pyd
+            return module_owner(parts)
+        if distindex.classify(parts[0]) in NATIVE_KINDS:
+            return parts[0], KIND_NATIVE, None
+        return parts[0], KIND_DATA, None
+    framework = [part for part in parts if part.endswith(".framework")]
+    if framework:
+        return framework[0], KIND_NATIVE, None
+    if distindex.classify(parts[-1]) in NATIVE_KINDS:
+        return parts[-1], KIND_NATIVE, None
+    return parts[0], KIND_DATA, None
+
+
+class SizeReport(object):
+    """Sizes of a dist attributed to packages and native dependencies.
+
+    `files` yields ``(relative path, path, size)`` tuples as produced by
+    `installer_builder.distindex.DistIndex.iter_tree`.
+    """
+
+    def __init__(self, files):
+        self.owners = {}
+        self.modules = {}
+        for relpath, path, size in files:
+            if relpath.lower().endswith(".zip") and zipfile.is_zipfile(path):
+                with zipfile.ZipFile(path) as archive:
+                    for info in archive.infolist():
+                        if not info.is_dir():
+                            owner = module_owner(info.filename.split("/"))
+                            self._add(owner, info.compress_size)
+                continue
+            self._add(classify_path(relpath), size)
+
+    def _add(self, attribution, size):
+        name, kind, dotted = attribution
+        owner = self.owners.get(name)
+        if owner is None:
+            owner = self.owners[name] = Owner(name, kind)
+        owner.size += size
+        owner.files += 1
+        if dotted is not None:
+            self.modules[dotted] = self.modules.get(dotted, 0) + size
+
+    @property
+    def total(self):
+        return sum(owner.size for owner in self.owners.values())
+
+    def sizes(self):
+        """Return ``{owner: size}``, the shape kept in the build history."""
+        return dict((name, owner.size) for name, owner in self.owners.items())
+
+    def ranked(self):
+        """Owners, largest first."""
+        return sorted(self.owners.values(), key=lambda o: (-o.size, o.name))
+
+    def module_size(self, module):
+        """Bytes belonging to `module` and its submodules."""
+        prefix = module + "."
+        return sum(
+            size
+            for dotted, size in self.modules.items()
+            if dotted == module or dotted.startswith(prefix)
+        )
+
+    def diff(self, previous):
+        """Compare with `previous` ``{owner: size}``.
+
+        Returns ``(name, size, previous size, change)`` for every owner in
+        either build, largest change first; a missing side is None.
+        """
+        rows = []
+        for name in set(self.owners) | set(previous):
+            size = self.owners[name].size if name in self.owners else None
+            old = previous.get(name)
+            rows.append((name, size, old, (size or 0) - (old or 0)))
+        rows.sort(key=lambda row: (-abs(row[3]), row[0]))
+        return rows
+
+    def suggest_excludes(self, excludes=(), helpers=EXCLUDE_HELPERS):
+        """Helper excludes that match modules in the dist, largest first.
+
+        Modules already covered by `excludes` (or a parent package in it) are
+        not suggested.
+        """
+        package = importlib.import_module(__package__)
+        excluded = set(excludes)
+        suggestions = []
+        seen = set()
+        for helper in helpers:
+            for module in getattr(package, helper)():
+                parts = module.split(".")
+                covered = any(
+                    ".".join(parts[:i]) in excluded for i in range(1, len(parts) + 1)
+                )
+                if covered or module in seen:
+                    continue
+                seen.add(module)
+                size = self.module_size(module)
+                if size:
+                    suggestions.append(Suggestion(helper, module, size))
+        suggestions.sort(key=lambda s: -s.size)
+        return suggestions
+
+    def format(self, previous=None, limit=20, excludes=()):
+        """A table of the largest owners, with changes and exclude suggestions."""
+        from . import format_filesize
+
+        def signed(change):
+            if change is None:
+                return ""
+            return ("+" if change >= 0 else "-") + format_filesize(abs(change))
+
+        header = ("Package", "Kind", "Files", "Size", "Change")
+        rows = ["%-32s %-8s %6s %10s %11s" % header]
+        for owner in self.ranked()[:limit]:
+            change = None
+            if previous is not None:
+                change = owner.size - previous.get(owner.name, 0)
+            rows.append(
+                "%-32s %-8s %6d %10s %11s"
+                % (
+                    owner.name,
+                    owner.kind,
+                    owner.files,
+                    format_filesize(owner.size),
+                    signed(change),
+                )
+            )
+        rows.append("%-32s %26s" % ("Total", format_filesize(self.total)))
+        if previous is not None:
+            removed = sorted(set(previous) - set(self.owners))
+            if removed:
+                rows.append("No longer in the dist: %s" % ", ".join(removed))
+        suggestions = self.suggest_excludes(excludes)
+        if suggestions:
+            rows.append("Exclude candidates:")
+            for suggestion in suggestions:
+                rows.append(
+                    "  %-30s %10s  (%s)"
+                    % (
+                        suggestion.module,
+                        format_filesize(suggestion.size),
+                        suggestion.helper,
+                    )
+                )
+        return "\n".join(rows)
+
+    def to_json(self):
+        return dict(
+            (name, {"kind": owner.kind, "size": owner.size, "files": owner.files})
+            for name, owner in self.owners.items()
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("dist", help="the dist directory (or .app bundle)")
+    parser.add_argument("--previous", help="JSON report of an earlier build")
+    parser.add_argument("--json", help="also write the report as JSON")
+    parser.add_argument("--limit", type=int, default=40)
+    args = parser.parse_args(argv)
+    report = SizeReport(distindex.get_index(args.dist).iter_tree())
+    previous = None
+    if args.previous:
+        with open(args.previous) as fp:
+            previous = dict(
+                (name, entry["size"]) for name, entry in json.load(fp).items()
+            )
+    print(report.format(previous, limit=args.limit))
+    if args.json:
+        with open(args.json, "w") as fp:
+            json.dump(report.to_json(), fp, indent=1, sort_keys=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+"""Find the external tools a build runs, once.
+
+Every tool (ISCC, signtool, lipo, hdiutil) is resolved in this order:
+
+1. an override passed to `configure()` (``InstallerBuilder(tool_overrides=...)``)
+2. an environment variable, e.g. ``INSTALLER_BUILDER_ISCC``
+3. the on-disk cache from an earlier build, if the file it points to still
+   has the same size and mtime
+4. probing the system (registry, standard install paths, ``PATH``)
+
+Results are memoized in the process and written to ``toolchain.json`` in
+the user cache directory together with the tool's version.
+
+Setting ``INSTALLER_BUILDER_FAKE_TOOLS=1`` (or ``configure(fake=True)``)
+swaps every tool for `installer_builder.faketools`, which produces
+placeholder outputs, so the whole pipeline can be run and timed on a
+machine without the real toolchain. The one exception is the main Windows
+installer when innosetup_builder cannot render its script: it then starts
+ISCC itself, without asking the toolchain.
+"""
+
+import contextlib
+import os
+import platform
+import re
+import shutil
+import sys
+
+from . import cache
+
+TOOLS = ("iscc", "signtool", "lipo", "hdiutil")
+ENV_PREFIX = "INSTALLER_BUILDER_"
+FAKE_ENV = "INSTALLER_BUILDER_FAKE_TOOLS"
+CACHE_FILE = "toolchain.json"
+
+INNO_UNINSTALL_KEY = (
+    r"SOFTWARE\Microsoft\Windows\CurrentVersion\Uninstall\Inno Setup 6_is1"
+)
+INNO_UNINSTALL_WOW64_KEY = (
+    r"SOFTWARE\Wow6432Node\Microsoft\Windows\CurrentVersion\Uninstall\Inno Setup 6_is1"
+)
+
+
+class ToolNotFoundError(EnvironmentError):
+    """Raised when a required tool cannot be found."""
+
+
+class Tool(object):
+    """A resolved tool: the argv prefix that runs it and what we know of it."""
+
+    def __init__(self, name, path, version=None, source="probe", argv=None):
+        self.name = name
+        self.path = path
+        self.version = version
+        self.source = source
+        self.argv = argv or [path]
+
+    def __repr__(self):
+        return "<Tool %s %s (%s)>" % (self.name, self.path, self.version or "unknown")
+
+
+def _inno_registry():
+    """Yield (install location, version) from the Inno Setup 6 uninstall keys."""
+    try:
+        import winreg
+    except ImportError:
+        return
+    keys = [
+        (winreg.HKEY_LOCAL_MACHINE, INNO_UNINSTALL_KEY, winreg.KEY_WOW64_64KEY),
+        (winreg.HKEY_LOCAL_MACHINE, INNO_UNINSTALL_WOW64_KEY, winreg.KEY_WOW64_32KEY),
+        (winreg.HKEY_CURRENT_USER, INNO_UNINSTALL_KEY, winreg.KEY_WOW64_64KEY),
+        (winreg.HKEY_CURRENT_USER, INNO_UNINSTALL_WOW64_KEY, winreg.KEY_WOW64_32KEY),
+    ]
+    for root, key, flags in keys:
+        try:
+            with winreg.OpenKey(root, key, 0, winreg.KEY_READ | flags) as handle:
+                location = winreg.QueryValueEx(handle, "InstallLocation")[0]
+                try:
+                    version = winreg.QueryValueEx(handle, "DisplayVersion")[0]
+                except OSError:
+                    version = None
+                yield location, version
+        except OSError:
+            continue
+
+
+def probe_iscc():
+    for location, version in _inno_registry():
+        path = os.path.join(location, "ISCC.exe")
+        if os.path.isfile(path):
+            return path, version
+    for variable in ("ProgramFiles", "ProgramFiles(x86)"):
+        base = os.environ.get(variable)
+        if base:
+            path = os.path.join(base, "Inno Setup 6", "ISCC.exe")
+            if os.path.isfile(path):
+                return path, None
+    return shutil.which("ISCC"), None
+
+
+def probe_signtool():
+    if platform.system() != "Windows":
+        return None, None
+    from . import signtool
+
+    try:
+        path = signtool.find_signtool()
+    except signtool.SignToolNotFoundError:
+        return None, None
+    # Windows SDK tools live in bin\<sdk version>\<arch>
+    match = re.search(r"\d+\.\d+\.\d+\.\d+", path)
+    return path, match.group(0) if match else None
+
+
+def _probe_mac_tool(name):
+    path = shutil.which(name)
+    version = None
+    if path and platform.system() == "Darwin":
+        version = "macOS %s" % platform.mac_ver()[0]
+    return path, version
+
+
+PROBES = {
+    "iscc": probe_iscc,
+    "signtool": probe_signtool,
+    "lipo": lambda: _probe_mac_tool("lipo"),
+    "hdiutil": lambda: _probe_mac_tool("hdiutil"),
+}
+
+
+def _stat_key(path):
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns]
+
+
+class Toolchain(object):
+    """Resolves and remembers the tools used by a build."""
+
+    def __init__(self, overrides=None, fake=None, cache_file=None):
+        self.overrides = dict(overrides or {})
+        if fake is None:
+            fake = os.environ.get(FAKE_ENV, "").lower() in ("1", "true", "yes")
+        self.fake = fake
+        self.cache_file = cache_file
+        self.tools = {}
+
+    def _cache_file(self):
+        if self.cache_file is None:
+            self.cache_file = cache.cache_path(CACHE_FILE)
+        return self.cache_file
+
+    def _override(self, name):
+        if self.overrides.get(name):
+            return self.overrides[name], "config"
+        value = os.environ.get(ENV_PREFIX + name.upper())
+        if value:
+            return value, "env"
+        return None, None
+
+    def _fake(self, name):
+        from . import faketools
+
+        path = faketools.__file__
+        return Tool(name, path, "fake", "fake", [sys.executable, path, name])
+
+    def resolve(self, name):
+        """Return the `Tool` for `name`, or None if it cannot be found."""
+        if name in self.tools:
+            return self.tools[name]
+        if self.fake:
+            tool = self._fake(name)
+        else:
+            tool = self._resolve(name)
+        self.tools[name] = tool
+        return tool
+
+    def _resolve(self, name):
+        path, source = self._override(name)
+        cached = cache.load_json(self._cache_file(), {})
+        entry = cached.get(name)
+        if path is not None:
+            path = shutil.which(path) or path
+            if not os.path.isfile(path):
+                raise ToolNotFoundError(
+                    "%s override %s does not exist" % (name, path)
+                )
+            version = None
+            if entry and entry.get("path") == path and entry.get("stat") == _stat_key(path):
+                version = entry.get("version")
+            return Tool(name, path, version, source)
+        if entry:
+            try:
+                if entry["stat"] == _stat_key(entry["path"]):
+                    return Tool(name, entry["path"], entry.get("version"), "cache")
+            except (OSError, KeyError, TypeError):
+                pass
+        path, version = PROBES[name]()
+        if not path:
+            return None
+        cached[name] = {"path": path, "version": version, "stat": _stat_key(path)}
+        cache.save_json(self._cache_file(), cached)
+        return Tool(name, path, version)
+
+    def require(self, name):
+        tool = self.resolve(name)
+        if tool is None:
+            raise ToolNotFoundError(
+                "Could not find %s. Install it or set %s%s."
+                % (name, ENV_PREFIX, name.upper())
+            )
+        return tool
+
+    def path(self, name):
+        return self.require(name).path
+
+    def command(self, name):
+        """Return the argv prefix that runs `name`."""
+        return list(self.require(name).argv)
+
+    def describe(self):
+        """Return a line per tool for build logs."""
+        lines = []
+        for name in TOOLS:
+            try:
+                tool = self.resolve(name)
+            except ToolNotFoundError as e:
+                lines.append("%-9s %s" % (name, e))
+                continue
+            if tool is None:
+                lines.append("%-9s not found" % name)
+            else:
+                lines.append(
+                    "%-9s %s (%s, %s)"
+                    % (name, tool.path, tool.version or "unknown version", tool.source)
+                )
+        return lines
+
+
+_toolchain = None
+
+
+def configure(overrides=None, fake=None, cache_file=None):
+    """Replace the shared toolchain, e.g. with overrides from the builder."""
+    global _toolchain
+    _toolchain = Toolchain(overrides, fake=fake, cache_file=cache_file)
+    return _toolchain
+
+
+@contextlib.contextmanager
+def using(chain):
+    """Make `chain` the shared toolchain until the block exits."""
+    global _toolchain
+    previous = _toolchain
+    _toolchain = chain
+    try:
+        yield chain
+    finally:
+        _toolchain = previous
+
+
+def get_toolchain():
+    """Return the shared toolchain, creating a default one on first use."""
+    if _toolchain is None:
+        return configure()
+    return _toolchain
@@ -0,0 +1,235 @@
+"""Spans for the phases of a build.
+
+`start_trace` begins recording. From then on, every ``with span(name):``
+block and every command run through `installer_builder.runner` becomes a
+span with its start time, duration, thread and any arguments. Subprocess
+spans also carry the tool's CPU time, peak RSS and bytes written.
+
+Recorded spans can be exported as Chrome trace-event JSON (open it in
+``chrome://tracing`` or https://ui.perfetto.dev) and as a summary that
+totals time per phase and per tool.
+"""
+
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+
+from . import runner
+
+CATEGORY_PHASE = "phase"
+CATEGORY_SUBPROCESS = "subprocess"
+
+_tracer = None
+
+
+class Span(object):
+    """One timed region of the build."""
+
+    def __init__(self, name, category, start, thread, parent=None, args=None):
+        self.name = name
+        self.category = category
+        self.start = start
+        self.seconds = None
+        self.thread = thread
+        self.parent = parent
+        self.args = args or {}
+
+    def __repr__(self):
+        return "<Span %s %s>" % (self.category, self.name)
+
+
+class Tracer(object):
+    """Collects spans from any thread."""
+
+    def __init__(self):
+        self.origin = time.time()
+        self.spans = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _stack(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    @contextlib.contextmanager
+    def span(self, name, category=CATEGORY_PHASE, **args):
+        stack = self._stack()
+        span = Span(
+            name,
+            category,
+            time.time(),
+            threading.current_thread().name,
+            stack[-1].name if stack else None,
+            args,
+        )
+        stack.append(span)
+        try:
+            yield span
+        finally:
+            stack.pop()
+            span.seconds = time.time() - span.start
+            with self._lock:
+                self.spans.append(span)
+
+    def add_command(self, result):
+        """Record a finished `runner.CommandResult` as a subprocess span."""
+        if result.start is None:
+            return
+        stack = self._stack()
+        span = Span(
+            result.label,
+            CATEGORY_SUBPROCESS,
+            result.start,
+            threading.current_thread().name,
+            stack[-1].name if stack else None,
+            {
+                "command": result.display,
+                "returncode": result.returncode,
+                "cpu_seconds": result.cpu_seconds,
+                "peak_rss": result.peak_rss,
+                "write_bytes": result.write_bytes,
+            },
+        )
+        span.seconds = result.seconds
+        with self._lock:
+            self.spans.append(span)
+
+    def chrome_trace(self):
+        """Return the spans as a Chrome trace-event document."""
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: s.start)
+        threads = {}
+        events = []
+        pid = os.getpid()
+        for span in spans:
+            tid = threads.setdefault(span.thread, len(threads) + 1)
+            events.append(
+                {
+                    "name": span.name,
+                    "cat": span.category,
+                    "ph": "X",
+                    "ts": int((span.start - self.origin) * 1e6),
+                    "dur": int(span.seconds * 1e6),
+                    "pid": pid,
+                    "tid": tid,
+                    "args": span.args,
+                }
+            )
+        for name, tid in threads.items():
+            events.append(
+                {
+                    "name": "thread_name",
+                    "ph": "M",
+                    "pid": pid,
+                    "tid": tid,
+                    "args": {"name": name},
+                }
+            )
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def summary(self):
+        """Total the spans per phase and per tool."""
+        with self._lock:
+            spans = list(self.spans)
+        phases = {}
+        tools = {}
+        for span in spans:
+            if span.category == CATEGORY_SUBPROCESS:
+                tool = tools.setdefault(
+                    span.name,
+                    {"count": 0, "seconds": 0.0, "cpu_seconds": 0.0, "write_bytes": 0},
+                )
+                tool["cpu_seconds"] += span.args.get("cpu_seconds") or 0.0
+                tool["write_bytes"] += span.args.get("write_bytes") or 0
+            else:
+                tool = phases.setdefault(
+                    span.name, {"count": 0, "seconds": 0.0, "parent": span.parent}
+                )
+            tool["count"] += 1
+            tool["seconds"] += span.seconds
+        end = max([s.start + s.seconds for s in spans] or [self.origin])
+        return {
+            "seconds": end - self.origin,
+            "phases": phases,
+            "subprocesses": tools,
+        }
+
+    def write(self, directory):
+        """Write ``trace.json`` and ``trace-summary.json`` to `directory`."""
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        trace_file = os.path.join(directory, "trace.json")
+        with open(trace_file, "w") as fp:
+            json.dump(self.chrome_trace(), fp)
+        with open(os.path.join(directory, "trace-summary.json"), "w") as fp:
+            json.dump(self.summary(), fp, indent=2, sort_keys=True)
+        return trace_file
+
+
+def start_trace():
+    """Begin a new trace, replacing any previous one."""
+    global _tracer
+    stop_trace()
+    _tracer = Tracer()
+    runner.add_listener(_tracer.add_command)
+    return _tracer
+
+
+def stop_trace():
+    """Stop recording and return the finished tracer, if any."""
+    global _tracer
+    tracer, _tracer = _tracer, None
+    if tracer is not None:
+        runner.remove_listener(tracer.add_command)
+    return tracer
+
+
+def get_tracer():
+    return _tracer
+
+
+def span(name, **args):
+    """Time the enclosed block as phase `name`; a no-op when not tracing."""
+    if _tracer is None:
+        return contextlib.nullcontext()
+    return _tracer.span(name, **args)
+
+
+def traced(func):
+    """Decorator recording each call of `func` as a span of the same name."""
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with span(func.__name__):
+            return func(*args, **kwargs)
+
+    return wrapper
+
+
+def format_summary(summary, limit=10):
+    """The slowest phases and tools, for the build log."""
+    from . import format_filesize
+
+    rows = ["%-32s %6s %9s %9s %10s" % ("Phase", "Calls", "Seconds", "CPU", "Written")]
+    entries = [(name, phase, None) for name, phase in summary["phases"].items()]
+    entries += [
+        ("[%s]" % name, tool, tool) for name, tool in summary["subprocesses"].items()
+    ]
+    entries.sort(key=lambda entry: -entry[1]["seconds"])
+    for name, entry, tool in entries[:limit]:
+        rows.append(
+            "%-32s %6d %9.1f %9s %10s"
+            % (
+                name,
+                entry["count"],
+                entry["seconds"],
+                "" if tool is None else "%.1f" % tool["cpu_seconds"],
+                "" if tool is None else format_filesize(tool["write_bytes"]),
+            )
+        )
+    return "\n".join(rows)
@@ -0,0 +1,105 @@
+"""Several installers built from one dist directory.
+
+Per-language or per-edition installers only differ in their Inno Setup
+script, so they can share a single freeze and signing pass. Each
+`InstallerVariant` names its own extra script text, language set and
+output filename; the scripts are rendered one after the other and then
+compiled concurrently, with as many ISCC processes as the machine has
+cores and memory for.
+"""
+
+import concurrent.futures
+import ctypes
+import os
+
+# Rough peak working set of one ISCC run with LZMA2 compression
+DEFAULT_COMPILE_MEMORY = 1024 * 1024 * 1024
+
+
+class InstallerVariant(object):
+    """One installer built from the shared dist directory."""
+
+    def __init__(
+        self, name, extra_inno_script=None, languages=None, output_base_filename=None
+    ):
+        self.name = name
+        self.extra_inno_script = extra_inno_script
+        self.languages = languages
+        self.output_base_filename = output_base_filename
+
+    @classmethod
+    def from_value(cls, value):
+        """Accept an `InstallerVariant` or a dict of its arguments."""
+        if isinstance(value, cls):
+            return value
+        return cls(**value)
+
+    def get_output_base_filename(self, app_name, version):
+        if self.output_base_filename:
+            return self.output_base_filename
+        return "%s-%s-%s-setup" % (app_name, version, self.name)
+
+    def installer_filename(self, app_name, version):
+        return self.get_output_base_filename(app_name, version) + ".exe"
+
+    def __repr__(self):
+        return "<InstallerVariant %s>" % self.name
+
+
+def available_memory():
+    """Return the physical memory currently available in bytes, or None."""
+    if os.name == "nt":
+
+        class MEMORYSTATUSEX(ctypes.Structure):
+            _fields_ = [
+                ("dwLength", ctypes.c_ulong),
+                ("dwMemoryLoad", ctypes.c_ulong),
+                ("ullTotalPhys", ctypes.c_ulonglong),
+                ("ullAvailPhys", ctypes.c_ulonglong),
+                ("ullTotalPageFile", ctypes.c_ulonglong),
+                ("ullAvailPageFile", ctypes.c_ulonglong),
+                ("ullTotalVirtual", ctypes.c_ulonglong),
+                ("ullAvailVirtual", ctypes.c_ulonglong),
+                ("ullAvailExtendedVirtual", ctypes.c_ulonglong),
+            ]
+
+        status = MEMORYSTATUSEX()
+        status.dwLength = ctypes.sizeof(status)
+        if ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(status)):
+            return status.ullAvailPhys
+        return None
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def pool_size(
+    jobs, memory_per_job=DEFAULT_COMPILE_MEMORY, cpu_count=None, memory=None
+):
+    """Number of compiles to run at once for `jobs` variants."""
+    if cpu_count is None:
+        cpu_count = os.cpu_count() or 1
+    if memory is None:
+        memory = available_memory()
+    workers = min(jobs, cpu_count)
+    if memory is not None and memory_per_job:
+        workers = min(workers, memory // memory_per_job)
+    return max(1, workers)
+
+
+def compile_variants(scripts, max_workers=None):
+    """Compile prepared scripts concurrently and return their outputs in order.
+
+    Each script only needs a ``compile_script()`` method. The real work
+    happens in the ISCC child processes, so the pool's threads just wait on
+    them. The first failure is raised once every compile has finished.
+    """
+    if max_workers is None:
+        max_workers = pool_size(len(scripts))
+    if max_workers <= 1 or len(scripts) <= 1:
+        return [script.compile_script() for script in scripts]
+    with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+        futures = [executor.submit(script.compile_script) for script in scripts]
+        concurrent.futures.wait(futures)
+    return [future.result() for future in futures]
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Pytest tests for binary patches in update archives.
+"""
+import os
+import random
+import zipfile
+
+import pytest
+
+from installer_builder import bindiff
+
+
+def _write(path, data):
+    directory = os.path.dirname(path)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def _read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+@pytest.fixture
+def payload():
+    rng = random.Random(1234)
+    return bytes(rng.getrandbits(8) for _ in range(300 * 1024))
+
+
+class TestPatches:
+    """Round-trip patches on synthetic files."""
+
+    def test_round_trip_small_edits(self, tmp_path, payload):
+        old = payload
+        new = old[:1000] + b"inserted bytes" + old[1000:150000] + old[150100:]
+        new = new[:-5000] + b"X" * 7000
+        _write(str(tmp_path / "old"), old)
+        _write(str(tmp_path / "new"), new)
+
+        size = bindiff.create_patch(
+            str(tmp_path / "old"), str(tmp_path / "new"), str(tmp_path / "patch")
+        )
+        assert size is not None
+        assert size < len(new) // 10
+
+        bindiff.apply_patch(
+            str(tmp_path / "old"), str(tmp_path / "patch"), str(tmp_path / "out")
+        )
+        assert _read(str(tmp_path / "out")) == new
+
+    def test_unrelated_files_fall_back(self, tmp_path, payload):
+        _write(str(tmp_path / "old"), payload)
+        _write(str(tmp_path / "new"), os.urandom(len(payload)))
+
+        result = bindiff.create_patch(
+            str(tmp_path / "old"), str(tmp_path / "new"), str(tmp_path / "patch")
+        )
+        assert result is None
+        assert not os.path.exists(str(tmp_path / "patch"))
+
+    def test_apply_rejects_wrong_base(self, tmp_path, payload):
+        _write(str(tmp_path / "old"), payload)
+        _write(str(tmp_path / "new"), payload + b"tail")
+        _write(str(tmp_path / "other"), payload[:-1])
+        bindiff.create_patch(
+            str(tmp_path / "old"), str(tmp_path / "new"), str(tmp_path / "patch")
+        )
+
+        with pytest.raises(bindiff.PatchError):
+            bindiff.apply_patch(
+                str(tmp_path / "other"), str(tmp_path / "patch"), str(tmp_path / "out")
+            )
+
+
+@pytest.mark.parametrize("base_is_archive", [False, True])
+def test_patch_archive_round_trip(tmp_path, payload, base_is_archive):
+    old_dir, new_dir = tmp_path / "old", tmp_path / "new"
+    _write(str(old_dir / "library.zip"), payload)
+    _write(str(old_dir / "app.exe"), b"same")
+    _write(str(old_dir / "removed.txt"), b"gone")
+    _write(str(new_dir / "library.zip"), payload[:5000] + b"changed" + payload[5000:])
+    _write(str(new_dir / "app.exe"), b"same")
+    _write(str(new_dir / "data" / "new.txt"), b"new file")
+
+    base = str(old_dir)
+    if base_is_archive:
+        base = str(tmp_path / "old.zip")
+        with zipfile.ZipFile(base, "w") as archive:
+            for name in ("library.zip", "app.exe", "removed.txt"):
+                archive.write(str(old_dir / name), name)
+
+    manifest = bindiff.create_patch_archive(
+        base, str(new_dir), str(tmp_path / "patch.zip"), threshold=1024, max_workers=2
+    )
+    assert manifest["files"] == {
+        "library.zip": "patch",
+        "data/new.txt": "add",
+        "removed.txt": "delete",
+    }
+
+    bindiff.apply_patch_archive(str(tmp_path / "patch.zip"), str(old_dir))
+    assert _read(str(old_dir / "library.zip")) == _read(str(new_dir / "library.zip"))
+    assert _read(str(old_dir / "data" / "new.txt")) == b"new file"
+    assert not os.path.exists(str(old_dir / "removed.txt"))
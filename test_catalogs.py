@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Pytest tests for compiling and caching gettext catalogs.
+"""
+import gettext
+import io
+import os
+
+import pytest
+
+from installer_builder import InstallerBuilder, catalogs
+
+PO = """# German translations
+msgid ""
+msgstr ""
+"Content-Type: text/plain; charset=%s\\n"
+"Plural-Forms: nplurals=2; plural=(n != 1);\\n"
+
+#: app.py:1
+msgid "Hello"
+msgstr "Hallo"
+
+#, fuzzy
+msgid "Fuzzy"
+msgstr "Flauschig"
+
+msgctxt "menu"
+msgid "File"
+msgstr "Datei"
+
+msgid "%%d file"
+msgid_plural "%%d files"
+msgstr[0] "%%d Datei"
+msgstr[1] "%%d Dateien"
+
+msgid "Untranslated"
+msgstr ""
+
+msgid ""
+"Multi "
+"line"
+msgstr "Mehrere "
+"Zeilen \\"\\u00e4\\""
+
+#~ msgid "Obsolete"
+#~ msgstr "Veraltet"
+"""
+
+
+def translations(mo):
+    return gettext.GNUTranslations(io.BytesIO(mo))
+
+
+class TestCompile:
+    @pytest.mark.parametrize("charset", ["UTF-8", "ISO-8859-1"])
+    def test_compile_po(self, charset):
+        t = translations(catalogs.compile_po((PO % charset).encode(charset)))
+        assert t.gettext("Hello") == "Hallo"
+        assert t.gettext("Fuzzy") == "Fuzzy"
+        assert t.pgettext("menu", "File") == "Datei"
+        assert t.ngettext("%d file", "%d files", 1) == "%d Datei"
+        assert t.ngettext("%d file", "%d files", 3) == "%d Dateien"
+        assert t.gettext("Untranslated") == "Untranslated"
+        assert t.gettext("Multi line") == 'Mehrere Zeilen "ä"'
+        assert t.gettext("Obsolete") == "Obsolete"
+        assert t.info()["content-type"].endswith(charset)
+
+    def test_errors(self):
+        with pytest.raises(catalogs.CatalogError):
+            catalogs.parse_po(b'msgid "a"\nmsgstr b\n', "bad.po")
+        with pytest.raises(catalogs.CatalogError):
+            catalogs.parse_po(b'msgstr "a"\n')
+
+
+def write_catalog(path, text=PO % "UTF-8"):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text, encoding="utf-8")
+    return str(path)
+
+
+class TestCompileCatalogs:
+    def test_cache(self, tmp_path):
+        de = write_catalog(tmp_path / "locale" / "de" / "LC_MESSAGES" / "app.po")
+        fr = write_catalog(
+            tmp_path / "locale" / "fr" / "LC_MESSAGES" / "app.po",
+            PO.replace("Hallo", "Bonjour") % "UTF-8",
+        )
+        assert catalogs.find_catalogs(str(tmp_path / "locale")) == [de, fr]
+        cache_dir = str(tmp_path / "cache")
+
+        first = catalogs.compile_catalogs([de, fr], cache_dir)
+        assert (first.compiled, first.reused, first.errors) == (2, 0, {})
+        with open(first.catalogs[fr], "rb") as fp:
+            assert translations(fp.read()).gettext("Hello") == "Bonjour"
+
+        second = catalogs.compile_catalogs([de, fr], cache_dir)
+        assert (second.compiled, second.reused) == (0, 2)
+
+        with open(de, "a") as fp:
+            fp.write('\nmsgid "Bye"\nmsgstr "Tschuss"\n')
+        third = catalogs.compile_catalogs([de, fr], cache_dir)
+        assert (third.compiled, third.reused) == (1, 1)
+
+    def test_errors(self, tmp_path):
+        bad = write_catalog(tmp_path / "bad.po", 'msgid "a"\nmsgstr nope\n')
+        result = catalogs.compile_catalogs([bad], str(tmp_path / "cache"))
+        assert list(result.errors) == [bad]
+        assert result.catalogs == {}
+
+    def test_stale_catalogs(self, tmp_path):
+        po = write_catalog(tmp_path / "app.po")
+        mo = tmp_path / "app.mo"
+        mo.write_bytes(b"")
+        os.utime(str(mo), (0, 0))
+        assert catalogs.stale_catalogs([po]) == [po]
+        os.utime(str(mo), None)
+        os.utime(po, (0, 0))
+        assert catalogs.stale_catalogs([po]) == []
+
+
+def test_builder_bundles_compiled_catalogs(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("INSTALLER_BUILDER_CACHE", str(tmp_path / "cache"))
+    messages = tmp_path / "locale" / "de" / "LC_MESSAGES"
+    write_catalog(messages / "app.po")
+    (messages / "app.mo").write_bytes(b"stale")
+    os.utime(str(messages / "app.mo"), (0, 0))
+    (tmp_path / "locale" / "fr" / "LC_MESSAGES").mkdir(parents=True)
+    (tmp_path / "locale" / "fr" / "LC_MESSAGES" / "app.mo").write_bytes(b"mo only")
+
+    builder = InstallerBuilder(
+        main_module="app.py", name="App", version="1.0", has_translations=True
+    )
+    builder.build_catalogs()
+    data = sorted(builder.find_application_language_data())
+    assert data == [
+        (
+            os.path.join("locale", "de", "LC_MESSAGES"),
+            [
+                os.path.join(
+                    "build", "catalogs", "application", "de", "LC_MESSAGES", "app.mo"
+                )
+            ],
+        ),
+        (
+            os.path.join("locale", "fr", "LC_MESSAGES"),
+            [os.path.join("locale", "fr", "LC_MESSAGES", "app.mo")],
+        ),
+    ]
+    with open(data[0][1][0], "rb") as fp:
+        assert translations(fp.read()).gettext("Hello") == "Hallo"
+
+
+def test_builder_keeps_mo_of_broken_catalog(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("INSTALLER_BUILDER_CACHE", str(tmp_path / "cache"))
+    messages = tmp_path / "locale" / "de" / "LC_MESSAGES"
+    write_catalog(messages / "app.po", 'msgid "a"\nmsgstr nope\n')
+    (messages / "app.mo").write_bytes(b"last good")
+    write_catalog(tmp_path / "locale" / "fr" / "LC_MESSAGES" / "app.po", "msgid \n")
+
+    builder = InstallerBuilder(
+        main_module="app.py", name="App", version="1.0", has_translations=True
+    )
+    builder.build_catalogs()
+    assert builder.compiled_catalogs == {}
+    assert sorted(builder.find_application_language_data()) == [
+        (
+            os.path.join("locale", "de", "LC_MESSAGES"),
+            [os.path.join("locale", "de", "LC_MESSAGES", "app.mo")],
+        ),
+    ]
+    output = capsys.readouterr().out
+    kept = os.path.join("locale", "de", "LC_MESSAGES", "app.mo")
+    assert "keeping %s" % kept in output
+    assert "leaving it out" in output
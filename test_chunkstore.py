@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Pytest tests for the deduplicating release artifact store.
+"""
+import io
+import os
+import random
+
+import pytest
+
+from installer_builder import chunkstore
+
+
+@pytest.fixture
+def release():
+    rng = random.Random(42)
+    return bytes(rng.getrandbits(8) for _ in range(600 * 1024))
+
+
+def _write(path, data):
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+class TestChunking:
+    """Test content-defined chunking."""
+
+    def test_chunks_cover_input(self, release):
+        chunks = list(chunkstore.iter_chunks(io.BytesIO(release)))
+        assert b"".join(chunks) == release
+        assert all(len(c) <= chunkstore.DEFAULT_MAX_CHUNK for c in chunks)
+        assert all(len(c) >= chunkstore.DEFAULT_MIN_CHUNK for c in chunks[:-1])
+
+    def test_insertion_only_changes_nearby_chunks(self, release):
+        edited = release[:100000] + b"a few new bytes" + release[100000:]
+        before = set(chunkstore.iter_chunks(io.BytesIO(release)))
+        after = list(chunkstore.iter_chunks(io.BytesIO(edited)))
+        changed = [c for c in after if c not in before]
+        assert len(changed) <= 2
+
+    def test_empty_input(self):
+        assert list(chunkstore.iter_chunks(io.BytesIO(b""))) == []
+
+    def test_boundary_frequency(self, release):
+        matches = len(chunkstore.boundary_pattern(4096).findall(release * 4))
+        assert 300 < matches < 1200
+
+    def test_low_entropy_input(self):
+        data = bytes(1024 * 1024)
+        chunks = list(chunkstore.iter_chunks(io.BytesIO(data)))
+        assert b"".join(chunks) == data
+        assert all(len(c) <= chunkstore.DEFAULT_MAX_CHUNK for c in chunks)
+
+
+class TestChunkStore:
+    """Test storing and rebuilding artifacts."""
+
+    def test_rebuild_and_dedup(self, tmp_path, release):
+        store = chunkstore.ChunkStore(str(tmp_path / "store"))
+        _write(str(tmp_path / "v1.exe"), release)
+        _write(str(tmp_path / "v2.exe"), release[:300000] + b"patch" + release[300000:])
+
+        first = store.add(str(tmp_path / "v1.exe"))
+        second = store.add(str(tmp_path / "v2.exe"))
+        assert first["new_bytes"] == len(release)
+        assert second["new_bytes"] < len(release) // 4
+        assert store.artifacts() == ["v1.exe", "v2.exe"]
+
+        store.rebuild("v2.exe", str(tmp_path / "rebuilt.exe"))
+        with open(str(tmp_path / "rebuilt.exe"), "rb") as f:
+            assert f.read() == release[:300000] + b"patch" + release[300000:]
+
+    def test_import_transfers_missing_chunks_only(self, tmp_path, release):
+        source = chunkstore.ChunkStore(str(tmp_path / "source"))
+        target = chunkstore.ChunkStore(str(tmp_path / "target"))
+        _write(str(tmp_path / "v1.exe"), release)
+        _write(str(tmp_path / "v2.exe"), release + b"tail")
+        source.add(str(tmp_path / "v1.exe"))
+        source.add(str(tmp_path / "v2.exe"))
+        target.import_artifact(source, "v1.exe")
+
+        transferred = target.import_artifact(source, "v2.exe")
+        assert len(transferred) == 1
+        target.rebuild("v2.exe", str(tmp_path / "out.exe"))
+        assert os.path.getsize(str(tmp_path / "out.exe")) == len(release) + 4
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Pytest tests for installer payload compression decisions.
+"""
+import json
+import os
+import sys
+import zipfile
+
+import pytest
+
+from installer_builder import compression
+
+
+class TestIncompressible:
+    """Test detection of already-compressed payload files."""
+
+    def test_extension_rules(self, tmp_path):
+        for name in ("click.ogg", "music.MP3", "icon.png"):
+            (tmp_path / name).write_bytes(b"\x00" * 100)
+            assert compression.is_incompressible(str(tmp_path / name))
+
+    def test_small_unknown_files_are_compressed(self, tmp_path):
+        (tmp_path / "tiny.bin").write_bytes(os.urandom(100))
+        assert not compression.is_incompressible(str(tmp_path / "tiny.bin"))
+
+    def test_sampled_content(self, tmp_path):
+        (tmp_path / "random.dat").write_bytes(os.urandom(200 * 1024))
+        (tmp_path / "text.dat").write_bytes(b"hello world " * 20000)
+        assert compression.is_incompressible(str(tmp_path / "random.dat"))
+        assert not compression.is_incompressible(str(tmp_path / "text.dat"))
+
+    def test_zip_members(self, tmp_path):
+        payload = b"def f():\n    return 1\n" * 5000
+        with zipfile.ZipFile(str(tmp_path / "library.zip"), "w") as archive:
+            archive.writestr("mod.pyc", payload)
+        with zipfile.ZipFile(
+            str(tmp_path / "deflated.zip"), "w", zipfile.ZIP_DEFLATED
+        ) as archive:
+            archive.writestr("mod.pyc", payload)
+
+        assert not compression.is_incompressible(str(tmp_path / "library.zip"))
+        assert compression.is_incompressible(str(tmp_path / "deflated.zip"))
+
+
+FAKE_ISCC = r'''
+import json, os, sys
+script = open(sys.argv[-1], encoding="utf-8-sig").read()
+setup = {}
+section = None
+for line in script.splitlines():
+    line = line.strip()
+    if line.startswith("["):
+        section = line
+    elif section == "[Setup]" and "=" in line:
+        key, value = line.split("=", 1)
+        setup[key] = value
+output = os.path.join(setup["OutputDir"], setup["OutputBaseFilename"] + ".exe")
+with open(output, "w") as fp:
+    json.dump(setup, fp)
+'''
+
+
+class TestCompressionProfiles:
+    """Test compression profiles and the profile benchmark."""
+
+    def test_block_threads_follow_cpu_count(self):
+        assert compression.profile_directives("fast-dev", 12)["LZMANumBlockThreads"] == "12"
+        assert compression.profile_directives("fast-dev", 128)["LZMANumBlockThreads"] == "32"
+        assert compression.profile_directives("max-ratio", 12)["LZMANumBlockThreads"] == "2"
+        with pytest.raises(ValueError):
+            compression.profile_directives("turbo")
+
+    def test_apply_setup_directives(self):
+        script = "[Setup]\nAppName=Test\ncompression=zip\n\n[Files]\nSource: a\n"
+        result = compression.apply_setup_directives(
+            script, {"Compression": "lzma2/fast", "SolidCompression": "no"}
+        )
+        lines = result.splitlines()
+        assert "Compression=lzma2/fast" in lines
+        assert "compression=zip" not in lines
+        assert lines.index("SolidCompression=no") < lines.index("[Files]")
+        assert compression.apply_setup_directives("", {"A": "1"}) == "[Setup]\nA=1\n"
+
+    def test_benchmark_profiles(self, tmp_path):
+        iscc = tmp_path / "iscc.py"
+        iscc.write_text(FAKE_ISCC)
+        issfile = tmp_path / "distutils.iss"
+        issfile.write_text("[Setup]\nAppName=Test\nCompression=zip\n")
+
+        results = compression.benchmark_profiles(
+            str(issfile),
+            [sys.executable, str(iscc)],
+            profiles=["fast-dev", "max-ratio"],
+            cpu_count=4,
+        )
+        assert [r["profile"] for r in results] == ["fast-dev", "max-ratio"]
+        with open(str(tmp_path / "benchmark" / "fast-dev.exe")) as fp:
+            compiled = json.load(fp)
+        assert compiled["Compression"] == "lzma2/fast"
+        assert compiled["LZMANumBlockThreads"] == "4"
+        assert sorted(os.listdir(str(tmp_path))) == ["benchmark", "distutils.iss", "iscc.py"]
+        assert "fast-dev" in compression.format_benchmark(results)
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Pytest tests for the shared dist tree index.
+"""
+import os
+import zipfile
+
+from installer_builder import distindex
+
+
+def _make_dist(root):
+    (root / "lib" / "pkg").mkdir(parents=True)
+    (root / "empty").mkdir()
+    (root / "App.exe").write_bytes(b"MZ" + b"\x00" * 10)
+    (root / "python311.dll").write_bytes(b"MZ")
+    (root / "lib" / "_socket.pyd").write_bytes(b"MZ")
+    (root / "lib" / "library.zip").write_bytes(b"PK")
+    (root / "lib" / "pkg" / "data.txt").write_bytes(b"data")
+
+
+class TestDistIndex:
+    """Test scanning, querying and updating the index."""
+
+    def test_scan(self, tmp_path):
+        _make_dist(tmp_path)
+        index = distindex.DistIndex(str(tmp_path))
+
+        assert len(index) == 5
+        assert sorted(index.relpath(e) for e in index) == sorted(
+            [
+                "App.exe",
+                "python311.dll",
+                os.path.join("lib", "_socket.pyd"),
+                os.path.join("lib", "library.zip"),
+                os.path.join("lib", "pkg", "data.txt"),
+            ]
+        )
+        exes = [e.name for e in index.iter_files(kinds=(distindex.KIND_EXE,))]
+        assert exes == ["App.exe"]
+        dlls = [e.name for e in index.iter_files(kinds=(distindex.KIND_DLL,))]
+        assert sorted(dlls) == ["_socket.pyd", "python311.dll"]
+        assert [e.name for e in index.iter_files(prefix="lib/pkg")] == ["data.txt"]
+        assert index.total_size() == 12 + 2 + 2 + 2 + 4
+        # Directory names are stored once and shared between entries
+        assert index.dirs.count("lib") == 1
+
+    def test_refresh(self, tmp_path):
+        _make_dist(tmp_path)
+        index = distindex.DistIndex(str(tmp_path))
+
+        (tmp_path / "App.exe").write_bytes(b"MZ signed and larger")
+        assert index.refresh(str(tmp_path / "App.exe")).size == 20
+
+        (tmp_path / "new").mkdir()
+        (tmp_path / "new" / "setup.exe").write_bytes(b"MZ")
+        index.refresh(str(tmp_path / "new" / "setup.exe"))
+        assert index.lookup(str(tmp_path / "new" / "setup.exe")) is not None
+
+        (tmp_path / "python311.dll").unlink()
+        index.refresh(str(tmp_path / "python311.dll"))
+        assert index.lookup(str(tmp_path / "python311.dll")) is None
+        assert len(index) == 5
+
+    def test_write_zip(self, tmp_path):
+        dist = tmp_path / "dist"
+        dist.mkdir()
+        _make_dist(dist)
+        index = distindex.DistIndex(str(dist))
+
+        index.write_zip(str(tmp_path / "all.zip"))
+        with zipfile.ZipFile(str(tmp_path / "all.zip")) as archive:
+            names = set(archive.namelist())
+        assert "lib/pkg/data.txt" in names
+        assert "empty/" in names
+
+        index.write_zip(str(tmp_path / "lib.zip"), prefix="lib")
+        with zipfile.ZipFile(str(tmp_path / "lib.zip")) as archive:
+            assert sorted(archive.namelist()) == [
+                "_socket.pyd",
+                "library.zip",
+                "pkg/",
+                "pkg/data.txt",
+            ]
+
+    def test_shared_index(self, tmp_path):
+        _make_dist(tmp_path)
+        first = distindex.get_index(str(tmp_path))
+        assert distindex.get_index(str(tmp_path)) is first
+        distindex.discard_index(str(tmp_path))
+        assert distindex.get_index(str(tmp_path)) is not first
+        distindex.discard_index(str(tmp_path))
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Pytest tests for disk image sizing and creation.
+"""
+import zipfile
+
+import pytest
+
+from installer_builder import InstallerBuilder, dmg
+
+
+class TestDiskImage:
+    """Test image sizing and the hdiutil command line."""
+
+    def test_image_size(self):
+        assert dmg.image_size([], slack=0) == 0
+        # Rounded up to whole allocation blocks plus catalog allowance
+        one = dmg.image_size([1], margin=0, slack=0)
+        assert one == dmg.BLOCK_SIZE + dmg.FILE_OVERHEAD
+        big = dmg.image_size([500 * 1024 * 1024])
+        assert big > 550 * 1024 * 1024
+        assert dmg.size_argument(dmg.MEGABYTE + 1) == "2m"
+
+    def test_create_command(self):
+        command = dmg.create_command(
+            "dist/App.app", "dist/App.dmg", 40 * dmg.MEGABYTE, "UDZO",
+            volname="App", compression_level=9,
+        )
+        assert command[:3] == ["create", "-srcfolder", "dist/App.app"]
+        assert command[command.index("-format") + 1] == "UDZO"
+        assert command[command.index("-size") + 1] == "40m"
+        assert "zlib-level=9" in command
+        assert command[-1] == "dist/App.dmg"
+        with pytest.raises(ValueError):
+            dmg.create_command("a", "b", 1, "ULMO", compression_level=9)
+        with pytest.raises(ValueError):
+            dmg.create_command("a", "b", 1, "UDIF")
+
+    def test_create_dmg_with_fake_hdiutil(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        macos = tmp_path / "dist" / "App.app" / "Contents" / "MacOS"
+        macos.mkdir(parents=True)
+        (macos / "App").write_bytes(b"\0" * (3 * 1024 * 1024))
+        for i in range(50):
+            (macos / ("lib%d.so" % i)).write_bytes(b"x" * 100)
+
+        builder = InstallerBuilder(
+            main_module="app.py", name="App", version="1.0",
+            fake_tools=True, dmg_format="ULFO",
+        )
+        monkeypatch.setattr(builder, "installer_filename", lambda: "App-1.0.dmg")
+        builder.create_dmg()
+
+        with zipfile.ZipFile(str(tmp_path / "dist" / "App-1.0.dmg")) as image:
+            assert "App.app/Contents/MacOS/App" in image.namelist()
+        with pytest.raises(ValueError):
+            InstallerBuilder(dmg_format="DMG")
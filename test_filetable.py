@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Pytest tests for the compact file table.
+"""
+import os
+import tracemalloc
+
+import pytest
+
+from installer_builder import distindex, filetable, get_datafiles
+
+
+class TestFileTable:
+    """Test the column storage and its views."""
+
+    def test_columns_and_views(self):
+        table = filetable.FileTable("root")
+        assets = table.dir_id(os.path.join("data", "assets"))
+        assert table.dir_id(os.path.join("data", "assets")) == assets
+        first = table.add(assets, "a.ogg", size=10, kind=2)
+        second = table.add(assets, "b.ogg", size=20)
+
+        assert len(table) == 2
+        assert table.path(first) == os.path.join("root", "data", "assets", "a.ogg")
+        record = table.record(second)
+        assert (record.name, record.size, record.kind) == ("b.ogg", 20, 0)
+        assert table.names.index("b.ogg") == second
+        with pytest.raises(ValueError):
+            table.names.index("missing.ogg")
+
+        table.remove(first)
+        assert len(table) == 1
+        assert [r.name for r in table] == ["b.ogg"]
+
+    def test_file_list_behaves_like_a_sequence(self):
+        table = filetable.FileTable()
+        directory = table.dir_id("lib")
+        files = table.file_list(table.add(directory, n) for n in ("x", "y", "z"))
+
+        expected = [os.path.join("lib", n) for n in ("x", "y", "z")]
+        assert list(files) == expected
+        assert files == expected
+        assert files[-1] == expected[-1]
+        assert list(files[1:]) == expected[1:]
+        assert expected[0] in files
+        assert files + ["extra"] == expected + ["extra"]
+
+    def test_get_datafiles_groups_by_directory(self, tmp_path):
+        (tmp_path / "sub").mkdir()
+        for name in ("a.dat", "b.dat", "skip.txt"):
+            (tmp_path / name).write_bytes(b"")
+        (tmp_path / "sub" / "c.dat").write_bytes(b"")
+
+        datafiles = get_datafiles(str(tmp_path), "*.dat")
+        assert len(datafiles) == 2
+        grouped = dict((target, sorted(files)) for target, files in datafiles)
+        assert grouped[str(tmp_path)] == [
+            str(tmp_path / "a.dat"),
+            str(tmp_path / "b.dat"),
+        ]
+        assert grouped[str(tmp_path / "sub")] == [str(tmp_path / "sub" / "c.dat")]
+
+    def test_file_list_keeps_the_list_interface(self):
+        table = filetable.FileTable()
+        directory = table.dir_id("lib")
+        files = table.file_list(table.add(directory, n) for n in ("y", "x"))
+
+        files.append("extra")
+        files += ["more"]
+        files.sort()
+        assert files == sorted(
+            [os.path.join("lib", "x"), os.path.join("lib", "y"), "extra", "more"]
+        )
+        del files[0]
+        assert len(files) == 3
+        # The backing table is left alone
+        assert len(table) == 2
+
+
+def generated_tree(root, count, files_per_dir=50):
+    for i in range(count):
+        directory = os.path.join(
+            root, "assets", "pack%03d" % (i // 5000), "group%04d" % (i // files_per_dir)
+        )
+        os.makedirs(directory, exist_ok=True)
+        open(os.path.join(directory, "sound_effect_%06d.ogg" % i), "wb").close()
+
+
+def measure(build):
+    tracemalloc.start()
+    result = build()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, current
+
+
+def test_dist_index_memory(tmp_path):
+    """The dist index keeps less than the path lists the dist scan used to."""
+    generated_tree(str(tmp_path), 10000)
+
+    def path_lists():
+        return [
+            os.path.join(root, name)
+            for root, dirnames, filenames in os.walk(str(tmp_path))
+            for name in filenames
+        ]
+
+    def dist_index():
+        # What the dist scan keeps: the shared index plus per-category lists
+        index = distindex.DistIndex(str(tmp_path))
+        return index, index.file_list()
+
+    paths, old_bytes = measure(path_lists)
+    (index, files), new_bytes = measure(dist_index)
+    assert sorted(files) == sorted(paths)
+    assert new_bytes < old_bytes * 0.75
+
+
+def test_get_datafiles_memory(tmp_path, capsys):
+    generated_tree(str(tmp_path), 10000)
+
+    datafiles, new_bytes = measure(lambda: get_datafiles(str(tmp_path), "*.ogg"))
+    # The result used to hold one (target, [path]) tuple per file
+    expanded, old_bytes = measure(
+        lambda: [(target, [path]) for target, files in datafiles for path in files]
+    )
+    assert len(expanded) == 10000
+    assert new_bytes < old_bytes * 0.5
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Pytest tests for installer compile fingerprints.
+"""
+import os
+import shutil
+
+import pytest
+
+from installer_builder import fingerprint
+
+SCRIPT = """\ufeff; generated
+[Setup]
+AppName=Test
+LicenseFile=license.txt
+
+[Files]
+Source: "app.exe"; DestDir: "{app}\\"; Flags: ignoreversion
+Source: "lib\\*"; DestDir: "{app}\\lib"; Flags: ignoreversion recursesubdirs
+Source: "{#PYTHON_DIR}\\python3.dll"; DestDir: "{app}"
+"""
+
+
+def make_tree(root):
+    (root / "lib" / "sub").mkdir(parents=True)
+    (root / "app.exe").write_bytes(b"MZ" + b"\0" * 100)
+    (root / "license.txt").write_text("license")
+    (root / "lib" / "a.pyd").write_bytes(b"a")
+    (root / "lib" / "sub" / "b.pyd").write_bytes(b"b")
+    (root / "distutils.iss").write_text(SCRIPT, encoding="utf-8")
+
+
+class TestScriptSources:
+    """Test discovery of the files a script compiles in."""
+
+    def test_sources(self, tmp_path):
+        make_tree(tmp_path)
+        sources = fingerprint.script_sources(SCRIPT, str(tmp_path))
+        assert sources == [
+            str(tmp_path / "license.txt"),
+            str(tmp_path / "app.exe"),
+            str(tmp_path / "lib" / "a.pyd"),
+            str(tmp_path / "lib" / "sub" / "b.pyd"),
+        ]
+
+    def test_write_if_changed(self, tmp_path):
+        target = str(tmp_path / "out.iss")
+        assert fingerprint.write_if_changed(target, b"one")
+        mtime = os.stat(target).st_mtime_ns
+        assert not fingerprint.write_if_changed(target, b"one")
+        assert os.stat(target).st_mtime_ns == mtime
+        assert fingerprint.write_if_changed(target, b"two")
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    path = tmp_path / "cache"
+    monkeypatch.setenv("INSTALLER_BUILDER_CACHE", str(path))
+    return path
+
+
+class TestCompileCache:
+    """Test skipping compiles with unchanged inputs."""
+
+    def test_round_trip(self, tmp_path):
+        make_tree(tmp_path)
+        issfile = str(tmp_path / "distutils.iss")
+        output = tmp_path / "setup.exe"
+
+        cache = fingerprint.CompileCache(issfile)
+        assert not cache.is_current(str(output))
+        output.write_bytes(b"installer")
+        cache.record(str(output))
+
+        assert fingerprint.CompileCache(issfile).is_current(str(output))
+
+        # Rebuilt with identical contents: only the mtime changes
+        stat = os.stat(str(tmp_path / "app.exe"))
+        os.utime(str(tmp_path / "app.exe"), ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        assert fingerprint.CompileCache(issfile).is_current(str(output))
+
+        (tmp_path / "lib" / "sub" / "b.pyd").write_bytes(b"changed")
+        assert not fingerprint.CompileCache(issfile).is_current(str(output))
+
+    def test_missing_output_and_script_changes(self, tmp_path):
+        make_tree(tmp_path)
+        issfile = str(tmp_path / "distutils.iss")
+        output = tmp_path / "setup.exe"
+        output.write_bytes(b"installer")
+        cache = fingerprint.CompileCache(issfile)
+        cache.fingerprint()
+        cache.record(str(output))
+
+        with open(issfile, "a", encoding="utf-8") as fp:
+            fp.write("[Run]\n")
+        assert not fingerprint.CompileCache(issfile).is_current(str(output))
+
+        cache = fingerprint.CompileCache(issfile)
+        cache.fingerprint()
+        cache.record(str(output))
+        output.unlink()
+        # The installer kept with the state replaces the deleted one
+        assert fingerprint.CompileCache(issfile).is_current(str(output))
+        assert output.read_bytes() == b"installer"
+
+        os.remove(cache.kept_output)
+        assert not fingerprint.CompileCache(issfile).is_current(str(output))
+
+    def test_state_survives_clean_build(self, tmp_path, cache_dir):
+        make_tree(tmp_path / "dist")
+        issfile = str(tmp_path / "dist" / "distutils.iss")
+        output = tmp_path / "dist" / "setup.exe"
+        output.write_bytes(b"installer")
+        fingerprint.CompileCache(issfile).record(str(output))
+        assert os.path.dirname(fingerprint.CompileCache(issfile).state_file) == str(
+            cache_dir / fingerprint.STATE_DIR
+        )
+
+        # The builder deletes dist, then freezes the same files again
+        shutil.rmtree(str(tmp_path / "dist"))
+        make_tree(tmp_path / "dist")
+        assert fingerprint.CompileCache(issfile).is_current(str(output))
+        assert output.read_bytes() == b"installer"
+
+    def test_config_cache(self, tmp_path):
+        make_tree(tmp_path)
+        output = tmp_path / "App-1.0-setup.exe"
+        sources = [str(tmp_path / "app.exe"), str(tmp_path / "license.txt")]
+        output.write_bytes(b"installer")
+        fingerprint.ConfigCache(str(output), "settings", sources).record(str(output))
+
+        cache = fingerprint.ConfigCache(str(output), "settings", sources)
+        assert cache.is_current(str(output))
+        cache = fingerprint.ConfigCache(str(output), "other settings", sources)
+        assert not cache.is_current(str(output))
+        cache = fingerprint.ConfigCache(str(output), "settings", sources[:1])
+        assert not cache.is_current(str(output))
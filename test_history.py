@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Pytest tests for the build history database.
+"""
+import pytest
+
+from installer_builder import history
+
+MB = 1024 * 1024
+
+
+def build(version, seconds=100.0, installer=50 * MB, phases=None, packages=None):
+    return history.BuildRecord(
+        "App",
+        version,
+        "Windows",
+        started=float(version.split(".")[-1]),
+        seconds=seconds,
+        installer_size=installer,
+        dist_size=2 * installer,
+        files=1000,
+        phases=phases or {"setuptools.setup": 60.0, "iscc": 30.0},
+        packages=packages or {"wx": 20 * MB, "requests": 1 * MB},
+    )
+
+
+@pytest.fixture
+def builds(tmp_path):
+    with history.BuildHistory(str(tmp_path / "history.sqlite")) as builds:
+        yield builds
+
+
+class TestBuildHistory:
+    """Test storing builds and computing the baseline."""
+
+    def test_round_trip(self, builds):
+        build_id = builds.record(build("1.0.1"))
+        [stored] = builds.recent("App", "Windows")
+        assert stored.id == build_id
+        assert stored.version == "1.0.1"
+        assert stored.installer_size == 50 * MB
+        assert stored.phases == {"setuptools.setup": 60.0, "iscc": 30.0}
+        assert stored.packages["wx"] == 20 * MB
+        assert builds.recent("App", "Darwin") == []
+
+    def test_baseline_is_the_median_of_recent_builds(self, builds):
+        assert builds.baseline("App", "Windows") is None
+        for i, seconds in enumerate([500.0, 90.0, 100.0, 110.0]):
+            builds.record(build("1.0.%d" % (i + 1), seconds=seconds))
+        baseline = builds.baseline("App", "Windows", window=3)
+        assert baseline.seconds == 100.0
+        assert baseline.phases["iscc"] == 30.0
+
+    def test_regressions(self, builds):
+        for i in range(3):
+            builds.record(build("1.0.%d" % (i + 1)))
+        baseline = builds.baseline("App", "Windows")
+        current = build(
+            "1.0.4",
+            seconds=100.5,
+            phases={"setuptools.setup": 61.0, "iscc": 45.0, "new": 5.0},
+            packages={"wx": 30 * MB, "requests": 1 * MB + 100},
+        )
+        regressions = history.compare(current, baseline, threshold=0.1)
+        assert [(r.kind, r.name) for r in regressions] == [
+            ("phase", "iscc"),
+            ("package", "wx"),
+        ]
+        assert "iscc grew from 30.0s to 45.0s (+50%)" in str(regressions[0])
+
+
+class TestBudgets:
+    """Test failing builds that are too large."""
+
+    def test_check_budgets(self):
+        record = build("1.0.1")
+        history.check_budgets(record, {"installer": 60 * MB, "packages": {"wx": 30 * MB}})
+        with pytest.raises(history.BudgetExceededError) as info:
+            history.check_budgets(
+                record, {"installer": 40 * MB, "packages": {"wx": 10 * MB}}
+            )
+        assert len(info.value.failures) == 2
+        assert "package wx" in str(info.value)
+        with pytest.raises(ValueError):
+            history.check_budgets(record, {"installr": 40 * MB})
+
+
+class TestBuilderHistory:
+    """Test when the builder checks budgets and records builds."""
+
+    def make_builder(self, monkeypatch, calls, finalized=True):
+        from installer_builder import InstallerBuilder
+
+        builder = InstallerBuilder(main_module="app.py", name="App", version="1.0")
+        for name in (
+            "prebuild_message",
+            "remove_previous_build",
+            "build_installer",
+            "perform_postbuild_commands",
+            "report_build_statistics",
+            "report_build_time",
+        ):
+            monkeypatch.setattr(builder, name, lambda name=name: calls.append(name))
+        monkeypatch.setattr(builder, "_installer_was_created", lambda: True)
+        monkeypatch.setattr(builder, "finalize_build", lambda: finalized)
+        return builder
+
+    def test_budgets_fail_before_postbuild(self, monkeypatch):
+        calls = []
+        builder = self.make_builder(monkeypatch, calls)
+
+        def over_budget():
+            calls.append("check_size_budgets")
+            raise history.BudgetExceededError(["installer is too big"])
+
+        monkeypatch.setattr(builder, "check_size_budgets", over_budget)
+        with pytest.raises(history.BudgetExceededError):
+            builder._build(False)
+        assert calls[-1] == "check_size_budgets"
+        assert "perform_postbuild_commands" not in calls
+
+    def test_unmoved_installer_is_not_finalized(self, monkeypatch):
+        calls = []
+        builder = self.make_builder(monkeypatch, calls, finalized=False)
+        monkeypatch.setattr(
+            builder, "check_size_budgets", lambda: calls.append("check_size_budgets")
+        )
+        assert builder._build(False) is False
+        assert "check_size_budgets" not in calls
+        assert "perform_postbuild_commands" not in calls
+
+    def test_recording_is_opt_in(self):
+        from installer_builder import InstallerBuilder
+
+        assert not InstallerBuilder(main_module="app.py").record_history
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Pytest tests for runtime import tracing.
+"""
+import sys
+import zipfile
+
+from installer_builder import importtrace
+
+APP = """
+import sys
+try:
+    import no_such_module_for_the_trace
+except ImportError:
+    pass
+import json
+from email import message
+print("ran", sys.argv[1:])
+"""
+
+
+def make_dist(tmp_path, members):
+    dist = tmp_path / "dist"
+    dist.mkdir()
+    with zipfile.ZipFile(str(dist / "library.zip"), "w") as archive:
+        for name in members:
+            archive.writestr(name, "")
+    (dist / "_testmod.pyd").write_bytes(b"")
+    return [
+        ("library.zip", str(dist / "library.zip"), 0),
+        ("_testmod.pyd", str(dist / "_testmod.pyd"), 0),
+    ]
+
+
+def test_record(tmp_path):
+    script = tmp_path / "app.py"
+    script.write_text(APP)
+    output = str(tmp_path / "imports.txt")
+
+    trace = importtrace.record(str(script), output, ["--flag"])
+    assert "json" in trace.imported and "email.message" in trace.imported
+    assert "no_such_module_for_the_trace" not in trace.imported
+    assert "sys" in trace.startup
+    assert importtrace.ImportTrace.load(output).modules == trace.modules
+
+
+def test_record_survives_a_timeout(tmp_path):
+    script = tmp_path / "gui.py"
+    script.write_text("import json\nimport time\ntime.sleep(30)\n")
+    trace = importtrace.record(str(script), str(tmp_path / "imports.txt"), timeout=1)
+    assert "json" in trace.imported
+
+
+def test_record_keeps_the_last_import_of_a_killed_run(tmp_path):
+    # Nothing is imported after colorsys, and the kill skips atexit
+    script = tmp_path / "gui.py"
+    script.write_text("import time\nimport colorsys\ntime.sleep(30)\n")
+    trace = importtrace.record(str(script), str(tmp_path / "imports.txt"), timeout=1)
+    assert "colorsys" in trace.imported
+
+
+class TestBundle:
+    """Test comparing a trace with the modules in a dist."""
+
+    members = [
+        "json/__init__.pyc",
+        "json/decoder.pyc",
+        "email/__init__.pyc",
+        "email/message.pyc",
+        "email/mime/__init__.pyc",
+        "email/mime/text.pyc",
+        "wx/__init__.pyc",
+        "wx/stc.pyc",
+        "encodings/__init__.pyc",
+        "encodings/cp1252.pyc",
+        "README.txt",
+    ]
+
+    def test_bundled_modules(self, tmp_path):
+        modules = importtrace.bundled_modules(make_dist(tmp_path, self.members))
+        assert "json.decoder" in modules and "email.mime" in modules
+        assert "_testmod" in modules
+        assert "README" not in modules and "README.txt" not in modules
+
+    def test_unused_modules(self, tmp_path):
+        bundled = importtrace.bundled_modules(make_dist(tmp_path, self.members))
+        trace = importtrace.ImportTrace(["sys"], ["json", "email", "email.message"])
+        assert importtrace.unused_modules(bundled, trace) == [
+            "_testmod",
+            "email.mime",
+            "json.decoder",
+            "wx",
+        ]
+
+    def test_missing_modules(self, tmp_path):
+        bundled = importtrace.bundled_modules(make_dist(tmp_path, self.members[2:]))
+        trace = importtrace.ImportTrace([], ["json", "email.message", "sys"])
+        assert importtrace.missing_modules(bundled, trace) == ["json"]
+
+
+def test_check_imports(tmp_path):
+    lib = tmp_path / "library.zip"
+    with zipfile.ZipFile(str(lib), "w") as archive:
+        archive.writestr("present.py", "VALUE = 1\n")
+        archive.writestr("broken.py", "raise RuntimeError('no display')\n")
+    failures = importtrace.check_imports(
+        ["present", "broken", "absent"], [str(lib)], python=sys.executable
+    )
+    assert sorted(failures) == ["absent", "broken"]
+    assert "no display" in failures["broken"]
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Pytest tests for the Inno Setup language catalog.
+"""
+import pytest
+
+from installer_builder import languages
+
+
+def make_inno(root):
+    (root / "Languages").mkdir(parents=True)
+    (root / "ISCC.exe").write_bytes(b"MZ")
+    (root / "Default.isl").write_text("")
+    for name in ("German", "French", "BrazilianPortuguese"):
+        (root / "Languages" / (name + ".isl")).write_text("")
+    (root / "Languages" / "readme.txt").write_text("")
+
+
+class TestLanguageCatalog:
+    """Test scanning, caching and selecting languages."""
+
+    def test_scan_catalog(self, tmp_path):
+        make_inno(tmp_path)
+        assert languages.scan_catalog(str(tmp_path)) == {
+            "Default": "Default.isl",
+            "BrazilianPortuguese": "Languages\\BrazilianPortuguese.isl",
+            "French": "Languages\\French.isl",
+            "German": "Languages\\German.isl",
+        }
+
+    def test_catalog_is_cached(self, tmp_path, monkeypatch):
+        inno = tmp_path / "inno"
+        make_inno(inno)
+        cache_dir = str(tmp_path / "cache")
+        first = languages.language_catalog(str(inno), cache_dir=cache_dir)
+
+        def fail(innopath):
+            raise AssertionError("catalog was rescanned")
+
+        monkeypatch.setattr(languages, "scan_catalog", fail)
+        assert languages.language_catalog(str(inno), cache_dir=cache_dir) == first
+
+        # A different compiler build invalidates the entry
+        monkeypatch.undo()
+        (inno / "ISCC.exe").write_bytes(b"MZ upgraded")
+        (inno / "Languages" / "Dutch.isl").write_text("")
+        catalog = languages.language_catalog(str(inno), cache_dir=cache_dir)
+        assert "Dutch" in catalog
+
+    def test_select_languages(self):
+        catalog = {"Default": "Default.isl", "German": "Languages\\German.isl"}
+        assert languages.select_languages(catalog, ["english", "GERMAN", "Default"]) == [
+            ("Default", "Default.isl"),
+            ("German", "Languages\\German.isl"),
+        ]
+        assert len(languages.select_languages(catalog)) == 2
+        with pytest.raises(ValueError):
+            languages.select_languages(catalog, ["Klingon"])
+        assert languages.parse_languages("German, French") == ["German", "French"]
+        assert languages.parse_languages("") is None
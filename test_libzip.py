@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Pytest tests for reordering library.zip by startup imports.
+"""
+import zipfile
+
+from installer_builder import libzip
+
+MEMBERS = [
+    ("email/__init__.pyc", b"e" * 300),
+    ("json/__init__.pyc", b"j" * 200),
+    ("json/decoder.pyc", b"d" * 100),
+    ("wx/__init__.pyc", b"w" * 1000),
+    ("wx/core.pyc", b"c" * 1000),
+    ("wx/locale/de.mo", b"m" * 50),
+    ("six.pyc", b"s" * 10),
+]
+
+
+def make_library(path):
+    with zipfile.ZipFile(str(path), "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, data in MEMBERS:
+            archive.writestr(name, data)
+    return str(path)
+
+
+def test_reorder_zip(tmp_path):
+    library = make_library(tmp_path / "library.zip")
+    order = ["sys", "six", "json", "json.decoder", "wx"]
+
+    result = libzip.reorder_zip(library, order, store=True)
+    with zipfile.ZipFile(library) as archive:
+        assert archive.namelist() == [
+            "six.pyc",
+            "json/__init__.pyc",
+            "json/decoder.pyc",
+            "wx/__init__.pyc",
+            "email/__init__.pyc",
+            "wx/core.pyc",
+            "wx/locale/de.mo",
+        ]
+        assert archive.read("json/decoder.pyc") == b"d" * 100
+        assert all(i.compress_type == zipfile.ZIP_STORED for i in archive.infolist())
+        hot_end = archive.getinfo("email/__init__.pyc").header_offset
+    assert (result.hot_members, result.members) == (4, 7)
+    assert libzip.hot_region(library) == result.hot_bytes == hot_end
+    assert libzip.prefetch(library) == result.hot_bytes
+
+
+def test_reorder_keeps_compression(tmp_path):
+    library = make_library(tmp_path / "library.zip")
+    output = str(tmp_path / "reordered.zip")
+    libzip.reorder_zip(library, ["wx.core"], output=output)
+    with zipfile.ZipFile(output) as archive:
+        assert archive.namelist()[0] == "wx/core.pyc"
+        assert archive.getinfo("wx/core.pyc").compress_type == zipfile.ZIP_DEFLATED
+    assert libzip.hot_region(library) is None
+    assert libzip.prefetch(library) == 0
+
+
+def test_find_library_zips(tmp_path):
+    make_library(tmp_path / "library.zip")
+    lib = tmp_path / "App.app" / "Contents" / "Resources" / "lib"
+    lib.mkdir(parents=True)
+    make_library(lib / "python311.zip")
+    assert libzip.find_library_zips(str(tmp_path)) == [
+        str(tmp_path / "library.zip"),
+        str(lib / "python311.zip"),
+    ]
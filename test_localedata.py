@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Pytest tests for pruning babel locale-data to the shipped languages.
+"""
+import os
+
+from installer_builder import InstallerBuilder, localedata
+
+PARENT_EXCEPTIONS = {"es_MX": "es_419", "es_419": "es", "zh_Hant": "root"}
+CANONICAL = {"zh_TW": "zh_Hant_TW", "pt_BR": "pt_BR"}
+
+
+def canonicalize(name):
+    return CANONICAL.get(name)
+
+
+def required(locales):
+    return localedata.required_locales(locales, PARENT_EXCEPTIONS, canonicalize)
+
+
+class TestRequiredLocales:
+    def test_normalize(self):
+        assert localedata.normalize("pt-BR") == "pt_BR"
+        assert localedata.normalize("pt_BR.UTF-8") == "pt_BR"
+        assert localedata.normalize("sr@latin") == "sr"
+
+    def test_parents(self):
+        assert required(["pt_BR"]) == {"root", "en", "pt", "pt_BR"}
+        assert required(["es_MX"]) == {"root", "en", "es", "es_419", "es_MX"}
+        assert required(["zh_TW"]) == {
+            "root",
+            "en",
+            "zh",
+            "zh_TW",
+            "zh_Hant",
+            "zh_Hant_TW",
+        }
+        assert required([]) == {"root", "en"}
+
+    def test_prune(self):
+        files = [
+            os.path.join("locale-data", name)
+            for name in ("de.dat", "en.dat", "pt.dat", "pt_BR.dat", "root.dat")
+        ] + [os.path.join("locale-data", "LICENSE.unicode")]
+        kept = localedata.prune(files, ["pt_BR"], PARENT_EXCEPTIONS, canonicalize)
+        assert [os.path.basename(path) for path in kept] == [
+            "en.dat",
+            "pt.dat",
+            "pt_BR.dat",
+            "root.dat",
+            "LICENSE.unicode",
+        ]
+
+
+def test_catalog_locales(tmp_path):
+    for name in ("de/LC_MESSAGES/app.mo", "pt_BR/LC_MESSAGES/app.po"):
+        path = tmp_path / "locale" / name
+        path.parent.mkdir(parents=True)
+        path.write_bytes(b"")
+    (tmp_path / "locale" / "fr" / "LC_MESSAGES").mkdir(parents=True)
+    assert localedata.catalog_locales(str(tmp_path / "locale")) == {"de", "pt_BR"}
+    assert localedata.catalog_locales(str(tmp_path / "missing")) == set()
+
+
+def test_builder_babel_locales(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    builder = InstallerBuilder(main_module="app.py", has_translations=True)
+    assert builder.get_babel_locales() is None
+    (tmp_path / "locale" / "de" / "LC_MESSAGES").mkdir(parents=True)
+    (tmp_path / "locale" / "de" / "LC_MESSAGES" / "app.mo").write_bytes(b"")
+    assert builder.get_babel_locales() == ["de"]
+    builder = InstallerBuilder(main_module="app.py", babel_locales=["fr"])
+    assert builder.get_babel_locales() == ["fr"]
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Pytest tests for Mach-O header parsing and lipo thinning.
+"""
+import struct
+import sys
+
+from installer_builder import faketools, macho
+
+X86_64 = macho.CPU_TYPE_X86 | macho.CPU_ARCH_ABI64
+ARM64 = macho.CPU_TYPE_ARM | macho.CPU_ARCH_ABI64
+
+
+def thin(cputype):
+    return struct.pack("<Ii", macho.MH_MAGIC_64, cputype) + b"\0" * 24
+
+
+def fat(*cputypes, **kwargs):
+    magic = macho.FAT_MAGIC_64 if kwargs.get("wide") else macho.FAT_MAGIC
+    data = struct.pack(">II", magic, len(cputypes))
+    for i, cputype in enumerate(cputypes):
+        offset = 4096 * (i + 1)
+        if kwargs.get("wide"):
+            data += struct.pack(">iiQQII", cputype, 0, offset, 16, 12, 0)
+        else:
+            data += struct.pack(">iiIII", cputype, 0, offset, 16, 12)
+    return data
+
+
+class TestHeaders:
+    """Test recognising thin, fat and foreign files."""
+
+    def test_parse_header(self):
+        assert macho.parse_header(thin(ARM64)).archs == ["arm64"]
+        assert not macho.parse_header(thin(ARM64)).fat
+        big_endian = struct.pack(">Ii", macho.MH_MAGIC, macho.CPU_TYPE_POWERPC)
+        assert macho.parse_header(big_endian).archs == ["ppc"]
+
+        header = macho.parse_header(fat(X86_64, ARM64))
+        assert header.fat and header.archs == ["x86_64", "arm64"]
+        assert macho.parse_header(fat(macho.CPU_TYPE_X86, X86_64, wide=True)).archs == [
+            "i386",
+            "x86_64",
+        ]
+
+    def test_foreign_files(self):
+        java_class = struct.pack(">IHH", macho.FAT_MAGIC, 0, 52)
+        assert macho.parse_header(java_class) is None
+        assert macho.parse_header(b"\x7fELF\x02\x01\x01\0") is None
+        assert macho.parse_header(b"MZ") is None
+
+    def test_needs_thinning(self, tmp_path):
+        files = {
+            "universal.so": fat(X86_64, ARM64),
+            "intel.so": fat(X86_64, macho.CPU_TYPE_X86),
+            "thin.so": thin(ARM64),
+            "text.so": b"not a binary at all",
+        }
+        for name, data in files.items():
+            (tmp_path / name).write_bytes(data)
+        needs = dict(
+            (name, macho.needs_thinning(str(tmp_path / name), "arm64"))
+            for name in files
+        )
+        assert needs == {
+            "universal.so": True,
+            "intel.so": False,
+            "thin.so": False,
+            "text.so": False,
+        }
+
+
+def test_thin_files_only_runs_lipo_on_candidates(tmp_path):
+    (tmp_path / "universal.dylib").write_bytes(fat(X86_64, ARM64))
+    (tmp_path / "thin.dylib").write_bytes(thin(X86_64))
+    filenames = [str(tmp_path / "universal.dylib"), str(tmp_path / "thin.dylib")]
+    lipo = [sys.executable, faketools.__file__, "lipo"]
+
+    thinned = macho.thin_files(filenames, "x86_64", lipo, max_workers=2)
+    assert thinned == [str(tmp_path / "universal.dylib")]
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["thin.dylib", "universal.dylib"]
+
+    def no_lipo():
+        raise AssertionError("lipo should not be needed")
+
+    assert macho.thin_files([str(tmp_path / "thin.dylib")], "x86_64", no_lipo) == []
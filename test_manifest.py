@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Pytest tests for the dist tree manifest.
+"""
+import hashlib
+import json
+
+from installer_builder import manifest
+
+
+def _make_tree(root):
+    (root / "lib").mkdir()
+    (root / "app.exe").write_bytes(b"MZ\x90\x00" + b"\x00" * 60)
+    (root / "lib" / "_ssl.so").write_bytes(b"\xcf\xfa\xed\xfe" + b"\x00" * 28)
+    (root / "lib" / "fat.dylib").write_bytes(b"\xca\xfe\xba\xbe\x00\x00\x00\x02")
+    (root / "lib" / "library.zip").write_bytes(b"PK\x03\x04 contents")
+    (root / "empty.txt").write_bytes(b"")
+
+
+class TestManifest:
+    """Test manifest generation and verification."""
+
+    def test_entries(self, tmp_path):
+        _make_tree(tmp_path)
+        entries = list(manifest.iter_manifest(str(tmp_path), max_workers=2))
+
+        assert [e["path"] for e in entries] == [
+            "app.exe",
+            "empty.txt",
+            "lib/_ssl.so",
+            "lib/fat.dylib",
+            "lib/library.zip",
+        ]
+        types = dict((e["path"], e["type"]) for e in entries)
+        assert types["app.exe"] == "pe"
+        assert types["lib/_ssl.so"] == "macho"
+        assert types["lib/fat.dylib"] == "macho-fat"
+        assert types["lib/library.zip"] == "data"
+        library = entries[-1]
+        assert library["sha256"] == hashlib.sha256(b"PK\x03\x04 contents").hexdigest()
+        assert library["size"] == len(b"PK\x03\x04 contents")
+
+    def test_write_and_verify(self, tmp_path):
+        dist = tmp_path / "dist"
+        dist.mkdir()
+        _make_tree(dist)
+        filename = str(tmp_path / "manifest.jsonl")
+
+        summary = manifest.write_manifest(str(dist), filename)
+        assert summary["files"] == 5
+        with open(filename) as f:
+            assert all(json.loads(line)["path"] for line in f)
+
+        assert manifest.verify_manifest(str(dist), filename) == {
+            "missing": [],
+            "extra": [],
+            "changed": [],
+        }
+
+        (dist / "app.exe").write_bytes(b"MZ changed")
+        (dist / "empty.txt").unlink()
+        (dist / "new.dll").write_bytes(b"MZ")
+        assert manifest.verify_manifest(str(dist), filename) == {
+            "missing": ["empty.txt"],
+            "extra": ["new.dll"],
+            "changed": ["app.exe"],
+        }
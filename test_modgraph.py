@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Pytest tests for the cached module dependency graph.
+"""
+import os
+
+from installer_builder import modgraph
+
+SOURCES = {
+    "main.py": "import app.ui\nfrom app import config\nimport missing_optional\n",
+    "app/__init__.py": "from . import util\n",
+    "app/util.py": "import vendor\n",
+    "vendor/__init__.py": "from . import decoder\n",
+    "vendor/decoder.py": "",
+    "extras.py": "",
+    "app/config.py": "",
+    "app/ui/__init__.py": "from ..util import helper\nfrom .widgets import *\n",
+    "app/ui/widgets.py": "try:\n    import heavy\nexcept ImportError:\n    pass\n",
+    "app/plugins/__init__.py": "",
+    "app/plugins/extra.py": "",
+    "heavy/__init__.py": "import app.config\n",
+}
+
+
+def make_tree(root):
+    for name, source in SOURCES.items():
+        path = root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(source)
+    return str(root)
+
+
+def build(root, **kwargs):
+    kwargs.setdefault("cache_file", os.path.join(root, "cache.json"))
+    return modgraph.build_graph(
+        script=os.path.join(root, "main.py"), path=[root], **kwargs
+    )
+
+
+def test_scan_imports():
+    source = "from __future__ import annotations\nimport a.b, c\nfrom ..d import e\n"
+    assert modgraph.scan_imports(source) == [
+        (0, "a.b", None),
+        (0, "c", None),
+        (2, "d", ["e"]),
+    ]
+
+
+class TestModuleGraph:
+    def test_resolves_imports(self, tmp_path):
+        root = make_tree(tmp_path)
+        graph = build(root)
+        modules = graph.modules()
+        for name in (
+            "app",
+            "app.config",
+            "app.ui",
+            "app.ui.widgets",
+            "app.util",
+            "heavy",
+            "vendor",
+            "vendor.decoder",
+        ):
+            assert name in modules
+        assert "app.plugins" not in modules
+        assert graph.top_level_missing() == ["missing_optional"]
+        assert graph.nodes["app.ui"].kind == modgraph.KIND_PACKAGE
+
+    def test_why(self, tmp_path):
+        graph = build(make_tree(tmp_path))
+        assert graph.why("heavy") == ["__main__", "app.ui", "app.ui.widgets", "heavy"]
+        assert graph.why("app.config") == ["__main__", "app.config"]
+        assert graph.why("app.plugins") is None
+
+    def test_excludes(self, tmp_path):
+        graph = build(make_tree(tmp_path), excludes=["heavy", "vendor"])
+        assert "heavy" not in graph.nodes
+        assert not [name for name in graph.nodes if name.startswith("vendor")]
+        assert graph.top_level_missing() == ["missing_optional"]
+
+    def test_packages(self, tmp_path):
+        graph = build(make_tree(tmp_path), packages=["app"])
+        assert "app.plugins.extra" in graph.modules()
+        assert graph.why("app.plugins.extra") == [
+            "app",
+            "app.plugins",
+            "app.plugins.extra",
+        ]
+
+    def test_save_and_load(self, tmp_path):
+        graph = build(make_tree(tmp_path))
+        filename = str(tmp_path / "graph.json")
+        graph.save(filename)
+        loaded = modgraph.ModuleGraph.load(filename)
+        assert loaded.modules() == graph.modules()
+        assert loaded.top_level_missing() == ["missing_optional"]
+        assert loaded.why("heavy") == graph.why("heavy")
+        assert modgraph.main(["why", filename, "heavy"]) == 0
+        assert modgraph.main(["why", filename, "nothing"]) == 1
+
+
+class TestImportCache:
+    def test_reuses_unchanged_files(self, tmp_path):
+        root = make_tree(tmp_path)
+        cache_file = str(tmp_path / "cache.json")
+        first = build(root, cache_file=cache_file)
+        assert first.import_cache.parsed > 0
+
+        second = build(root, cache_file=cache_file)
+        assert second.import_cache.parsed == 0
+        assert second.modules() == first.modules()
+
+        # Touched without changing: the hash still matches
+        util = tmp_path / "app" / "util.py"
+        stat = util.stat()
+        os.utime(str(util), ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        third = build(root, cache_file=cache_file)
+        assert third.import_cache.parsed == 0
+
+        util.write_text("import vendor\nimport extras\n")
+        fourth = build(root, cache_file=cache_file)
+        # The edited file, and the module it now imports for the first time
+        assert fourth.import_cache.parsed == 2
+        assert "extras" in fourth.modules()
+
+
+def test_builder_feeds_the_freezer(tmp_path, monkeypatch):
+    from installer_builder import InstallerBuilder
+
+    root = make_tree(tmp_path / "src")
+    monkeypatch.setenv("INSTALLER_BUILDER_CACHE", str(tmp_path / "cache"))
+    monkeypatch.chdir(str(tmp_path))
+    builder = InstallerBuilder(
+        main_module=os.path.join(root, "main.py"),
+        name="TestApp",
+        includes=["extras"],
+        module_graph=True,
+    )
+    includes, excludes = builder.freeze_modules()
+    assert "extras" in includes and "vendor.decoder" in includes
+    assert "missing_optional" in excludes
+    assert excludes[: len(builder.excludes)] == builder.excludes
+    assert (tmp_path / "build" / "module-graph.json").exists()
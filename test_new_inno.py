@@ -2,6 +2,7 @@
 """
 Pytest tests for the new innosetup_builder integration.
 """
+import os
 import pytest
 import sys
 import platform
@@ -90,6 +91,202 @@ class TestInnoSetupIntegration:
             pass
 
 
+def test_variant_compression_profile():
+    """Test that variants only accept known compression profiles."""
+    import distutils.dist
+    import distutils.errors
+    from installer_builder.new_inno_command import NewInnoSetupCommand
+
+    cmd = NewInnoSetupCommand(distutils.dist.Distribution())
+    cmd.compression_profile = "fast-dev"
+    cmd.ensure_finalized()
+    assert cmd.compression_profile == "fast-dev"
+
+    cmd = NewInnoSetupCommand(distutils.dist.Distribution())
+    cmd.compression_profile = "smallest"
+    with pytest.raises(distutils.errors.DistutilsOptionError):
+        cmd.ensure_finalized()
+
+
+def fake_innosetup_builder(builds, render=False):
+    """A stand-in for innosetup_builder that records each build.
+
+    With `render`, installers can also render their Inno Setup script.
+    """
+    import types
+
+    module = types.ModuleType("innosetup_builder")
+
+    class Installer:
+        def _render(self):
+            lines = [
+                "[Setup]",
+                "AppName=%s" % self.app_name,
+                "OutputBaseFilename=%s" % self.output_base_filename,
+                "Compression=lzma2/max",
+                "[Languages]",
+                'Name: "english"; MessagesFile: "compiler:Default.isl"',
+                "[Files]",
+            ]
+            for path in self.files:
+                lines.append(
+                    'Source: "%s"; DestDir: "{app}"; Flags: ignoreversion' % path
+                )
+            return "\n".join(lines) + "\n"
+
+    if render:
+        Installer.render = Installer._render
+
+    class InnosetupCompiler:
+        def build(self, installer, dist_dir):
+            builds.append(installer.output_base_filename)
+            output = os.path.join(dist_dir, installer.output_base_filename + ".exe")
+            with open(output, "wb") as fp:
+                fp.write(b"installer %d" % len(builds))
+
+    module.Installer = Installer
+    module.InnosetupCompiler = InnosetupCompiler
+    module.all_files = lambda dist_dir: sorted(
+        os.path.join(dist_dir, name) for name in os.listdir(dist_dir)
+    )
+    return module
+
+
+def test_main_installer_skipped_when_unchanged(tmp_path, monkeypatch):
+    """Test that a clean rebuild of the same dist reuses the installer."""
+    import distutils.dist
+    import shutil
+    from installer_builder import distindex, runner
+    from installer_builder.new_inno_command import NewInnoSetupCommand
+
+    monkeypatch.setenv("INSTALLER_BUILDER_CACHE", str(tmp_path / "cache"))
+    builds = []
+    monkeypatch.setitem(sys.modules, "innosetup_builder", fake_innosetup_builder(builds))
+    dist = tmp_path / "dist"
+
+    def build(payload):
+        if dist.exists():
+            shutil.rmtree(str(dist))
+        distindex.discard_index(str(dist))
+        dist.mkdir()
+        (dist / "TestApp.exe").write_bytes(payload)
+        cmd = NewInnoSetupCommand(
+            distutils.dist.Distribution({"name": "TestApp", "version": "1.0"})
+        )
+        cmd.dist_dir = str(dist)
+        cmd.ensure_finalized()
+        cmd._create_installer()
+        return (dist / "TestApp-1.0-setup.exe").read_bytes()
+
+    runner.reset_metrics()
+    assert build(b"MZ one") == b"installer 1"
+    assert build(b"MZ one") == b"installer 1"
+    assert len(builds) == 1
+    assert [result.label for result in runner.metrics()] == ["innosetup_builder"]
+    assert build(b"MZ two") == b"installer 2"
+    assert len(builds) == 2
+
+
+def test_main_installer_compiled_from_rendered_script(tmp_path, monkeypatch):
+    """Test that a rendered script is adjusted and compiled through the runner."""
+    import distutils.dist
+    from installer_builder import distindex, runner, toolchain
+    from installer_builder.new_inno_command import NewInnoSetupCommand
+
+    monkeypatch.setenv("INSTALLER_BUILDER_CACHE", str(tmp_path / "cache"))
+    builds = []
+    monkeypatch.setitem(
+        sys.modules, "innosetup_builder", fake_innosetup_builder(builds, render=True)
+    )
+    dist = tmp_path / "dist"
+    dist.mkdir()
+    (dist / "TestApp.exe").write_bytes(b"MZ" * 1000)
+    (dist / "theme.ogg").write_bytes(b"OggS" * 1000)
+    distindex.discard_index(str(dist))
+
+    def create_installer():
+        cmd = NewInnoSetupCommand(
+            distutils.dist.Distribution({"name": "TestApp", "version": "1.0"})
+        )
+        cmd.dist_dir = str(dist)
+        cmd.compression_profile = "fast-dev"
+        cmd.languages = "German"
+        cmd.ensure_finalized()
+        cmd._create_installer()
+        return cmd
+
+    runner.reset_metrics()
+    with toolchain.using(toolchain.Toolchain(fake=True)):
+        create_installer()
+        # The installer and script of the first build stay out of the payload
+        create_installer()
+
+    assert builds == []
+    assert (dist / "TestApp-1.0-setup.exe").exists()
+    assert len(runner.metrics()) == 1
+    script = (dist / "distutils.iss").read_text(encoding="utf-8-sig")
+    entries = [line for line in script.splitlines() if line.startswith("Source:")]
+    assert len(entries) == 2
+    exe, ogg = entries
+    assert "nocompression" not in exe
+    assert "theme.ogg" in ogg and "Flags: ignoreversion nocompression" in ogg
+    assert "Compression=lzma2/fast" in script.splitlines()
+    assert "SolidCompression=no" in script.splitlines()
+    # Fake tools have no catalog, so the entry only names the language
+    assert 'Name: "German"; MessagesFile: "compiler:Languages\\German.isl"' in script
+    assert 'Name: "english"' not in script
+
+
+def test_variants_share_installer_config(tmp_path, monkeypatch):
+    """Test that variants name the same application as the main installer."""
+    import distutils.dist
+    from installer_builder.new_inno_command import (
+        NewInnoSetupCommand,
+        create_installer_config,
+        variant_metadata,
+    )
+
+    monkeypatch.setitem(sys.modules, "innosetup_builder", fake_innosetup_builder([]))
+    distribution = distutils.dist.Distribution({
+        "name": "TestApp",
+        "version": "1.0",
+        "author": "Test Author",
+        "description": "A test app",
+        "url": "https://example.com",
+    })
+    cmd = NewInnoSetupCommand(distribution)
+    config = create_installer_config(cmd, str(tmp_path))
+    config.app_name = "Renamed"
+
+    metadata = variant_metadata(config, distribution.metadata)
+    assert metadata.name == "Renamed"
+    assert metadata.version == config.app_version == "1.0"
+    assert metadata.author == config.author == "Test Author"
+    assert metadata.description == config.app_short_description == "A test app"
+    # InnoScript derives the AppId from the url
+    assert metadata.url == "https://example.com"
+    assert distribution.metadata.name == "TestApp"
+
+
+def test_languages():
+    """Test that the builder's languages reach the installer command."""
+    import distutils.dist
+    from installer_builder.new_inno_command import NewInnoSetupCommand
+
+    builder = InstallerBuilder(
+        main_module="test.py",
+        name="TestApp",
+        version="1.0.0",
+        languages=["English", "German"],
+    )
+    assert builder.languages == ["English", "German"]
+
+    cmd = NewInnoSetupCommand(distutils.dist.Distribution())
+    cmd.languages = "English, German"
+    cmd.ensure_finalized()
+    assert cmd.languages == ["English", "German"]
+
+
 def test_legacy_code_still_exists():
     """Test that legacy innosetup.py still exists (until we delete it)."""
     import os
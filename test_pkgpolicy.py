@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Pytest tests for per-package optimization and stripping policies.
+"""
+import hashlib
+import marshal
+import os
+import zipfile
+
+import pytest
+
+from installer_builder import pkgpolicy, pyccache
+
+# Hashes, so the docstring does not just compress away
+DOCSTRING = '"""%s"""\n' % "\n".join(
+    hashlib.sha256(b"%d" % i).hexdigest() for i in range(20)
+)
+SOURCES = {
+    "pkg/__init__.py": DOCSTRING + "VALUE = 1\n",
+    "pkg/mod.py": DOCSTRING + "def f():\n    return 2\n",
+    "keep/__init__.py": DOCSTRING,
+}
+
+
+def compiled(source):
+    code = compile(source, "<test>", "exec", dont_inherit=True)
+    return pyccache.pyc_data(code, source.encode("utf-8"))
+
+
+def members():
+    result = {}
+    for name, source in SOURCES.items():
+        result[name[: -len(".py")] + ".pyc"] = compiled(source)
+    result.update(
+        {
+            "pkg/mod.py": SOURCES["pkg/mod.py"].encode("utf-8"),
+            "pkg/mod.pyi": b"def f() -> int: ...\n",
+            "pkg/py.typed": b"",
+            "pkg/tests/__init__.pyc": compiled(""),
+            "pkg/tests/test_mod.pyc": compiled("assert True\n" * 100),
+            "pkg/__pycache__/mod.cpython-311.pyc": compiled("x = 1\n"),
+            "keep/tests/test_keep.pyc": compiled(""),
+        }
+    )
+    return result
+
+
+@pytest.fixture
+def sources(tmp_path):
+    root = tmp_path / "src"
+    for name, source in SOURCES.items():
+        path = root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(source)
+    return str(root)
+
+
+POLICIES = {
+    "pkg": {
+        "optimize": 2,
+        "drop_sources": True,
+        "drop_tests": True,
+        "drop_pycache": True,
+        "strip_stubs": True,
+    },
+    "*": {"drop_pycache": True},
+}
+
+
+def docstring(data):
+    namespace = {}
+    exec(marshal.loads(data[16:]), namespace)
+    return namespace.get("__doc__")
+
+
+def test_policy_for():
+    policies = pkgpolicy.parse_policies(
+        {"wx": {"optimize": 2}, "wx.lib": {"optimize": 1}, "*": {}}
+    )
+    assert pkgpolicy.policy_for(policies, "wx.lib.agw")[0] == "wx.lib"
+    assert pkgpolicy.policy_for(policies, "wx.core")[0] == "wx"
+    assert pkgpolicy.policy_for(policies, "six")[0] == "*"
+    del policies["*"]
+    assert pkgpolicy.policy_for(policies, "six") == (None, None)
+    with pytest.raises(ValueError):
+        pkgpolicy.PackagePolicy(optimize=3)
+    with pytest.raises(TypeError):
+        pkgpolicy.parse_policies({"wx": {"strip_docs": True}})
+
+
+def test_apply_to_library_zip(tmp_path, sources):
+    dist = tmp_path / "dist"
+    dist.mkdir()
+    library = str(dist / "library.zip")
+    with zipfile.ZipFile(library, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, data in sorted(members().items()):
+            archive.writestr(name, data)
+
+    report = pkgpolicy.apply_to_dist(
+        str(dist),
+        POLICIES,
+        path=[sources],
+        pyc_cache=pyccache.PycCache(str(tmp_path / "cache")),
+    )
+    with zipfile.ZipFile(library) as archive:
+        assert sorted(archive.namelist()) == [
+            "keep/__init__.pyc",
+            "keep/tests/test_keep.pyc",
+            "pkg/__init__.pyc",
+            "pkg/mod.pyc",
+        ]
+        assert docstring(archive.read("pkg/__init__.pyc")) is None
+        assert docstring(archive.read("keep/__init__.pyc")) is not None
+    saved = report.saved["pkg"]
+    assert set(saved) == {"optimize", "sources", "tests", "pycache", "stubs"}
+    assert saved["optimize"] > 0
+    assert report.files["pkg"]["optimize"] == 2
+    assert report.files["pkg"]["tests"] == 2
+    assert "*" not in report.saved
+    assert "Package policies saved" in report.format()
+
+
+def test_apply_to_library_directory(tmp_path, sources):
+    dist = tmp_path / "dist"
+    site_packages = dist / "lib" / "python3.11" / "site-packages"
+    for name, data in members().items():
+        path = site_packages / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+    (site_packages / "keep" / "__pycache__").mkdir()
+    (site_packages / "keep" / "__pycache__" / "x.pyc").write_bytes(b"x" * 10)
+
+    report = pkgpolicy.apply_to_dist(
+        str(dist),
+        POLICIES,
+        path=[sources],
+        pyc_cache=pyccache.PycCache(str(tmp_path / "cache")),
+    )
+    remaining = sorted(
+        os.path.relpath(os.path.join(dirpath, f), str(site_packages)).replace(
+            os.sep, "/"
+        )
+        for dirpath, dirnames, filenames in os.walk(str(site_packages))
+        for f in filenames
+    )
+    assert remaining == [
+        "keep/__init__.pyc",
+        "keep/tests/test_keep.pyc",
+        "pkg/__init__.pyc",
+        "pkg/mod.pyc",
+    ]
+    assert docstring((site_packages / "pkg" / "mod.pyc").read_bytes()) is None
+    assert report.saved["*"] == {"pycache": 10}
+
+
+def test_builder_applies_policies_through_one_hook(tmp_path, monkeypatch):
+    import distutils.dist
+    from installer_builder import InstallerBuilder
+    from installer_builder.new_inno_command import NewInnoSetupCommand
+
+    applied = []
+    monkeypatch.setattr(
+        pkgpolicy,
+        "apply_to_dist",
+        lambda dist_dir, policies, **kwargs: applied.append(dist_dir),
+    )
+    builder = InstallerBuilder(
+        main_module="app.py", package_policies={"*": {"drop_pycache": True}}
+    )
+
+    # The Windows command hands its freshly frozen dist to the builder
+    cmd = NewInnoSetupCommand(distutils.dist.Distribution())
+    cmd.frozen_dist_hook = builder.process_frozen_dist
+    cmd.dist_dir = str(tmp_path)
+    monkeypatch.setattr(cmd, "run_command", lambda name: None)
+    monkeypatch.setattr(cmd, "_create_installer", lambda: None)
+    cmd.ensure_finalized()
+    cmd.run()
+    assert applied == [str(tmp_path)]
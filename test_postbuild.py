@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Pytest tests for the postbuild step graph.
+"""
+import os
+import sys
+
+import pytest
+
+from installer_builder import postbuild
+
+SPAN = (
+    "import sys, time; start = time.time(); time.sleep(0.3); "
+    "print('output of', sys.argv[1]); "
+    "open(sys.argv[2], 'w').write('%f %f' % (start, time.time()))"
+)
+
+
+def span_step(tmp_path, name, **kwargs):
+    return postbuild.PostbuildStep(
+        name,
+        [sys.executable, "-c", SPAN, name, str(tmp_path / (name + ".span"))],
+        **kwargs
+    )
+
+
+def span(tmp_path, name):
+    with open(str(tmp_path / (name + ".span"))) as fp:
+        return [float(t) for t in fp.read().split()]
+
+
+def overlap(a, b):
+    return a[0] < b[1] and b[0] < a[1]
+
+
+class TestMakeSteps:
+    """Test turning postbuild_commands entries into steps."""
+
+    def test_strings_keep_their_order(self):
+        steps = postbuild.make_steps(
+            ["first", {"name": "upload", "command": ["up"]}, "second"]
+        )
+        assert [s.name for s in steps] == ["step1", "upload", "step3"]
+        assert steps[0].shell and not steps[1].shell
+        assert steps[1].depends == []
+        assert steps[2].depends == ["step1"]
+
+    def test_invalid_graphs(self):
+        with pytest.raises(ValueError):
+            postbuild.make_steps([{"name": "a", "command": "x", "depends": ["b"]}])
+        with pytest.raises(ValueError):
+            postbuild.make_steps(
+                [
+                    {"name": "a", "command": "x", "depends": ["b"]},
+                    {"name": "b", "command": "x", "depends": ["a"]},
+                ]
+            )
+        with pytest.raises(ValueError):
+            postbuild.make_steps([{"name": "a", "command": "x"}] * 2)
+
+
+class TestRunGraph:
+    """Test scheduling, limits, failures and collected results."""
+
+    def test_independent_steps_run_concurrently(self, tmp_path):
+        steps = [
+            span_step(tmp_path, "checksum"),
+            span_step(tmp_path, "upload"),
+            span_step(tmp_path, "announce", depends=["upload"]),
+        ]
+        results = postbuild.run_graph(steps, max_workers=4, log_dir=str(tmp_path / "logs"))
+
+        assert [r.status for r in results] == ["ok", "ok", "ok"]
+        assert overlap(span(tmp_path, "checksum"), span(tmp_path, "upload"))
+        assert span(tmp_path, "announce")[0] >= span(tmp_path, "upload")[1]
+        with open(results[1].log_file) as fp:
+            assert fp.read().strip() == "output of upload"
+        assert results[0].seconds >= 0.3
+        if hasattr(os, "wait4"):
+            assert results[0].peak_rss > 1024 * 1024
+        assert "checksum" in postbuild.format_results(results)
+
+    def test_pool_limits(self, tmp_path):
+        steps = [
+            span_step(tmp_path, "upload-a", pool="network"),
+            span_step(tmp_path, "upload-b", pool="network"),
+        ]
+        postbuild.run_graph(
+            steps, max_workers=4, pool_limits={"network": 1}, log_dir=str(tmp_path)
+        )
+        assert not overlap(span(tmp_path, "upload-a"), span(tmp_path, "upload-b"))
+
+    def test_failure_skips_dependents_only(self, tmp_path):
+        steps = [
+            postbuild.PostbuildStep("sign", [sys.executable, "-c", "raise SystemExit(3)"]),
+            span_step(tmp_path, "notarize", depends=["sign"]),
+            span_step(tmp_path, "checksum"),
+        ]
+        with pytest.raises(postbuild.PostbuildError) as info:
+            postbuild.run_graph(steps, log_dir=str(tmp_path))
+        statuses = [(r.status, r.returncode) for r in info.value.results]
+        assert statuses == [("failed", 3), ("skipped", None), ("ok", 0)]
+        assert not (tmp_path / "notarize.span").exists()
+
+    def test_timeout(self, tmp_path):
+        step = postbuild.PostbuildStep(
+            "hang", [sys.executable, "-c", "import time; time.sleep(30)"], timeout=0.2
+        )
+        with pytest.raises(postbuild.PostbuildError) as info:
+            postbuild.run_graph([step], log_dir=str(tmp_path))
+        assert "timed out" in info.value.results[0].error
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Pytest tests for bytecode compilation with a reusable pyc cache.
+"""
+import importlib.util
+import marshal
+
+from installer_builder import pyccache, runner
+
+SOURCE = b'"""Docstring."""\nassert False, "stripped at -O"\nVALUE = 42\n'
+
+
+def make_sources(root):
+    paths = []
+    for name, source in (("a.py", SOURCE), ("b.py", b"import a\n")):
+        path = root / "pkg" / name
+        path.parent.mkdir(exist_ok=True)
+        path.write_bytes(source)
+        paths.append(str(path))
+    return paths
+
+
+def load(pyc_path):
+    with open(pyc_path, "rb") as fp:
+        data = fp.read()
+    assert data[:4] == importlib.util.MAGIC_NUMBER
+    assert int.from_bytes(data[4:8], "little") == pyccache.FLAGS_CHECKED_HASH
+    assert data[8:16] == importlib.util.source_hash(SOURCE)
+    namespace = {}
+    exec(marshal.loads(data[16:]), namespace)
+    return namespace
+
+
+class TestCompileSources:
+    def test_compiles_and_reuses(self, tmp_path):
+        paths = make_sources(tmp_path)
+        pyc_cache = pyccache.PycCache(str(tmp_path / "cache"))
+        first = pyccache.compile_sources(paths, 2, pyc_cache)
+        assert (first.compiled, first.reused, first.errors) == (2, 0, {})
+        namespace = load(first.pycs[paths[0]])
+        assert namespace["VALUE"] == 42
+        assert namespace.get("__doc__") is None
+
+        second = pyccache.compile_sources(paths, 2, pyc_cache)
+        assert (second.compiled, second.reused) == (0, 2)
+        assert second.pycs == first.pycs
+
+        other_level = pyccache.compile_sources(paths, 0, pyc_cache)
+        assert other_level.compiled == 2
+        assert other_level.pycs[paths[0]] != first.pycs[paths[0]]
+
+    def test_keyed_by_contents(self, tmp_path):
+        paths = make_sources(tmp_path)
+        pyc_cache = pyccache.PycCache(str(tmp_path / "cache"))
+        pyccache.compile_sources(paths, 1, pyc_cache)
+        # A copy of the same source somewhere else (another checkout) is a hit
+        copy = tmp_path / "copy.py"
+        copy.write_bytes(SOURCE)
+        result = pyccache.compile_sources([str(copy)], 1, pyc_cache)
+        assert (result.compiled, result.reused) == (0, 1)
+        # ...but its code names the copy, not the file compiled first
+        code = marshal.loads(result.read(str(copy))[pyccache.HEADER_SIZE:])
+        assert code.co_filename == str(copy)
+
+        with open(paths[1], "ab") as fp:
+            fp.write(b"import os\n")
+        result = pyccache.compile_sources(paths, 1, pyc_cache)
+        assert (result.compiled, result.reused) == (1, 1)
+
+    def test_syntax_errors(self, tmp_path):
+        broken = tmp_path / "broken.py"
+        broken.write_text("def (:\n")
+        pyc_cache = pyccache.PycCache(str(tmp_path / "cache"))
+        result = pyccache.compile_sources([str(broken)], 0, pyc_cache)
+        assert list(result.errors) == [str(broken)]
+        assert result.pycs == {}
+
+
+    def test_worker_interpreters(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(pyccache, "MIN_BATCH", 1)
+        paths = make_sources(tmp_path)
+        broken = tmp_path / "broken.py"
+        broken.write_text("def (:\n")
+        pyc_cache = pyccache.PycCache(str(tmp_path / "cache"))
+        runner.reset_metrics()
+        result = pyccache.compile_sources(
+            paths + [str(broken)], 2, pyc_cache, max_workers=2
+        )
+        assert [r.label for r in runner.metrics()] == ["pyccompile"] * 2
+        assert (result.compiled, result.reused) == (2, 0)
+        assert list(result.errors) == [str(broken)]
+        assert load(result.pycs[paths[0]])["VALUE"] == 42
+
+
+def test_builder_precompiles_for_the_dist(tmp_path, monkeypatch):
+    import zipfile
+    from installer_builder import InstallerBuilder
+
+    monkeypatch.setenv("INSTALLER_BUILDER_CACHE", str(tmp_path / "cache"))
+    monkeypatch.chdir(str(tmp_path))
+    src = tmp_path / "src"
+    src.mkdir()
+    (src / "main.py").write_text("import app\n")
+    (src / "app.py").write_bytes(SOURCE)
+    dist = tmp_path / "dist"
+    dist.mkdir()
+    # What the freezer bundled: the same module at level 0
+    frozen = compile(SOURCE, "app.py", "exec", dont_inherit=True)
+    with zipfile.ZipFile(str(dist / "library.zip"), "w") as archive:
+        archive.writestr("app.pyc", pyccache.pyc_data(frozen, SOURCE))
+
+    builder = InstallerBuilder(
+        main_module=str(src / "main.py"),
+        name="TestApp",
+        optimization_level=2,
+        precompile=True,
+    )
+    # Compiled before freezing...
+    builder.freeze_modules()
+    assert builder.precompiled.compiled == 2
+    # ...and swapped in once the dist exists
+    builder.process_frozen_dist(str(dist))
+    with zipfile.ZipFile(str(dist / "library.zip")) as archive:
+        data = archive.read("app.pyc")
+    code = marshal.loads(data[pyccache.HEADER_SIZE:])
+    assert code.co_filename == str(src / "app.py")
+    namespace = {}
+    exec(code, namespace)
+    assert namespace["VALUE"] == 42 and namespace.get("__doc__") is None
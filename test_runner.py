@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Pytest tests for the shared subprocess runner.
+"""
+import os
+import sys
+import threading
+
+import pytest
+
+from installer_builder import runner
+
+SPAN = (
+    "import sys, time; start = time.time(); time.sleep(0.3); "
+    "open(sys.argv[1], 'w').write('%f %f' % (start, time.time()))"
+)
+
+
+@pytest.fixture(autouse=True)
+def restore_job_limit():
+    limit = runner.job_limit()
+    yield
+    runner.set_job_limit(limit)
+
+
+def python(code, *args):
+    return [sys.executable, "-c", code] + list(args)
+
+
+class TestRun:
+    """Test output handling, failures and timeouts."""
+
+    def test_output_tail_and_log(self, tmp_path):
+        log_file = str(tmp_path / "tool.log")
+        result = runner.run(
+            python("import sys; sys.stdout.write('x' * 5000 + 'end')"),
+            echo=False,
+            log_file=log_file,
+            capture_limit=100,
+        )
+        assert result.ok and result.returncode == 0
+        assert result.output.endswith(b"end") and len(result.output) == 100
+        assert result.output_bytes == 5003 and result.truncated
+        with open(log_file, "rb") as fp:
+            assert len(fp.read()) == 5003
+
+    def test_stderr_is_merged(self):
+        result = runner.run(python("import sys; sys.stderr.write('oops')"), echo=False)
+        assert result.output == b"oops"
+
+    def test_command_strings_need_shell(self):
+        with pytest.raises(TypeError):
+            runner.run("echo hello")
+        result = runner.run("echo hello", shell=True, echo=False)
+        assert result.output.strip() == b"hello"
+
+    def test_failure_is_redacted(self):
+        with pytest.raises(runner.CommandError) as info:
+            runner.run(
+                python("raise SystemExit(2)", "/p", "hunter2"),
+                echo=False,
+                redact=["hunter2"],
+            )
+        assert info.value.returncode == 2
+        assert "hunter2" not in str(info.value)
+        assert "********" in str(info.value)
+        result = runner.run(python("raise SystemExit(2)"), check=False, echo=False)
+        assert result.returncode == 2 and not result.ok
+
+    def test_timeout(self):
+        with pytest.raises(runner.CommandError) as info:
+            runner.run(python("import time; time.sleep(30)"), timeout=0.2, echo=False)
+        assert info.value.result.timed_out
+        assert info.value.result.seconds < 10
+        assert "timed out" in str(info.value)
+
+
+class TestJobLimitScope:
+    """Test limits that only apply inside a block."""
+
+    def test_restores_previous_limit(self):
+        runner.set_job_limit(3)
+        with runner.job_limit_scope(1):
+            assert runner.job_limit() == 1
+        assert runner.job_limit() == 3
+        with runner.job_limit_scope(None):
+            assert runner.job_limit() == 3
+
+
+class TestAccounting:
+    """Test the job limit, metrics and listeners."""
+
+    def test_job_limit_serializes(self, tmp_path):
+        runner.set_job_limit(1)
+        threads = [
+            threading.Thread(
+                target=runner.run,
+                args=(python(SPAN, str(tmp_path / name)),),
+                kwargs={"echo": False},
+            )
+            for name in ("a", "b")
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        spans = []
+        for name in ("a", "b"):
+            with open(str(tmp_path / name)) as fp:
+                spans.append([float(t) for t in fp.read().split()])
+        a, b = spans
+        assert not (a[0] < b[1] and b[0] < a[1])
+
+    def test_metrics_and_listeners(self):
+        seen = []
+        runner.reset_metrics()
+        runner.add_listener(seen.append)
+        try:
+            result = runner.run(
+                python("x = bytearray(32 * 1024 * 1024); sum(range(10 ** 6))"),
+                echo=False,
+                label="hog",
+            )
+        finally:
+            runner.remove_listener(seen.append)
+        assert runner.metrics() == [result] and seen == [result]
+        assert result.label == "hog" and result.seconds > 0
+        if hasattr(os, "wait4"):
+            assert result.peak_rss > 32 * 1024 * 1024
+            assert result.cpu_seconds > 0
+            assert result.write_bytes is not None
+
+    def test_track_records_library_calls(self):
+        seen = []
+        runner.reset_metrics()
+        runner.add_listener(seen.append)
+        try:
+            with runner.track("innosetup_builder") as ok:
+                pass
+            with pytest.raises(RuntimeError):
+                with runner.track("innosetup_builder") as failed:
+                    raise RuntimeError("ISCC failed")
+        finally:
+            runner.remove_listener(seen.append)
+        assert runner.metrics() == [ok, failed] and seen == [ok, failed]
+        assert ok.ok and not failed.ok
+        assert ok.label == "innosetup_builder" and ok.seconds >= 0
+
+
+def test_builder_execute_command_is_deprecated(tmp_path):
+    from installer_builder import InstallerBuilder
+
+    builder = InstallerBuilder(main_module="test.py", name="TestApp", version="1.0")
+    marker = tmp_path / "ran"
+    runner.reset_metrics()
+    with pytest.warns(DeprecationWarning):
+        builder.execute_command(
+            runner.display_command(python("open(%r, 'w')" % str(marker)))
+        )
+    assert marker.exists()
+    assert len(runner.metrics()) == 1
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Pytest tests for attributing dist sizes to packages.
+"""
+import zipfile
+
+from installer_builder import sizereport
+
+
+def test_classify_path():
+    assert sizereport.classify_path("lib/wx/_core.pyd") == ("wx", "package", "wx._core")
+    assert sizereport.classify_path(
+        "Contents/Resources/lib/python3.11/yaml/__pycache__/x.cpython-311.pyc"
+    ) == ("yaml", "package", "yaml.x")
+    assert sizereport.classify_path("wx._stc.pyd") == ("wx", "package", "wx._stc")
+    assert sizereport.classify_path("libcrypto-3.dll")[:2] == ("libcrypto-3.dll", "native")
+    assert sizereport.classify_path(
+        "Contents/Frameworks/Python.framework/Versions/3.11/Python"
+    )[:2] == ("Python.framework", "native")
+    assert sizereport.classify_path("locale/de/LC_MESSAGES/app.mo")[:2] == (
+        "locale",
+        "data",
+    )
+
+
+class TestSizeReport:
+    """Test the report over a dist with a library.zip."""
+
+    def make_report(self, tmp_path):
+        library = tmp_path / "library.zip"
+        with zipfile.ZipFile(str(library), "w") as archive:
+            archive.writestr("wx/core.pyc", b"x" * 100)
+            archive.writestr("wx/stc.pyc", b"x" * 30)
+            archive.writestr("pdb.pyc", b"x" * 20)
+            archive.writestr("six.pyc", b"x" * 10)
+        files = [
+            ("library.zip", str(library), library.stat().st_size),
+            ("wx._core.pyd", None, 1000),
+            ("python311.dll", None, 400),
+            ("app.exe", None, 40),
+        ]
+        return sizereport.SizeReport(files)
+
+    def test_attribution(self, tmp_path):
+        report = self.make_report(tmp_path)
+        assert report.sizes() == {
+            "wx": 1130,
+            "pdb": 20,
+            "six": 10,
+            "python311.dll": 400,
+            "app.exe": 40,
+        }
+        assert [o.name for o in report.ranked()][:2] == ["wx", "python311.dll"]
+        assert report.owners["wx"].files == 3
+        assert report.module_size("wx.stc") == 30
+
+    def test_diff(self, tmp_path):
+        report = self.make_report(tmp_path)
+        rows = report.diff({"wx": 1000, "numpy": 500, "six": 10})
+        assert rows[0] == ("numpy", None, 500, -500)
+        assert ("wx", 1130, 1000, 130) in rows
+        assert ("six", 10, 10, 0) in rows
+        text = report.format({"wx": 1000, "numpy": 500})
+        assert "No longer in the dist: numpy" in text
+
+    def test_suggest_excludes(self, tmp_path):
+        report = self.make_report(tmp_path)
+        suggestions = report.suggest_excludes()
+        assert [(s.module, s.helper, s.size) for s in suggestions] == [
+            ("wx.stc", "standard_wx_excludes", 30),
+            ("pdb", "stdlib_excludes", 20),
+        ]
+        assert [s.module for s in report.suggest_excludes(excludes=["wx"])] == ["pdb"]
+        assert "Exclude candidates" in report.format()
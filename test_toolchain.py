@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Pytest tests for the toolchain resolver and the fake tools.
+"""
+import os
+import subprocess
+import zipfile
+
+import pytest
+
+from installer_builder import toolchain
+
+
+@pytest.fixture
+def fake_probe(tmp_path, monkeypatch):
+    tool = tmp_path / "bin" / "lipo"
+    tool.parent.mkdir()
+    tool.write_bytes(b"lipo v1")
+    calls = []
+
+    def probe():
+        calls.append(1)
+        return str(tool), "1.0"
+
+    monkeypatch.setitem(toolchain.PROBES, "lipo", probe)
+    monkeypatch.delenv("INSTALLER_BUILDER_LIPO", raising=False)
+    monkeypatch.delenv(toolchain.FAKE_ENV, raising=False)
+    return tool, calls
+
+
+class TestToolchain:
+    """Test resolution order, memoization and the disk cache."""
+
+    def test_probe_is_memoized_and_cached(self, tmp_path, fake_probe):
+        tool, calls = fake_probe
+        cache_file = str(tmp_path / "toolchain.json")
+
+        chain = toolchain.Toolchain(cache_file=cache_file)
+        assert chain.path("lipo") == str(tool)
+        assert chain.resolve("lipo") is chain.resolve("lipo")
+        assert len(calls) == 1
+
+        cached = toolchain.Toolchain(cache_file=cache_file).resolve("lipo")
+        assert (cached.source, cached.version) == ("cache", "1.0")
+        assert len(calls) == 1
+
+        # A changed binary invalidates the cached entry
+        tool.write_bytes(b"lipo v2, a bit longer")
+        assert toolchain.Toolchain(cache_file=cache_file).resolve("lipo").source == "probe"
+        assert len(calls) == 2
+
+    def test_overrides(self, tmp_path, fake_probe, monkeypatch):
+        cache_file = str(tmp_path / "toolchain.json")
+        other = tmp_path / "other-lipo"
+        other.write_bytes(b"")
+
+        monkeypatch.setenv("INSTALLER_BUILDER_LIPO", str(other))
+        assert toolchain.Toolchain(cache_file=cache_file).resolve("lipo").source == "env"
+
+        chain = toolchain.Toolchain({"lipo": str(fake_probe[0])}, cache_file=cache_file)
+        assert chain.resolve("lipo").source == "config"
+
+        chain = toolchain.Toolchain({"lipo": str(tmp_path / "missing")}, cache_file=cache_file)
+        with pytest.raises(toolchain.ToolNotFoundError):
+            chain.resolve("lipo")
+
+    def test_missing_tool(self, tmp_path, monkeypatch):
+        monkeypatch.setitem(toolchain.PROBES, "hdiutil", lambda: (None, None))
+        monkeypatch.delenv("INSTALLER_BUILDER_HDIUTIL", raising=False)
+        chain = toolchain.Toolchain(fake=False, cache_file=str(tmp_path / "t.json"))
+        assert chain.resolve("hdiutil") is None
+        with pytest.raises(toolchain.ToolNotFoundError):
+            chain.command("hdiutil")
+
+
+def test_builder_does_not_change_shared_state():
+    from installer_builder import InstallerBuilder, runner
+
+    shared = toolchain.get_toolchain()
+    limit = runner.job_limit()
+    builder = InstallerBuilder(
+        main_module="app.py", name="App", version="1.0",
+        fake_tools=True, max_jobs=limit + 1,
+    )
+    assert toolchain.get_toolchain() is shared
+    assert runner.job_limit() == limit
+
+    with toolchain.using(builder.toolchain):
+        assert toolchain.get_toolchain() is builder.toolchain
+    assert toolchain.get_toolchain() is shared
+
+
+class TestFakeTools:
+    """Test that the fake toolchain leaves plausible outputs behind."""
+
+    def test_fake_iscc_and_hdiutil(self, tmp_path):
+        chain = toolchain.Toolchain(fake=True)
+        (tmp_path / "app.exe").write_bytes(b"MZ" * 1000)
+        issfile = tmp_path / "distutils.iss"
+        issfile.write_text(
+            "[Setup]\nOutputDir=%s\nOutputBaseFilename=App-1.0-setup\n"
+            '[Files]\nSource: "app.exe"; DestDir: "{app}"\n' % tmp_path
+        )
+        subprocess.check_call(chain.command("iscc") + [str(issfile)])
+        assert os.path.getsize(str(tmp_path / "App-1.0-setup.exe")) > 0
+
+        app = tmp_path / "App.app" / "Contents"
+        app.mkdir(parents=True)
+        (app / "Info.plist").write_text("plist")
+        subprocess.check_call(
+            chain.command("hdiutil")
+            + ["create", "-srcfolder", str(tmp_path / "App.app"), str(tmp_path / "App")]
+        )
+        with zipfile.ZipFile(str(tmp_path / "App.dmg")) as archive:
+            assert archive.namelist() == ["App.app/Contents/Info.plist"]
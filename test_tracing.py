@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Pytest tests for build phase tracing.
+"""
+import json
+import os
+import sys
+import threading
+
+import pytest
+
+from installer_builder import runner, tracing
+
+
+@pytest.fixture
+def tracer():
+    tracer = tracing.start_trace()
+    yield tracer
+    tracing.stop_trace()
+
+
+def test_span_is_a_no_op_without_a_trace():
+    tracing.stop_trace()
+    with tracing.span("ignored") as span:
+        assert span is None
+    assert tracing.get_tracer() is None
+
+
+class TestTracer:
+    """Test recording and exporting spans."""
+
+    def test_nested_spans_and_subprocesses(self, tracer):
+        @tracing.traced
+        def create_dmg():
+            runner.run([sys.executable, "-c", "pass"], echo=False, label="hdiutil")
+
+        with tracing.span("build"):
+            create_dmg()
+            create_dmg()
+
+        names = [(s.category, s.name, s.parent) for s in tracer.spans]
+        assert names == [
+            ("subprocess", "hdiutil", "create_dmg"),
+            ("phase", "create_dmg", "build"),
+            ("subprocess", "hdiutil", "create_dmg"),
+            ("phase", "create_dmg", "build"),
+            ("phase", "build", None),
+        ]
+        build = tracer.spans[-1]
+        assert all(s.start >= build.start for s in tracer.spans)
+
+        summary = tracer.summary()
+        assert summary["phases"]["create_dmg"]["count"] == 2
+        assert summary["phases"]["create_dmg"]["parent"] == "build"
+        hdiutil = summary["subprocesses"]["hdiutil"]
+        assert hdiutil["count"] == 2
+        if hasattr(os, "wait4"):
+            assert hdiutil["cpu_seconds"] > 0
+        assert "[hdiutil]" in tracing.format_summary(summary)
+
+    def test_spans_from_threads(self, tracer):
+        def work(name):
+            with tracing.span(name):
+                pass
+
+        with tracing.span("variants"):
+            threads = [
+                threading.Thread(target=work, args=("iscc",), name="worker-%d" % i)
+                for i in range(2)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        iscc = [s for s in tracer.spans if s.name == "iscc"]
+        assert sorted(s.thread for s in iscc) == ["worker-0", "worker-1"]
+        # Each thread has its own stack of open spans
+        assert [s.parent for s in iscc] == [None, None]
+
+    def test_write(self, tracer, tmp_path):
+        with tracing.span("sign", file="app.exe"):
+            pass
+        trace_file = tracer.write(str(tmp_path / "trace"))
+
+        with open(trace_file) as fp:
+            events = json.load(fp)["traceEvents"]
+        complete = [e for e in events if e["ph"] == "X"]
+        assert complete[0]["name"] == "sign"
+        assert complete[0]["args"] == {"file": "app.exe"}
+        assert complete[0]["dur"] >= 0
+        assert any(e["ph"] == "M" for e in events)
+        with open(str(tmp_path / "trace" / "trace-summary.json")) as fp:
+            assert json.load(fp)["phases"]["sign"]["count"] == 1
+
+    def test_stop_trace_unhooks_runner(self):
+        tracer = tracing.start_trace()
+        assert tracing.stop_trace() is tracer
+        runner.run([sys.executable, "-c", "pass"], echo=False)
+        assert tracer.spans == []
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Pytest tests for installer variants.
+"""
+import threading
+import time
+
+import pytest
+
+from installer_builder import InstallerBuilder, variants
+
+
+class FakeScript(object):
+    """Stands in for an InnoScript; records how many compiles overlap."""
+
+    lock = threading.Lock()
+    running = 0
+    peak = 0
+
+    def __init__(self, name, fail=False):
+        self.name = name
+        self.fail = fail
+
+    def compile_script(self):
+        with self.lock:
+            FakeScript.running += 1
+            FakeScript.peak = max(FakeScript.peak, FakeScript.running)
+        time.sleep(0.05)
+        with self.lock:
+            FakeScript.running -= 1
+        if self.fail:
+            raise EnvironmentError("compile failed")
+        return self.name + ".exe"
+
+
+class TestInstallerVariants:
+    """Test variant configuration and concurrent compiles."""
+
+    def test_builder_accepts_dicts(self):
+        builder = InstallerBuilder(
+            main_module="test.py",
+            name="TestApp",
+            version="1.0.0",
+            installer_variants=[
+                {"name": "de", "languages": ["German"]},
+                variants.InstallerVariant("pro", output_base_filename="TestApp-Pro"),
+            ],
+        )
+        de, pro = builder.installer_variants
+        assert de.languages == ["German"]
+        assert de.installer_filename("TestApp", "1.0.0") == "TestApp-1.0.0-de-setup.exe"
+        assert pro.installer_filename("TestApp", "1.0.0") == "TestApp-Pro.exe"
+
+    def test_pool_size(self):
+        gib = 1024 ** 3
+        assert variants.pool_size(8, cpu_count=4, memory=64 * gib) == 4
+        assert variants.pool_size(8, cpu_count=16, memory=3 * gib) == 3
+        assert variants.pool_size(2, cpu_count=16, memory=64 * gib) == 2
+        assert variants.pool_size(4, cpu_count=16, memory=gib // 2) == 1
+
+    def test_compile_variants_runs_concurrently(self):
+        FakeScript.peak = 0
+        scripts = [FakeScript(name) for name in ("a", "b", "c", "d")]
+        outputs = variants.compile_variants(scripts, max_workers=2)
+        assert outputs == ["a.exe", "b.exe", "c.exe", "d.exe"]
+        assert FakeScript.peak == 2
+
+    def test_compile_variants_raises_failure(self):
+        scripts = [FakeScript("a"), FakeScript("b", fail=True)]
+        with pytest.raises(EnvironmentError):
+            variants.compile_variants(scripts, max_workers=2)